@@ -8,5 +8,7 @@ __all__ = [
     "excel_utils",
     "excel_dashboard",
     'excel_pipeline',
+    'hostmap',
+    'fs_utils',
     'cli',
 ]
@@ -1,22 +1,28 @@
 # clean_switch/cli.py
+# PYTHON_ARGCOMPLETE_OK
 from __future__ import annotations
-import argparse, logging, os
-from .raw_outputs import save_raw_outputs
+import argparse, ipaddress, logging, os
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from .raw_outputs import save_raw_output, save_raw_outputs
 from .logging_config import setup_logging
+from .fs_utils import ensure_dir
 from .network_connector import collect, COMMANDS_DEFAULT
-from .excel_pipeline import create_excel, metrics_from_collected
-from history_json import save_snapshot
-from ideia6_features import ideia6_run_pipeline
+from history_json import save_snapshot, collected_digest, write_latest_hash, outputs_unchanged
 
-# NOVO: modo crawl
-from .topology_crawl import crawl_topology
+# Módulos pesados (openpyxl, crawl, ideia6) só são importados dentro do ramo que
+# os usa, para que --help / --raw-only / --no-excel arranquem rápido.
 
-def main():
+@lru_cache(maxsize=1)
+def _build_parser() -> argparse.ArgumentParser:
+    """Constrói o ArgumentParser (uma vez por processo)."""
     parser = argparse.ArgumentParser(description="Clean/refactored switch collector → Excel")
     parser.add_argument("--host", required=True, help="IP do switch semente")
     parser.add_argument("--user", required=True)
     parser.add_argument("--password", required=True)
     parser.add_argument("--port", type=int, default=22)
+    parser.add_argument("--keepalive", type=int, default=0,
+                        help="Keepalive SSH em segundos (0 = desligado); útil com listas longas de comandos")
     parser.add_argument("--no-excel", action="store_true", help="Don't generate Excel file")
     parser.add_argument("--commands", nargs="*", default=COMMANDS_DEFAULT)
     parser.add_argument("--out", default=None, help="Output directory (defaults to ./outputs/<hostname>)")
@@ -27,6 +33,10 @@ def main():
                     help="Diretório base para guardar os .txt (default: outputs).")
     parser.add_argument("--raw-ts-subdir", action="store_true",
                     help="Se definido, cria subpasta por timestamp (ts) para os .txt.")
+    parser.add_argument("--force", action="store_true",
+                    help="Regravar snapshot/Excel mesmo que o output do switch não tenha mudado.")
+    parser.add_argument("--snapshot-format", choices=("json", "msgpack"), default="json",
+                    help="Formato dos snapshots em _history: json (default) ou msgpack (msgpack+zstd, requer msgpack e zstandard)")
 
 
     # ---- FLAGS NOVAS PARA CRAWL ----
@@ -38,33 +48,53 @@ def main():
                         help="Não tentar resolver Device ID via DNS")
     parser.add_argument("--hostmap", default=None,
                         help="YAML com mapeamento DeviceID→IP para vizinhos (fallback)")
+    parser.add_argument("--crawl-workers", type=int, default=16,
+                        help="Nº de sessões SSH em paralelo durante o crawl (default: 16)")
+    parser.add_argument("--crawl-rate-pps", type=float, default=5.0,
+                        help="Máx. de logins SSH por segundo no crawl (default: 5; 0 = sem limite)")
+    return parser
 
+def main():
+    parser = _build_parser()
+    try:
+        import argcomplete  # type: ignore  (opcional: autocomplete na shell)
+    except ImportError:
+        pass
+    else:
+        argcomplete.autocomplete(parser)
     args = parser.parse_args()
 
+    # CIDRs validados/construídos uma vez (o crawl testa cada vizinho contra eles)
+    allowed_nets = None
+    if args.allowed_subnet:
+        try:
+            allowed_nets = [ipaddress.ip_network(c.strip(), strict=False) for c in args.allowed_subnet]
+        except ValueError as e:
+            parser.error(f"--allowed-subnet inválido: {e}")
+
     level = getattr(logging, (args.log or "INFO").upper(), logging.INFO)
     log = setup_logging(level)
 
     # --- MODO CRAWL ---
     if args.crawl_depth and args.crawl_depth > 0:
+        from .topology_crawl import crawl_topology
+
         # hostmap opcional (carregar apenas se indicado, para não obrigar a ter PyYAML instalado)
         hostmap = None
         if args.hostmap:
+            from .hostmap import load_hostmap
             try:
-                import yaml  # type: ignore
-            except Exception:
+                hostmap = load_hostmap(args.hostmap)
+            except ImportError:
                 log.error("Para usar --hostmap precisa de PyYAML (pip install pyyaml). A prosseguir sem hostmap.")
                 hostmap = None
-            else:
-                try:
-                    with open(args.hostmap, "r", encoding="utf-8") as f:
-                        hostmap = yaml.safe_load(f) or {}
-                except Exception as e:
-                    log.error("Falha a ler hostmap %s: %s", args.hostmap, e)
-                    hostmap = None
+            except Exception as e:
+                log.error("Falha a ler hostmap %s: %s", args.hostmap, e)
+                hostmap = None
 
         outdir_override = args.out  # opcional: força todos os Excels para o mesmo diretório
         if outdir_override:
-            os.makedirs(outdir_override, exist_ok=True)
+            ensure_dir(outdir_override)
 
         results = crawl_topology(
             seed_ip=args.host,
@@ -73,10 +103,14 @@ def main():
             enable=None,
             port=args.port,
             max_depth=args.crawl_depth,
-            allowed_subnets=args.allowed_subnet,
+            allowed_subnets=allowed_nets,
             dns_fallback=not args.no_dns_fallback,
             hostmap=hostmap,
             out_dir_override=outdir_override,
+            workers=args.crawl_workers,
+            rate_pps=args.crawl_rate_pps,
+            keepalive=args.keepalive,
+            snapshot_fmt=args.snapshot_format,
         )
         if results:
             print("OK (crawl):")
@@ -87,23 +121,68 @@ def main():
         return
 
     # --- FLUXO “SIMPLES” (apenas o semente, como antes) ---
-    host, ts, collected, outdir = collect(args.host, args.user, args.password, port=args.port, commands=args.commands)
+    # RAW outputs (.txt) gravados à medida que cada comando chega: 1 thread de disco,
+    # o thread principal continua na sessão SSH.
+    raw_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="raw-writer")
+    raw_jobs = []
+
+    def _on_command(hostname, ts, cmd, out):
+        raw_jobs.append(raw_pool.submit(
+            save_raw_output, hostname, cmd, out,
+            base_dir=args.raw_dir, make_timestamp_subdir=args.raw_ts_subdir, ts=ts,
+        ))
+
+    try:
+        host, ts, collected, outdir = collect(args.host, args.user, args.password, port=args.port,
+                                              commands=args.commands, on_command=_on_command,
+                                              keepalive=args.keepalive)
+    finally:
+        raw_pool.shutdown(wait=True)
+
+    out_txt_dir = None
+    try:
+        for job in raw_jobs:
+            out_txt_dir = job.result()
+    except Exception as e:
+        log.error("Falha a gravar .txt em streaming: %s — a regravar no fim.", e)
+        out_txt_dir = None
+
+    # --- RAW outputs (.txt): fallback se o streaming não gravou nada
+    if out_txt_dir is None:
+        out_txt_dir = save_raw_outputs(
+            hostname=host,
+            collected=collected,
+            base_dir=args.raw_dir,
+            make_timestamp_subdir=args.raw_ts_subdir,
+            ts=ts,
+        )
+
     if args.out:
         outdir = args.out
-    os.makedirs(outdir, exist_ok=True)
+    ensure_dir(outdir)
     xlsx_path = os.path.join(outdir, f"{host}_levantamento.xlsx")
 
-    metrics = metrics_from_collected(collected)
-    save_snapshot(base_dir=outdir, hostname=host, ts=ts, collected=collected, meta={"host_ip": args.host, "metrics": metrics}, max_keep=10)
+    # Nada mudou (hash do texto bruto)? Não regravar snapshot nem Excel. O snapshot e o xlsx
+    # têm digests separados: o xlsx só conta como atual se foi gerado a partir destes dados.
+    digest = collected_digest(collected)
+    want_excel = not (args.raw_only or args.no_excel)
+    snapshot_unchanged, excel_unchanged = outputs_unchanged(outdir, host, xlsx_path, digest, force=args.force)
+    if snapshot_unchanged and (not want_excel or excel_unchanged):
+        print("OK (unchanged):", xlsx_path if want_excel else outdir)
+        return
 
-    # --- RAW outputs (.txt)
-    out_txt_dir = save_raw_outputs(
-        hostname=host,
-        collected=collected,
-        base_dir=args.raw_dir,
-        make_timestamp_subdir=args.raw_ts_subdir,
-        ts=ts,
-    )
+    from .excel_pipeline import metrics_from_collected
+    metrics = metrics_from_collected(collected)
+    if not collected or metrics.get("commands_ok", 0) == 0:
+        # Tudo falhou (p.ex. só '% Invalid input'): os .txt ficam para diagnóstico,
+        # mas não se grava snapshot (estragaria a comparação seguinte) nem Excel.
+        log.warning("Nenhum comando devolveu output útil em %s — sem snapshot/Excel. Ver .txt em %s", host, out_txt_dir)
+        print(f"OK (sem dados): .txt em {out_txt_dir}")
+        return
+    if not snapshot_unchanged:
+        save_snapshot(base_dir=outdir, hostname=host, ts=ts, collected=collected, meta={"host_ip": args.host, "metrics": metrics}, max_keep=10,
+                      fmt=args.snapshot_format)
+        write_latest_hash(outdir, host, digest)
 
     # Se pedir apenas RAW, termina já aqui (não gera Excel)
     if args.raw_only:
@@ -113,28 +192,8 @@ def main():
     
 
     if not args.no_excel:
-        
-        create_excel(host, ts, collected, xlsx_path)
-        try:
-            ideia6_run_pipeline(host, ts, collected, xlsx_path, host_ip=args.host)
-        except Exception as e:
-            log.error("Ideia6 pipeline failed: %s", e)
-        # --- limpeza: manter só a Execução mais recente ---
-        from clean_switch.excel_utils import _list_execucao_sheets
-        from openpyxl import load_workbook
-
-        try:
-            wb = load_workbook(xlsx_path)
-            execs = _list_execucao_sheets(wb)
-            if execs:
-                execs_sorted = sorted(execs, key=lambda t: (t[3] is None, t[3], t[2]))
-                newest = execs_sorted[-1][0]
-                for ws, _name, _idx, _dt in execs:
-                    if ws is not newest:
-                        wb.remove(ws)
-                wb.save(xlsx_path)
-        except Exception as e:
-            log.error("Falhou limpeza de sheets Execução: %s", e)
+        from .excel_pipeline import build_excel
+        build_excel(host, ts, collected, xlsx_path, digest, host_ip=args.host)
 
     print("OK:", xlsx_path if not args.no_excel else f"snapshots in {outdir}")
 
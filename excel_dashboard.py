@@ -1,19 +1,79 @@
 # ADD/CONFIRMAR estes:
 from typing import Dict, List, Tuple, Optional
+from collections import Counter
+from dataclasses import dataclass
 
 from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Side, Border   # <- inclui Border
+from openpyxl.styles import Font, Alignment, Side, Border, NamedStyle   # <- inclui Border
+from openpyxl.styles.fonts import DEFAULT_FONT
 from openpyxl.chart import BarChart, PieChart, Reference
 from openpyxl.utils import coordinate_to_tuple, get_column_letter
 from openpyxl.worksheet.worksheet import Worksheet
 import re
 
-
-
-def _find_sheet_by_contains(wb, needle: str):
+from .excel_utils import is_logical_port
+
+# heurística de _get_table_from_sheet: células típicas de cabeçalho / de linhas de metadados
+_HEADER_TOKENS = frozenset({
+    "port", "status", "vlan", "vlan id", "name", "descr", "device id", "platform",
+    "local interface", "port id", "uptime", "version", "pid", "speed", "duplex", "type"
+})
+_METADATA = frozenset({"comando:", "hostname:", "timestamp:", "host:", "ip:"})
+
+# layout do Dashboard (linhas/colunas numéricas: A=1, B=2, ...)
+_ROW_TITLE     = 1
+_COL_KPI_LABEL = 1    # A: rótulos dos KPIs e das mini-tabelas
+_COL_KPI_VAL   = 2    # B: valores
+_ROW_TABLES    = 3    # linha de cabeçalho das tabelas Port-Channel / VLANs
+_COL_PC        = 4    # D–E: Port-Channels (ao lado dos KPIs)
+_COL_VLAN      = 6    # F–H: VLANs
+_ROW_STATES    = 11   # "Distribuição de Estados" (dados do Pie nas 2 linhas seguintes)
+_ROW_PER_VLAN  = 16   # "Portas por VLAN"
+_ROW_CDP       = 22   # "Plataformas CDP"
+
+# regex pré-compiladas (evita o lookup na cache do módulo re a cada chamada)
+_PO_RE          = re.compile(r'(?i)\bpo(?:rt-?channel)?\s*([0-9]+)\b')
+_VER_RE         = re.compile(r"Version\s+([\w.\(\)-]+)", re.IGNORECASE)
+_UP_RE          = re.compile(r"uptime\s+is\s+([^\n]+)", re.IGNORECASE)
+# o 'show version' traz Version/uptime nas primeiras linhas; só se varre o resto se faltar algum
+_VERSION_SCAN_ROWS = 50
+_NON_DIGITS_RE  = re.compile(r"\D+")
+_NOT_0_9_RE     = re.compile(r'[^0-9]')
+_SPLIT_RE       = re.compile(r"[,\s]+")
+_FLAG_PAREN_RE  = re.compile(r"\(.*?\)$")
+_QUOTED_TOKEN_RE = re.compile(r"['\"]([^'\"]+)['\"]")
+_MULTISPACE_RE  = re.compile(r"[ ]{2,}")
+# normalização do texto cru numa só passagem (C): CR -> LF, TAB -> espaço e
+# remoção dos restantes caracteres de controlo ASCII (exceto LF)
+_NORM_TABLE = {c: None for c in (*range(0x00, 0x20), 0x7F) if c not in (0x0A, 0x0D, 0x09)}
+_NORM_TABLE.update({0x0D: "\n", 0x09: " "})
+_ETH_HDR_RE     = re.compile(r"\bGroup\b.*\bPort-?Channel\b.*\bProtocol\b", re.IGNORECASE)
+# As regex de linha abaixo correm com finditer sobre o texto inteiro (MULTILINE);
+# '[^\S\n]' é "espaço em branco exceto LF", para nenhuma correspondência atravessar linhas.
+# Linha de dados típica: "<grp> PoX(<flags>) <protocol> <ports...>"
+_DATA_LINE_RE   = re.compile(
+    r"^[^\S\n]*(?P<group>\d+)[^\S\n]+(?P<po>[A-Za-z]+[0-9]+)\((?P<flags>[^)\n]+)\)[^\S\n]+(?P<protocol>\S+)[^\S\n]*(?P<ports>.*)$",
+    re.MULTILINE
+)
+_GROUP_LEAD_RE  = re.compile(r"^\s*\d+\s+")
+# 'show spanning-tree': cabeçalho de VLAN ("VLAN0001" ou "VLAN 1") ou linha de porta
+# (Gi1/0/1   Desg FWD 19 128.1 P2p); o cabeçalho tem prioridade, como linha a linha
+_STP_LINE_RE    = re.compile(
+    r"^(?:[^\S\n]*VLAN[^\S\n]*0*(?P<vlan>\d+)\b"
+    r"|[^\S\n]*(?P<intf>\S+)[^\S\n]+(?P<role>\w+)[^\S\n]+(?P<state>\w+)[^\S\n]+(?P<cost>\d+)[^\S\n]+"
+    r"(?P<portid>[\d\.]+)[^\S\n]+(?P<ptype>.+?)[^\S\n]*$)",
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+def _sheet_titles(wb):
+    """[(título em minúsculas, ws)] por ordem das folhas — para várias procuras seguidas."""
+    return [(ws.title.lower(), ws) for ws in wb.worksheets]
+
+def _find_sheet_by_contains(wb, needle: str, titles=None):
     needle = needle.lower()
-    for ws in wb.worksheets:
-        if needle in ws.title.lower():
+    for title, ws in (titles if titles is not None else _sheet_titles(wb)):
+        if needle in title:
             return ws
     return None
 
@@ -30,10 +90,11 @@ def _get_table_from_sheet(ws):
     if tbl:
         from openpyxl.utils.cell import range_boundaries
         min_col, min_row, max_col, max_row = range_boundaries(tbl.ref)
-        headers = [str(ws.cell(min_row, c).value or "").strip() for c in range(min_col, max_col + 1)]
+        it = ws.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col, values_only=True)
+        headers = [str(v or "").strip() for v in next(it, ())]
         rows = []
-        for r in range(min_row + 1, max_row + 1):
-            row = [ws.cell(r, c).value for c in range(min_col, max_col + 1)]
+        for vals in it:
+            row = list(vals)
             # descarta linhas totalmente vazias dentro do ref da Tabela
             if all(v is None or (isinstance(v, str) and not v.strip()) for v in row):
                 continue
@@ -41,32 +102,27 @@ def _get_table_from_sheet(ws):
         return headers, rows
 
     # 2) Fallback: heurística (ignorar metadados e procurar cabeçalho "real")
-    header_row_idx = None
-    header_tokens = {
-        "port", "status", "vlan", "vlan id", "name", "descr", "device id", "platform",
-        "local interface", "port id", "uptime", "version", "pid", "speed", "duplex", "type"
-    }
-    metadata = {"comando:", "hostname:", "timestamp:", "host:", "ip:"}
-
-    for i in range(1, ws.max_row + 1):
-        row_vals = [ws.cell(i, c).value for c in range(1, ws.max_column + 1)]
+
+    # um único iterador (gerador, uma passagem): procura o cabeçalho, pára nele
+    # e continua daí para as linhas de dados
+    it = ws.iter_rows(values_only=True)
+    for row_vals in it:
         lrow = [str(v).strip().lower() if v is not None else "" for v in row_vals]
-        if not any(lrow):
+        filled = len(lrow) - lrow.count("")
+        if not filled:
             continue
-        if (lrow[0] in metadata) and sum(1 for v in lrow if v) <= 2:
+        if (lrow[0] in _METADATA) and filled <= 2:
             # linha de metadados típica, ignora
             continue
-        if (sum(1 for v in lrow if v) >= 2) and any(tok in lrow for tok in header_tokens):
-            header_row_idx = i
+        if filled >= 2 and not _HEADER_TOKENS.isdisjoint(lrow):
             break
-
-    if header_row_idx is None:
+    else:
         return [], []
 
-    headers = [str(ws.cell(header_row_idx, c).value or "").strip() for c in range(1, ws.max_column + 1)]
+    headers = [str(v or "").strip() for v in row_vals]
     rows = []
-    for r in range(header_row_idx + 1, ws.max_row + 1):
-        row = [ws.cell(r, c).value for c in range(1, ws.max_column + 1)]
+    for vals in it:
+        row = list(vals)
         # termina à primeira linha totalmente vazia após a tabela
         if all(v is None or (isinstance(v, str) and not v.strip()) for v in row):
             break
@@ -74,92 +130,123 @@ def _get_table_from_sheet(ws):
     return headers, rows
 
 
+def _get_columns_from_sheet(ws, table=None):
+    """
+    Igual a _get_table_from_sheet, mas orientado a colunas: devolve (headers, columns)
+    com columns[i] = lista de valores da coluna headers[i] (todas com o mesmo comprimento).
+    'table' = (headers, rows) já lidos de ws, para não voltar a percorrer a folha.
+    """
+    headers, rows = table if table is not None else _get_table_from_sheet(ws)
+    columns = [list(col) for col in zip(*rows)] if rows else [[] for _ in headers]
+    return headers, columns
+
+
+@dataclass(frozen=True)
+class _HeaderIndex:
+    """Cabeçalhos de uma folha já normalizados, para várias procuras com _index_of_header."""
+    exact: Dict[str, int]   # h.strip().lower() -> índice
+    lowers: List[str]       # h.lower() por coluna (procura soft por contém)
+
+
+def _header_index(headers) -> _HeaderIndex:
+    return _HeaderIndex({h.strip().lower(): i for i, h in enumerate(headers)}, [h.lower() for h in headers])
+
+
 def _index_of_header(headers, *candidates):
-    hmap = {h.strip().lower(): i for i, h in enumerate(headers)}
-    for cand in candidates:
-        idx = hmap.get(cand.lower())
+    """'headers' = lista de cabeçalhos ou _HeaderIndex já construído (uma vez por folha)."""
+    hx = headers if isinstance(headers, _HeaderIndex) else _header_index(headers)
+    cands = [cand.lower() for cand in candidates]
+    for cand in cands:
+        idx = hx.exact.get(cand)
         if idx is not None:
             return idx
     # tentativa soft por contém
-    for i, h in enumerate(headers):
-        hl = h.lower()
-        if any(cand.lower() in hl for cand in candidates):
+    for i, hl in enumerate(hx.lowers):
+        if any(cand in hl for cand in cands):
             return i
     return None
 
-def _parse_interfaces_status(ws_interfaces):
+def _parse_interfaces_status(ws_interfaces, table=None):
     """
     A partir da folha 'show interfaces status' (ou equivalente),
     conta total / up / down e agrega por VLAN (quando existir coluna VLAN).
+    'table' = (headers, rows) já lidos da folha (opcional).
     """
     total = up = down = 0
-    per_vlan = {}  # vlan_id -> count of ports (qualquer estado)
+    per_vlan = Counter()  # vlan_id -> count of ports (qualquer estado)
 
-    headers, rows = _get_table_from_sheet(ws_interfaces)
+    headers, columns = _get_columns_from_sheet(ws_interfaces, table)
     if not headers:
         return dict(total=0, up=0, down=0, per_vlan={})
 
-    idx_status = _index_of_header(headers, "status")
-    idx_vlan   = _index_of_header(headers, "vlan")
-    idx_port   = _index_of_header(headers, "port")  # índice da coluna com o nome da interface
-
-
-    for row in rows:
+    hx = _header_index(headers)
+    idx_status = _index_of_header(hx, "status")
+    idx_vlan   = _index_of_header(hx, "vlan")
+    idx_port   = _index_of_header(hx, "port")  # índice da coluna com o nome da interface
+
+    # só as 3 colunas necessárias; uma coluna em falta comporta-se como valores vazios
+    # (porta vazia conta como física, estado vazio conta como down, VLAN vazia não agrega)
+    missing = [None] * len(columns[0])
+    port_col   = columns[idx_port] if idx_port is not None else missing
+    status_col = columns[idx_status] if idx_status is not None else missing
+    vlan_col   = columns[idx_vlan] if idx_vlan is not None else missing
+    up_states = frozenset(("connected", "up"))
+    skip_vlans = (None, "", "trunk")
+
+    for port, status, vlan in zip(port_col, status_col, vlan_col):
         # --- NÃO contar interfaces lógicas (Port-channel/Po, VLAN, Loopback, Tunnel, NVE, Virtual) ---
-        if idx_port is not None and idx_port < len(row):
-            ifname = (str(row[idx_port]).strip().lower() if row[idx_port] is not None else "")
-            if ifname.startswith(("po", "port-channel", "vlan", "lo", "loopback", "tunnel", "nve", "virtual")):
-                continue  # salta as lógicas: não entram no 'total', 'up' ou 'down'
+        if port is not None and is_logical_port(str(port).strip().lower()):
+            continue  # salta as lógicas: não entram no 'total', 'up' ou 'down'
 
         total += 1
-        status_val = str(row[idx_status]).strip().lower() if idx_status is not None and idx_status < len(row) else ""
-        if status_val in ("connected", "up"):
+        if status is not None and str(status).strip().lower() in up_states:
             up += 1
         else:
             # Cisco muitas vezes usa "notconnect", "err-disabled", "down", etc.
             down += 1
 
-        if idx_vlan is not None and idx_vlan < len(row) and row[idx_vlan] not in (None, "", "trunk"):
-            vlan_id = str(row[idx_vlan]).strip()
-            per_vlan[vlan_id] = per_vlan.get(vlan_id, 0) + 1
+        if vlan not in skip_vlans:
+            vlan_id = str(vlan).strip()
+            per_vlan[vlan_id] += 1
 
-    return dict(total=total, up=up, down=down, per_vlan=per_vlan)
+    return dict(total=total, up=up, down=down, per_vlan=dict(per_vlan))
 
 def _is_logical_iface(ifname: str) -> bool:
     """True se 'ifname' for interface lógica (Port-channel/Po, VLAN, Loopback, Tunnel, NVE, Virtual)."""
     if not ifname:
         return False
-    n = str(ifname).strip().lower()
-    return n.startswith(("po", "port-channel", "vlan", "lo", "loopback", "tunnel", "nve", "virtual"))
+    return is_logical_port(str(ifname).strip().lower())
 
 def _standardize_pc_name(ifname: str) -> str:
     """Normaliza 'Po1' / 'Port-channel1' / 'Port Channel 1' -> 'Port-channel1'."""
-    import re
     s = str(ifname).strip()
-    m = re.search(r'(?i)\bpo(?:rt-?channel)?\s*([0-9]+)\b', s)
+    m = _PO_RE.search(s)
     return f"Port-channel{m.group(1)}" if m else s
 
-def parser_portchannels_from_interfaces_sheet(ws):
+def parser_portchannels_from_interfaces_sheet(ws, table=None):
     """
     Lê a folha 'show interfaces status' e devolve:
       { 'Port-channel1': {'members': ['Gi1/0/1','Gi1/0/2']}, ... }
     Heurística:
       1) deteta Port-channels pela coluna 'Port';
       2) associa membros físicos pela coluna 'Name/Description' quando menciona 'PoX'/'Port-channelX'.
+    'table' = (headers, rows) já lidos da folha (opcional).
     """
-    import re
-    headers, rows = _get_table_from_sheet(ws)
+    headers, rows = table if table is not None else _get_table_from_sheet(ws)
     if not headers or not rows:
         return {}
 
     # índices tolerantes
+    hx = _header_index(headers)
+
     def _idx_of(*cands):
-        return _index_of_header(headers, *cands)
+        return _index_of_header(hx, *cands)
 
     idx_port = _idx_of("port")
     idx_name = _idx_of("name", "descr", "description")
 
     pcs = {}
+    seen = {}  # pc -> set(membros): dedup O(1); a lista em pcs mantém a ordem
 
     # (1) detetar Port-channels pela própria coluna 'Port'
     if idx_port is not None:
@@ -179,12 +266,14 @@ def parser_portchannels_from_interfaces_sheet(ws):
             name_desc = str(r[idx_name]).strip() if idx_name < len(r) and r[idx_name] is not None else ""
             if not name_desc:
                 continue
-            m = re.search(r'(?i)\bpo(?:rt-?channel)?\s*([0-9]+)\b', name_desc)
+            m = _PO_RE.search(name_desc)
             if m:
                 pc = f"Port-channel{m.group(1)}"
-                pcs.setdefault(pc, {"members": []})
-                if phys not in pcs[pc]["members"]:
-                    pcs[pc]["members"].append(phys)
+                members = pcs.setdefault(pc, {"members": []})["members"]
+                pc_seen = seen.setdefault(pc, set())
+                if phys not in pc_seen:
+                    pc_seen.add(phys)
+                    members.append(phys)
     return pcs
 
 def _parse_vlans(ws_vlans):
@@ -197,17 +286,25 @@ def _parse_vlans(ws_vlans):
     if not headers:
         return out
 
-    idx_vlan  = _index_of_header(headers, "vlan", "vlan id")
-    idx_name  = _index_of_header(headers, "name")
-    idx_state = _index_of_header(headers, "status", "state")
+    hx = _header_index(headers)
+    idx_vlan  = _index_of_header(hx, "vlan", "vlan id")
+    idx_name  = _index_of_header(hx, "name")
+    idx_state = _index_of_header(hx, "status", "state")
+
+    # sem coluna de VLAN nenhuma linha é válida
+    if idx_vlan is None:
+        return out
+    name_i  = -1 if idx_name is None else idx_name
+    state_i = -1 if idx_state is None else idx_state
 
     for row in rows:
-        vlan_id = str(row[idx_vlan]).strip() if idx_vlan is not None and idx_vlan < len(row) else ""
+        n = len(row)
+        vlan_id = str(row[idx_vlan]).strip() if idx_vlan < n else ""
         if not vlan_id.isdigit():
             # ignora headings intermédios ou linhas lixo
             continue
-        name = str(row[idx_name]).strip() if idx_name is not None and idx_name < len(row) and row[idx_name] else ""
-        state = str(row[idx_state]).strip().lower() if idx_state is not None and idx_state < len(row) and row[idx_state] else ""
+        name = str(row[name_i]).strip() if -1 < name_i < n and row[name_i] else ""
+        state = str(row[state_i]).strip().lower() if -1 < state_i < n and row[state_i] else ""
         out.append((vlan_id, name, state))
     return out
 
@@ -234,29 +331,33 @@ def _parse_show_version(ws_version):
     if tbl:
         from openpyxl.utils.cell import range_boundaries
         min_col, min_row, max_col, max_row = range_boundaries(tbl.ref)
-        headers = [str(ws_version.cell(min_row, c).value or "").strip().lower()
-                   for c in range(min_col, max_col + 1)]
+        it = ws_version.iter_rows(min_row=min_row, max_row=min_row + 1, min_col=min_col, max_col=max_col, values_only=True)
+        headers = [str(v or "").strip().lower() for v in next(it)]
         hmap = {h: i for i, h in enumerate(headers)}
-        row1 = [ws_version.cell(min_row + 1, c).value for c in range(min_col, max_col + 1)]
+        row1 = list(next(it))
         ver = (str(row1[hmap["version"]]).strip() if "version" in hmap and row1[hmap["version"]] is not None else "")
         up  = (str(row1[hmap["uptime"]]).strip()  if "uptime"  in hmap and row1[hmap["uptime"]]  is not None else "")
         if ver or up:
             return (ver or "Desconhecida", up or "Desconhecido")
 
-    # 3) Fallback: regex em todas as células (não apenas coluna A)
-    text_lines = []
-    for r in range(1, ws_version.max_row + 1):
-        for c in range(1, ws_version.max_column + 1):
-            val = ws_version.cell(r, c).value
-            if val is None:
-                continue
-            text_lines.append(str(val))
-    whole = "\n".join(text_lines)
+    # 3) Fallback: regex em todas as células (não apenas coluna A), primeiro nas
+    #    _VERSION_SCAN_ROWS linhas iniciais; a folha inteira só se faltar algum dos dois
+    def _sheet_text(max_row):
+        text_lines = []
+        for vals in ws_version.iter_rows(max_row=max_row, values_only=True):
+            text_lines.extend(str(val) for val in vals if val is not None)
+        return "\n".join(text_lines)
+
+    total_rows = ws_version.max_row
+    head = _sheet_text(min(_VERSION_SCAN_ROWS, total_rows))
+    m = _VER_RE.search(head)
+    mu = _UP_RE.search(head)
+    if (m is None or mu is None) and total_rows > _VERSION_SCAN_ROWS:
+        whole = _sheet_text(total_rows)
+        m = m or _VER_RE.search(whole)
+        mu = mu or _UP_RE.search(whole)
 
-    m = re.search(r"Version\s+([\w.\(\)-]+)", whole, re.IGNORECASE)
     ios_version = m.group(1) if m else "Desconhecida"
-
-    mu = re.search(r"uptime\s+is\s+([^\n]+)", whole, re.IGNORECASE)
     uptime = mu.group(1).strip() if mu else "Desconhecido"
 
     return ios_version, uptime
@@ -271,7 +372,6 @@ def parser_portchannels_from_etherchannel_sheet(ws):
       - Port-Channel: 'port-channel', 'port_channel', 'portchannel', 'po', 'bundle', ou 'group/channel_group' (número)
       - Membros:      'member_interface', 'members', 'ports', 'interfaces', 'port_list'
     """
-    import re, ast
     headers, rows = _get_table_from_sheet(ws)
     if not headers or not rows:
         return {}
@@ -288,7 +388,7 @@ def parser_portchannels_from_etherchannel_sheet(ws):
         if raw:
             return _standardize_pc_name(str(raw))
         if grp:
-            g = re.sub(r"\D+", "", str(grp))
+            g = _NON_DIGITS_RE.sub("", str(grp))
             return f"Port-channel{g}" if g else str(grp)
         return "Port-channel?"
 
@@ -303,37 +403,41 @@ def parser_portchannels_from_etherchannel_sheet(ws):
             return []
         s = str(val).strip()
         out = []
-        # tentar lista Python
-        try:
-            parsed = ast.literal_eval(s)
-            if isinstance(parsed, (list, tuple)):
-                cand = [str(x) for x in parsed]
-            else:
-                cand = re.split(r"[,\s]+", s)
-        except Exception:
-            cand = re.split(r"[,\s]+", s)
+        # lista Python (repr de list[str]): extrai os itens entre aspas
+        if s.startswith("[") and s.endswith("]"):
+            cand = _QUOTED_TOKEN_RE.findall(s)
+        else:
+            cand = _SPLIT_RE.split(s)
 
         for t in cand:
             t = t.strip().strip(",;")
             if not t:
                 continue
-            t = re.sub(r"\(.*?\)$", "", t)   # remove (P), (I), (w), ...
+            t = _FLAG_PAREN_RE.sub("", t)   # remove (P), (I), (w), ...
             if not _is_logical_iface(t):     # garantir que não é Po*/Vlan/Loopback
                 out.append(t)
         return out
 
+    pc_i  = -1 if idx_pc is None else idx_pc
+    grp_i = -1 if idx_grp is None else idx_grp
+    mem_i = -1 if idx_mem is None else idx_mem
+
     pcs = {}
+    seen = {}  # pc -> set(membros): dedup O(1); a lista em pcs mantém a ordem
     for r in rows:
+        n = len(r)
         pc_name = _std_pc_name(
-            r[idx_pc] if (idx_pc is not None and idx_pc < len(r)) else "",
-            r[idx_grp] if (idx_grp is not None and idx_grp < len(r)) else ""
+            r[pc_i] if -1 < pc_i < n else "",
+            r[grp_i] if -1 < grp_i < n else ""
         )
-        members = _split_members(r[idx_mem] if (idx_mem is not None and idx_mem < len(r)) else "")
+        members = _split_members(r[mem_i] if -1 < mem_i < n else "")
         if not pc_name:
             continue
         entry = pcs.setdefault(pc_name, {"members": []})
+        pc_seen = seen.setdefault(pc_name, set())
         for m in members:
-            if m and m not in entry["members"]:
+            if m and m not in pc_seen:
+                pc_seen.add(m)
                 entry["members"].append(m)
     return pcs
 
@@ -351,73 +455,49 @@ def parse_etherchannel_summary_from_text(raw_text: str) -> Tuple[List[str], List
     if not raw_text:
         return ([], [])
 
-    import re
-    s = raw_text.replace("\r\n", "\n").replace("\r", "\n").replace("\t", " ")
-    # remover caracteres não imprimíveis (menos \n)
-    s = "".join(ch for ch in s if (ch == "\n") or ch.isprintable())
+    s = raw_text.replace("\r\n", "\n").translate(_NORM_TABLE)
+    # remover caracteres não imprimíveis (menos \n): em ASCII a tabela acima já o fez;
+    # fora de ASCII, o filtro por carácter só corre se houver mesmo algum (teste em C primeiro)
+    if not s.isascii() and not s.replace("\n", "").isprintable():
+        s = "".join(ch for ch in s if (ch == "\n") or ch.isprintable())
     # colapsar espaços múltiplos
-    s = re.sub(r"[ ]{2,}", " ", s)
-
-    lines = s.split("\n")
-
-    # Encontrar início da tabela (linha com Group/Port-Channel/Protocol)
-    header_idx = None
-    header_re = re.compile(r"\bGroup\b.*\bPort-?Channel\b.*\bProtocol\b", re.IGNORECASE)
-    for i, ln in enumerate(lines):
-        if header_re.search(ln):
-            header_idx = i
-            break
-    start = (header_idx + 1) if header_idx is not None else 0
-
-    # Linha de dados típica: "<grp> PoX(<flags>) <protocol> <ports...>"
-    data_line_re = re.compile(
-        r"^\s*(?P<group>\d+)\s+(?P<po>[A-Za-z]+[0-9]+)\((?P<flags>[^)]+)\)\s+(?P<protocol>\S+)\s*(?P<ports>.*)$"
-    )
-
-    entries = []
-    cur = None
-    for ln in lines[start:]:
-        if not ln.strip():
-            continue
-        m = data_line_re.match(ln)
-        if m:
-            if cur:
-                entries.append(cur)
-            cur = {
-                "group": m.group("group"),
-                "port_channel": m.group("po").strip(),
-                "flags": m.group("flags").strip(),
-                "protocol": m.group("protocol").strip(),
-                "member_ports": (m.group("ports") or "").strip(),
-            }
-        else:
+    s = _MULTISPACE_RE.sub(" ", s)
+
+    # Encontrar início da tabela (linha a seguir à de Group/Port-Channel/Protocol)
+    start = 0
+    mh = _ETH_HDR_RE.search(s)
+    if mh:
+        nl = s.find("\n", mh.end())
+        start = nl + 1 if nl != -1 else len(s)
+
+    # Um varrimento (finditer) encontra todas as linhas de dados; só o texto entre
+    # duas delas é partido em linhas, à procura de continuações das portas.
+    # Cada entrada é finalizada (portas, status) e emitida logo em 'rows'.
+    rows = []
+    matches = list(_DATA_LINE_RE.finditer(s, start))
+    for i, m in enumerate(matches):
+        ports = [(m.group("ports") or "").strip()]
+        tail = s[m.end():matches[i + 1].start() if i + 1 < len(matches) else len(s)]
+        if tail.strip():
             # Continuação das portas (linhas que não começam por dígito)
-            if cur and not re.match(r"^\s*\d+\s+", ln):
+            for ln in tail.split("\n"):
                 extra = ln.strip()
-                if extra:
-                    cur["member_ports"] = (cur["member_ports"] + " " + extra).strip()
-
-    if cur:
-        entries.append(cur)
+                if extra and not _GROUP_LEAD_RE.match(ln):
+                    ports.append(extra)
 
-    # Normalização final de member_ports e derivação de status
-    rows = []
-    for e in entries:
-        ports = e["member_ports"]
         # separar por vírgulas ou espaços, limpar vazios e voltar a juntar com ", "
-        toks = re.split(r"[,\s]+", ports) if ports else []
-        toks = [t for t in toks if t]
-        member_ports = ", ".join(toks)
+        member_ports = ", ".join(t for p in ports if p for t in _SPLIT_RE.split(p) if t)
 
-        flags = (e["flags"] or "").upper()
+        flags_raw = m.group("flags").strip()
+        flags = flags_raw.upper()
         status = "Up" if "U" in flags else ("Down" if "D" in flags else "Unknown")
 
         rows.append([
-            int(e["group"]),
-            e["port_channel"],
-            e["protocol"],
+            int(m.group("group")),
+            m.group("po").strip(),
+            m.group("protocol").strip(),
             status,
-            e["flags"],
+            flags_raw,
             member_ports
         ])
 
@@ -431,8 +511,6 @@ def parser_show_spanning_tree_from_text(raw_text: str) -> Tuple[List[str], List[
     Funciona com o formato típico IOS:
       VLAN0001 / VLAN 1 ... + tabela de portas "Interface  Role Sts Cost  Prio.Nbr Type"
     """
-    import re
-
     if not raw_text:
         return ([], [])
 
@@ -443,53 +521,112 @@ def parser_show_spanning_tree_from_text(raw_text: str) -> Tuple[List[str], List[
     # Encontrar blocos por VLAN/instância
     # ex.: "VLAN0001" ou "VLAN 1"
     vlan = None
-    vlan_hdr = re.compile(r"^\s*VLAN\s*0*(\d+)\b", re.IGNORECASE)
-
-    # Linha de porta típica:
-    # Gi1/0/1   Desg FWD 19 128.1 P2p
-    port_re = re.compile(
-        r'^(?P<intf>\S+)\s+(?P<role>\w+)\s+(?P<state>\w+)\s+(?P<cost>\d+)\s+(?P<portid>[\d\.]+)\s+(?P<ptype>.+?)\s*$',
-        re.IGNORECASE
-    )
-
-    for line in t.split("\n"):
-        m_vlan = vlan_hdr.search(line)
-        if m_vlan:
-            vlan = m_vlan.group(1)
+
+    for m in _STP_LINE_RE.finditer(t):
+        if m.group("vlan") is not None:
+            vlan = m.group("vlan")
             continue
 
-        m_port = port_re.match(line.strip())
-        if m_port and vlan:
+        if vlan:
             rows.append([
                 vlan,
-                m_port.group("intf"),
-                m_port.group("role").lower(),
-                m_port.group("state").lower(),
-                m_port.group("cost"),
-                m_port.group("portid"),
-                m_port.group("ptype"),
+                m.group("intf"),
+                m.group("role").lower(),
+                m.group("state").lower(),
+                m.group("cost"),
+                m.group("portid"),
+                m.group("ptype"),
             ])
 
     return (headers, rows if rows else [])
 
 
 
+def _parse_cdp_platforms(ws_cdp):
+    """
+    KPIs de CDP / Neighbors: devolve (nº de vizinhos, top 5 plataformas [(plataforma, n)]).
+    """
+    neighbors_count = 0
+    top_platforms = []
+    cdp_headers, cdp_rows = _get_table_from_sheet(ws_cdp)
+    if cdp_headers:
+        neighbors_count = len(cdp_rows)
+
+        # índice de colunas de forma tolerante a variações
+        def _idx_any(headers, *cands):
+            for i, h in enumerate(headers):
+                if h is None:
+                    continue
+                hl = str(h).strip().lower()
+                if any(c in hl for c in cands):
+                    return i
+            return None
+
+        idx_platform = _idx_any(cdp_headers, "platform")
+
+        plats = Counter()
+        if idx_platform is not None:
+            for r in cdp_rows:
+                val = r[idx_platform] if idx_platform < len(r) else ""
+                # só o 1.º token (maxsplit=1 não parte o resto da string)
+                plat = (str(val).split(None, 1) or ["Desconhecido"])[0] if val else "Desconhecido"
+                plats[plat] += 1
+        top_platforms = plats.most_common(5)
+    return neighbors_count, top_platforms
+
+
+def _thin_box_style(wb) -> str:
+    """
+    Regista (uma vez por workbook) o estilo nomeado 'thin_box' — borda fina nos 4 lados,
+    restante igual ao estilo por omissão — e devolve o nome para atribuir a cell.style.
+    Atenção: cell.style repõe fonte/alinhamento; atribuir antes de Font/Alignment.
+    """
+    if "thin_box" not in wb.named_styles:
+        thin = Side(style="thin")
+        wb.add_named_style(NamedStyle(name="thin_box", font=DEFAULT_FONT,
+                                      border=Border(left=thin, right=thin, top=thin, bottom=thin)))
+    return "thin_box"
+
+
+def _write_block(ws, top_row: int, left_col: int, rows) -> int:
+    """
+    Escreve 'rows' (sequência de linhas de valores) a partir de (top_row, left_col)
+    com endereçamento numérico. Devolve a 1.ª linha livre a seguir ao bloco.
+    (ws.append não serve aqui: acrescenta sempre depois da última linha usada e
+    as tabelas do Dashboard ficam lado a lado em linhas fixas.)
+    """
+    r = top_row
+    for values in rows:
+        for c, v in enumerate(values, start=left_col):
+            ws.cell(row=r, column=c, value=v)
+        r += 1
+    return r
+
+
 def build_dashboard(wb):
-    # 1) Encontrar as folhas relevantes
-    ws_int = _find_sheet_by_contains(wb, "show interfaces status")
-    ws_vl  = _find_sheet_by_contains(wb, "show vlan brief")
-    ws_ver = _find_sheet_by_contains(wb, "show version")
-    ws_eth = _find_sheet_by_contains(wb, "etherchannel")
+    # Fase A (só leitura): localizar as folhas e extrair todos os valores antes de escrever
+    # 1) Encontrar as folhas relevantes (títulos em minúsculas calculados uma vez)
+    titles = _sheet_titles(wb)
+    ws_int = _find_sheet_by_contains(wb, "show interfaces status", titles)
+    ws_vl  = _find_sheet_by_contains(wb, "show vlan brief", titles)
+    ws_ver = _find_sheet_by_contains(wb, "show version", titles)
+    ws_eth = _find_sheet_by_contains(wb, "etherchannel", titles)
+    ws_cdp = _find_sheet_by_contains(wb, "cdp", titles)
 
 
     # 2) Extrair métricas
-    iface_stats = _parse_interfaces_status(ws_int) if ws_int else dict(total=0, up=0, down=0, per_vlan={})
+    # a folha de interfaces serve dois parsers: lê-se uma única vez
+    int_table = _get_table_from_sheet(ws_int) if ws_int else None
+    iface_stats = _parse_interfaces_status(ws_int, int_table) if ws_int else dict(total=0, up=0, down=0, per_vlan={})
     vlans = _parse_vlans(ws_vl) if ws_vl else []
     ios_version, uptime = _parse_show_version(ws_ver) if ws_ver else ("Desconhecida", "Desconhecido")
     pc_map = (parser_portchannels_from_etherchannel_sheet(ws_eth) if ws_eth
-            else (parser_portchannels_from_interfaces_sheet(ws_int) if ws_int else {}))
+            else (parser_portchannels_from_interfaces_sheet(ws_int, int_table) if ws_int else {}))
+    neighbors_count, top_platforms = _parse_cdp_platforms(ws_cdp) if ws_cdp else (0, [])
 
 
+    # Fase B (escrita): só a folha Dashboard é criada/alterada a partir daqui
+
 
     # 3) Criar / limpar Dashboard
     if "Dashboard" in wb.sheetnames:
@@ -498,150 +635,91 @@ def build_dashboard(wb):
     ws_dash = wb.create_sheet("Dashboard", 0)  # 1.ª aba
 
     # 4) Cabeçalho e KPIs (à esquerda)
-    ws_dash["A1"] = "Dashboard – Resumo do Switch"
-    ws_dash["A1"].font = Font(size=16, bold=True)
+    title = ws_dash.cell(_ROW_TITLE, _COL_KPI_LABEL, "Dashboard – Resumo do Switch")
+    title.font = Font(size=16, bold=True)
     ws_dash.merge_cells("A1:D1")
 
-    ws_dash["A3"] = "Total de Interfaces"
-    ws_dash["B3"] = iface_stats["total"]
-    ws_dash["A4"] = "Ativas (Up)"
-    ws_dash["B4"] = iface_stats["up"]
-    ws_dash["A5"] = "Inativas (Down/NotConnect)"
-    ws_dash["B5"] = iface_stats["down"]
-
-    ws_dash["A7"] = "IOS Version"
-    ws_dash["B7"] = ios_version
-    ws_dash["A8"] = "Uptime"
-    ws_dash["B8"] = uptime
-
-    for cell in ("A3","A4","A5","A7","A8"):
-        ws_dash[cell].font = Font(bold=True)    
+    bold = Font(bold=True)
+    for r, label, value in (
+        (3, "Total de Interfaces", iface_stats["total"]),
+        (4, "Ativas (Up)", iface_stats["up"]),
+        (5, "Inativas (Down/NotConnect)", iface_stats["down"]),
+        (7, "IOS Version", ios_version),
+        (8, "Uptime", uptime),
+        (9, "Vizinhos (CDP)", neighbors_count),  # KPI principal de CDP junto aos restantes
+    ):
+        ws_dash.cell(r, _COL_KPI_LABEL, label).font = bold
+        ws_dash.cell(r, _COL_KPI_VAL, value)
 
     # --- Tabela "Port-Channels" à direita dos KPIs ---
-    start_col = "D"   # ao lado dos KPIs (A..B ocupados); ajusta se precisares
-    start_row = 3
+    start_col = _COL_PC
+    start_row = _ROW_TABLES
 
-    ws_dash[f"{start_col}{start_row}"] = "Port-Channel"
-    ws_dash[f"{chr(ord(start_col)+1)}{start_row}"] = "Membros"
-    ws_dash[f"{start_col}{start_row}"].font = Font(bold=True)
-    ws_dash[f"{chr(ord(start_col)+1)}{start_row}"].font = Font(bold=True)
+    _write_block(ws_dash, start_row, start_col, [("Port-Channel", "Membros")])
 
-    r = start_row + 1
     if pc_map:
-        for pc_name, data in sorted(pc_map.items(), key=lambda x: x[0]):
-            ws_dash[f"{start_col}{r}"] = pc_name
-            members = ", ".join(data.get("members", [])) if data.get("members") else "(sem associação encontrada)"
-            ws_dash[f"{chr(ord(start_col)+1)}{r}"] = members
-            r += 1
+        pc_rows = [
+            (pc_name, ", ".join(data.get("members", [])) if data.get("members") else "(sem associação encontrada)")
+            for pc_name, data in sorted(pc_map.items(), key=lambda x: x[0])
+        ]
     else:
-        ws_dash[f"{start_col}{r}"] = "(nenhum Port-Channel detetado)"
-        ws_dash[f"{chr(ord(start_col)+1)}{r}"] = "-"
-        r += 1
+        pc_rows = [("(nenhum Port-Channel detetado)", "-")]
+    r = _write_block(ws_dash, start_row + 1, start_col, pc_rows)
 
-    # borda simples na tabela (usa 'Side' que já importaste)
+    # borda simples na tabela (estilo nomeado; aplicado antes do negrito do cabeçalho)
+    box = _thin_box_style(wb)
     try:
-        thin = Side(style="thin")
         for rr in range(start_row, r):
-            for cc in range(ord(start_col), ord(start_col)+2):
-                ws_dash[f"{chr(cc)}{rr}"].border = Border(left=thin, right=thin, top=thin, bottom=thin)
+            for cc in (start_col, start_col + 1):
+                ws_dash.cell(row=rr, column=cc).style = box
     except Exception:
         pass
+    ws_dash.cell(row=start_row, column=start_col).font = bold
+    ws_dash.cell(row=start_row, column=start_col + 1).font = bold
 
+    # 5) SECÇÃO VLANs — Nome e Estado (tabela à direita F–H)
+    center = Alignment(horizontal="center")
+    ws_dash.merge_cells("F2:H2")
+    vl_title = ws_dash.cell(_ROW_TABLES - 1, _COL_VLAN, "VLANs — Nome e Estado")
+    vl_title.font = bold
+    vl_title.alignment = center
 
-    # === (NOVO) KPIs de CDP / Neighbors ===
-    ws_cdp = _find_sheet_by_contains(wb, "cdp")
-    neighbors_count = 0
-    top_platforms = []
+    _write_block(ws_dash, _ROW_TABLES, _COL_VLAN, [("VLAN", "Nome", "Estado")])
+    row = _write_block(ws_dash, _ROW_TABLES + 1, _COL_VLAN, vlans)
 
-    if ws_cdp:
-        cdp_headers, cdp_rows = _get_table_from_sheet(ws_cdp)
-        if cdp_headers:
-            neighbors_count = len(cdp_rows)
-
-            # índice de colunas de forma tolerante a variações
-            def _idx_any(headers, *cands):
-                for i, h in enumerate(headers):
-                    if h is None:
-                        continue
-                    hl = str(h).strip().lower()
-                    if any(c in hl for c in cands):
-                        return i
-                return None
-
-            idx_platform = _idx_any(cdp_headers, "platform")
-
-            from collections import Counter
-            plats = Counter()
-            if idx_platform is not None:
-                for r in cdp_rows:
-                    val = r[idx_platform] if idx_platform < len(r) else ""
-                    plat = str(val).split()[0] if val else "Desconhecido"
-                    plats[plat] += 1
-            top_platforms = plats.most_common(5)
-
-    # KPI principal de CDP junto aos restantes
-    ws_dash["A9"] = "Vizinhos (CDP)"
-    ws_dash["B9"] = neighbors_count
-    ws_dash["A9"].font = Font(bold=True)
+    for rr in range(_ROW_TABLES, max(_ROW_TABLES, row - 1) + 1):
+        for cc in range(_COL_VLAN, _COL_VLAN + 3):
+            ws_dash.cell(row=rr, column=cc).style = box
 
-    # 5) SECÇÃO VLANs — Nome e Estado (tabela à direita F–H)
-    ws_dash.merge_cells("F2:H2")
-    ws_dash["F2"] = "VLANs — Nome e Estado"
-    ws_dash["F2"].font = Font(bold=True)
-    ws_dash["F2"].alignment = Alignment(horizontal="center")
-
-    ws_dash["F3"] = "VLAN"
-    ws_dash["G3"] = "Nome"
-    ws_dash["H3"] = "Estado"
-    for c in ("F3","G3","H3"):
-        ws_dash[c].font = Font(bold=True)
-        ws_dash[c].alignment = Alignment(horizontal="center")
-
-    row = 4
-    for vlan_id, name, state in vlans:
-        ws_dash[f"F{row}"] = vlan_id
-        ws_dash[f"G{row}"] = name
-        ws_dash[f"H{row}"] = state
-        row += 1
-
-    thin = Side(style="thin")
-    rng = f"F3:H{max(3, row-1)}"
-    for r in ws_dash[rng]:
-        for cell in r:
-            cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    for cc in range(_COL_VLAN, _COL_VLAN + 3):
+        hdr = ws_dash.cell(row=_ROW_TABLES, column=cc)
+        hdr.font = bold
+        hdr.alignment = center
 
     # 6) Distribuição de Estados (tabela pequena para o Pie)
-    ws_dash["A11"] = "Distribuição de Estados"
-    ws_dash["A11"].font = Font(bold=True)
-    ws_dash["A12"] = "Up"
-    ws_dash["A13"] = "Down"
-    ws_dash["B12"] = iface_stats["up"]
-    ws_dash["B13"] = iface_stats["down"]
+    ws_dash.cell(_ROW_STATES, _COL_KPI_LABEL, "Distribuição de Estados").font = bold
+    _write_block(ws_dash, _ROW_STATES + 1, _COL_KPI_LABEL,
+                 [("Up", iface_stats["up"]), ("Down", iface_stats["down"])])
 
     # 7) Gráfico Pizza: Interfaces Up vs Down (à direita, topo)
     pie = PieChart()
     pie.title = "Interfaces Up vs Down"
-    labels = Reference(ws_dash, min_col=1, min_row=12, max_row=13)
-    data   = Reference(ws_dash, min_col=2, min_row=12, max_row=13)
+    labels = Reference(ws_dash, min_col=1, min_row=_ROW_STATES + 1, max_row=_ROW_STATES + 2)
+    data   = Reference(ws_dash, min_col=2, min_row=_ROW_STATES + 1, max_row=_ROW_STATES + 2)
     pie.add_data(data, titles_from_data=False)
     pie.set_categories(labels)
     ws_dash.add_chart(pie, "J3")
 
     # 8) Mini-tabela: Portas por VLAN (à esquerda, por baixo dos KPIs)
     if iface_stats["per_vlan"]:
-        ws_dash["A16"] = "Portas por VLAN"
-        ws_dash["A16"].font = Font(bold=True)
-        base = 17
-        ws_dash.cell(row=base, column=1, value="VLAN").font = Font(bold=True)
-        ws_dash.cell(row=base, column=2, value="Nº Portas").font = Font(bold=True)
-        for i, (vlan_id, count) in enumerate(
-            sorted(
-                iface_stats["per_vlan"].items(),
-                key=lambda kv: int(re.sub(r'[^0-9]', '', kv[0]) or 0)
-            )
-        ):
-            ws_dash.cell(row=base + 1 + i, column=1, value=vlan_id)
-            ws_dash.cell(row=base + 1 + i, column=2, value=count)
+        ws_dash.cell(_ROW_PER_VLAN, _COL_KPI_LABEL, "Portas por VLAN").font = bold
+        base = _ROW_PER_VLAN + 1
+        ws_dash.cell(row=base, column=1, value="VLAN").font = bold
+        ws_dash.cell(row=base, column=2, value="Nº Portas").font = bold
+        _write_block(ws_dash, base + 1, 1, sorted(
+            iface_stats["per_vlan"].items(),
+            key=lambda kv: int(_NOT_0_9_RE.sub('', kv[0]) or 0)
+        ))
 
         last_row = base + 1 + len(iface_stats["per_vlan"])
 
@@ -657,14 +735,12 @@ def build_dashboard(wb):
         ws_dash.add_chart(bar, "J18")
 
     # 10) (NOVO) Top Plataformas CDP + gráfico posicionado em baixo do gráfico de VLANs
-    row_base = 22  # dá um espaço visual depois de "Portas por VLAN"
+    row_base = _ROW_CDP  # dá um espaço visual depois de "Portas por VLAN"
     if top_platforms:
-        ws_dash.cell(row=row_base,   column=1, value="Plataformas CDP").font = Font(bold=True)
-        ws_dash.cell(row=row_base+1, column=1, value="Plataforma").font = Font(bold=True)
-        ws_dash.cell(row=row_base+1, column=2, value="Quantidade").font = Font(bold=True)
-        for i, (plat, n) in enumerate(top_platforms, start=0):
-            ws_dash.cell(row=row_base+2+i, column=1, value=plat)
-            ws_dash.cell(row=row_base+2+i, column=2, value=n)
+        ws_dash.cell(row=row_base,   column=1, value="Plataformas CDP").font = bold
+        ws_dash.cell(row=row_base+1, column=1, value="Plataforma").font = bold
+        ws_dash.cell(row=row_base+1, column=2, value="Quantidade").font = bold
+        _write_block(ws_dash, row_base + 2, 1, top_platforms)
 
         # Gráfico de barras para Top Plataformas (ABAIXO de J18 -> J35)
         bar2 = BarChart()
@@ -687,7 +763,7 @@ def build_dashboard(wb):
     ws_dash.freeze_panes = "A3"
 
     # Centralizar título
-    ws_dash["A1"].alignment = Alignment(horizontal="center")
+    title.alignment = center
 
     # Garantir que fica 1.ª aba
     wb.move_sheet(ws_dash, offset=-wb.index(ws_dash))
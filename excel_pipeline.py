@@ -1,20 +1,35 @@
 
 from __future__ import annotations
 import os, re, logging
+from collections import Counter
+from functools import lru_cache
+from dataclasses import dataclass
 from typing import List, Tuple, Any
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment
 from openpyxl.utils import get_column_letter
 
-from .excel_utils import safe_sheetname, autosize_columns, insert_table, write_kv_table, chart_bar, chart_pie, write_resumo_block
-from .excel_utils import apply_cf_interfaces, apply_cf_vlans, apply_cf_spanning_tree, mark_portchannels_and_link
+from .excel_utils import safe_sheetname, autosize_columns, insert_table, write_kv_table, chart_bar, chart_pie, write_resumo_block, append_styled_rows
+from .excel_utils import apply_cf_interfaces, apply_cf_vlans, apply_cf_spanning_tree, mark_portchannels_and_link, table_last_row
 from .excel_utils import   extract_active_vlans_from_table, extract_active_vlans_from_raw
+from .excel_utils import _FONT_BOLD, _FONT_MONO, _WRAP_TOP, is_logical_port, save_workbook
 from .textfsm_utils import parse_with_textfsm, _dictlist_to_table
 from .parsers import parser_show_spanning_tree_from_text, parse_etherchannel_summary_from_text, parse_show_interfaces_trunk
 from .excel_dashboard import build_dashboard
+from history_json import write_excel_hash
 
 log = logging.getLogger("clean_switch.excel_pipeline")
 
+_SPLIT_MEM = re.compile(r'[\s,]+')
+_TBL_SAFE = re.compile(r'[^A-Za-z0-9_]')
+
+def _hmap(headers) -> dict[str, int]:
+    """{cabeçalho (strip + lower): índice}, construído uma vez por tabela (fica o 1º em caso de repetidos)."""
+    idx = {}
+    for i, h in enumerate(headers):
+        idx.setdefault("" if h is None else str(h).strip().lower(), i)
+    return idx
+
 def _po_members_from_ether_rows(headers: list[str], rows: list[list[Any]]):
     """Extrai dict {po: [members...]} e lista [(po, 'm1, m2, ...')] a partir da tabela EtherChannel.
 
@@ -23,11 +38,10 @@ def _po_members_from_ether_rows(headers: list[str], rows: list[list[Any]]):
     """
     if not headers or not rows:
         return {}, []
-    low = [h.lower() for h in headers]
-    try:
-        po_idx = low.index('port-channel')
-        mem_idx = low.index('member ports')
-    except ValueError:
+    hmap = _hmap(headers)
+    po_idx = hmap.get('port-channel')
+    mem_idx = hmap.get('member ports')
+    if po_idx is None or mem_idx is None:
         return {}, []
     mapping = {}
     listing = []
@@ -36,14 +50,120 @@ def _po_members_from_ether_rows(headers: list[str], rows: list[list[Any]]):
         mem = str(r[mem_idx]).strip() if mem_idx < len(r) else ''
         if not po:
             continue
-        members = [t for t in re.split(r'[\s,]+', mem) if t]
+        members = [t for t in _SPLIT_MEM.split(mem) if t]
         mapping[po] = members
         listing.append((po, ', '.join(members)))
     return mapping, listing
 
 
+def _command_ok(raw, rows) -> bool:
+    """O comando devolveu algo útil: tabela, ou texto que não seja um erro IOS ('% Invalid input...')."""
+    if rows:
+        return True
+    if isinstance(raw, (bytes, bytearray)):
+        raw = raw.decode("utf-8", "replace")
+    text = ("" if raw is None else str(raw)).strip()
+    return bool(text) and not text.startswith("%")
+
+def _norm(s) -> str:
+    return (s or "").strip().lower()
+
+_PORT_UP = ("connected", "up")
+
+def _cell_lc(r, idx) -> str:
+    """Célula idx de uma linha normalizada (strip + lower); '' se faltar a célula."""
+    return "" if (idx is None or idx >= len(r) or r[idx] is None) else str(r[idx]).strip().lower()
+
+def _phys_port_state(r, pidx, sidx) -> str | None:
+    """Estado normalizado de uma interface física; None para as lógicas (Po/VLAN/Loopback/etc.)."""
+    if is_logical_port(_cell_lc(r, pidx)):
+        return None
+    return _cell_lc(r, sidx)
+
+def _count_port_states(rows, pidx, sidx) -> tuple[int, int]:
+    """(total, up) das interfaces físicas; up = 'connected' ou 'up'."""
+    phys = Counter(st for st in (_phys_port_state(r, pidx, sidx) for r in rows) if st is not None)
+    return sum(phys.values()), sum(phys[k] for k in _PORT_UP)
+
+def _summary_tally(kind: str, hmap: dict):
+    """
+    Contadores do bloco 'Resumo' do tipo de folha (ver _sheet_kind) e a função que os alimenta
+    linha a linha; vai para insert_table(on_row=...), que conta na mesma passagem em que escreve
+    a tabela. Tipos sem contagem por linha devolvem ({}, None).
+    """
+    if kind == "ifstatus":
+        t = {"total": 0, "up": 0}
+        pidx, sidx = hmap.get("port"), hmap.get("status")
+        def on_row(r):
+            st = _phys_port_state(r, pidx, sidx)
+            if st is not None:
+                t["total"] += 1
+                if st in _PORT_UP:
+                    t["up"] += 1
+    elif kind == "vlan":
+        t = {"total": 0, "active": 0}
+        vidx, sidx = hmap.get("vlan"), hmap.get("status")
+        def on_row(r):
+            if _cell_lc(r, vidx).isdigit():
+                t["total"] += 1
+                if _cell_lc(r, sidx) == "active":
+                    t["active"] += 1
+    elif kind == "trunk":
+        t = {"total": 0, "up": 0, "natives": []}  # natives: [(port, native)] com native != 1
+        pidx, sidx, nidx = hmap.get("port"), hmap.get("status"), hmap.get("native_vlan")
+        def on_row(r):
+            t["total"] += 1
+            if _cell_lc(r, sidx) in ("up", "connected", "trunking"):
+                t["up"] += 1
+            native = _cell_lc(r, nidx)
+            if native.isdigit() and native != "1":
+                prt = str(r[pidx]).strip() if (pidx is not None and pidx < len(r)) else ""
+                t["natives"].append((prt, native))
+    elif kind == "stp":
+        t = {"root": 0, "forwarding": 0, "blocking": 0}
+        ridx, sidx = hmap.get("role"), hmap.get("state")
+        def on_row(r):
+            if _cell_lc(r, ridx) == "root":
+                t["root"] += 1
+            st = _cell_lc(r, sidx)
+            if st in ("forwarding", "blocking"):
+                t[st] += 1
+    else:
+        return {}, None
+    return t, on_row
+
+def _m_interfaces_status(m: dict, raw, headers, rows) -> None:
+    if not headers:
+        return
+    hmap = _hmap(headers)
+    total, up = _count_port_states(rows, hmap.get("port"), hmap.get("status"))
+    m["interfaces_total"] += total
+    m["interfaces_up"] += up
+    m["interfaces_down"] += total - up
+
+def _m_vlan_brief(m: dict, raw, headers, rows) -> None:
+    vset = set()
+    if headers and rows:
+        vset = extract_active_vlans_from_table(headers, rows)
+    if not vset and raw:
+        vset = extract_active_vlans_from_raw(raw)
+    m["vlans_active"] = len(vset)
+
+def _m_cdp(m: dict, raw, headers, rows) -> None:
+    m["cdp_total"] = max(m["cdp_total"], len(rows or []))
+
+def _m_inventory(m: dict, raw, headers, rows) -> None:
+    m["inventory_total"] = max(m["inventory_total"], len(rows or []))
+
+# Ordem = prioridade: o primeiro padrão contido no comando decide o handler
+_METRIC_HANDLERS = {
+    "show interfaces status": _m_interfaces_status,
+    "show vlan brief": _m_vlan_brief,
+    "cdp neighbors": _m_cdp,
+    "show inventory": _m_inventory,
+}
+
 def metrics_from_collected(collected) -> dict:
-    def _norm(s): return (s or "").strip().lower()
     m = {
         "interfaces_total": 0,
         "interfaces_up": 0,
@@ -51,67 +171,204 @@ def metrics_from_collected(collected) -> dict:
         "vlans_active": 0,
         "cdp_total": 0,
         "inventory_total": 0,
+        "commands_ok": 0,
     }
     for cmd, raw, headers, rows in collected:
         cl = _norm(cmd)
-        if "show interfaces status" in cl and headers:
-            low = [ _norm(x) for x in headers ]
-            p_idx = low.index("port") if "port" in low else None
-            s_idx = low.index("status") if "status" in low else None
-            for r in rows:
-                if p_idx is not None and p_idx < len(r):
-                    port = (str(r[p_idx]).strip().lower() if r[p_idx] is not None else "")
-                    if port.startswith(("po","port-channel","vlan","lo","loopback","tunnel","nve","virtual")):
-                        continue
-                m["interfaces_total"] += 1
-                s = (str(r[s_idx]).strip().lower() if (s_idx is not None and s_idx < len(r) and r[s_idx] is not None) else "")
-                if s in ("connected","up"):
-                    m["interfaces_up"] += 1
-                else:
-                    m["interfaces_down"] += 1
-        elif "show vlan brief" in cl:
-            vset = set()
-            if headers and rows:
-                vset = extract_active_vlans_from_table(headers, rows)
-            if not vset and raw:
-                vset = extract_active_vlans_from_raw(raw)
-            m["vlans_active"] = len(vset)
-        elif "cdp neighbors" in cl:
-            m["cdp_total"] = max(m["cdp_total"], len(rows or []))
-        elif "show inventory" in cl:
-            m["inventory_total"] = max(m["inventory_total"], len(rows or []))
+        if _command_ok(raw, rows):
+            m["commands_ok"] += 1
+        key = next((k for k in _METRIC_HANDLERS if k in cl), None)
+        if key:
+            _METRIC_HANDLERS[key](m, raw, headers, rows)
     return m
 
-def _normalize_headers(cmd_lc: str, hdrs: list[str]) -> list[str]:
-    if not hdrs:
-        return hdrs
-    def pick(*cands):
-        low = [h.lower() for h in hdrs]
-        for c in cands:
-            if c.lower() in low:
-                return hdrs[low.index(c.lower())]
-        return None
+_WANTED_HEADERS = {
+    "ifstatus": ("Port", "Name", "Status", "Vlan", "Duplex", "Speed", "Type"),
+    "vlanbrief": ("VLAN", "Name", "Status", "Interfaces"),
+    "inventory": ("Name", "Descr", "PID", "VID", "SN"),
+}
+_STP_HEADER_MAP = {"vlan":"Vlan","interface":"Interface","role":"Role","state":"State","cost":"Cost","port_id":"Port ID","port_type":"Type"}
+
+def _header_category(cmd_lc: str) -> str:
     if "show interfaces status" in cmd_lc:
-        wanted = ["Port", "Name", "Status", "Vlan", "Duplex", "Speed", "Type"]
-        return [pick(w) or w for w in wanted]
+        return "ifstatus"
     if "show vlan brief" in cmd_lc:
-        wanted = ["VLAN", "Name", "Status", "Interfaces"]
-        return [pick(w) or w for w in wanted]
+        return "vlanbrief"
     if "show inventory" in cmd_lc:
-        wanted = ["Name", "Descr", "PID", "VID", "SN"]
-        return [pick(w) or w for w in wanted]
+        return "inventory"
     if "show version" in cmd_lc:
-        return hdrs   # não mexer — manter os nomes vindos do TextFSM
+        return "version"
     if "show spanning-tree" in cmd_lc:
-        mapping = {"vlan":"Vlan","interface":"Interface","role":"Role","state":"State","cost":"Cost","port_id":"Port ID","port_type":"Type"}
-        return [mapping.get(h.lower(), h) for h in hdrs]
-    return [h[:1].upper() + h[1:] if isinstance(h, str) else h for h in hdrs]
+        return "stp"
+    return "other"
+
+@lru_cache(maxsize=64)
+def _normalize_headers_cached(category: str, hdrs: tuple) -> tuple:
+    wanted = _WANTED_HEADERS.get(category)
+    if wanted is not None:
+        if hdrs == wanted:
+            return hdrs
+        low = {}
+        for h in hdrs:
+            low.setdefault(h.lower(), h)
+        return tuple(low.get(w.lower()) or w for w in wanted)
+    if category == "version":
+        return hdrs   # não mexer — manter os nomes vindos do TextFSM
+    if category == "stp":
+        return tuple(_STP_HEADER_MAP.get(h.lower(), h) for h in hdrs)
+    return tuple(h[:1].upper() + h[1:] if isinstance(h, str) else h for h in hdrs)
+
+def _normalize_headers(cmd_lc: str, hdrs: list[str]) -> list[str]:
+    """Cabeçalhos canónicos por comando; memoizado por (categoria do comando, cabeçalhos)."""
+    if not hdrs:
+        return hdrs
+    return list(_normalize_headers_cached(_header_category(cmd_lc), tuple(hdrs)))
 
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment
 from openpyxl.utils import get_column_letter
 from openpyxl.worksheet.table import Table, TableStyleInfo
 
+# --------- CF + Resumos (Ideia 5) por tipo de folha ----------
+@lru_cache(maxsize=128)
+def _sheet_kind(cmd_lc: str) -> str:
+    """Tipo de folha do comando (a 1ª correspondência ganha); 'other' se não tiver tratamento próprio."""
+    for needle, kind in (("show interfaces status", "ifstatus"), ("show vlan brief", "vlan"),
+                         ("show interfaces trunk", "trunk"), ("show inventory", "inventory"),
+                         ("cdp neighbors", "cdp"), ("show version", "version"),
+                         ("show spanning-tree", "stp")):
+        if needle in cmd_lc:
+            return kind
+    return "other"
+
+@dataclass
+class _SheetTable:
+    """Tabela já escrita numa folha: o que os _render_* precisam para CF e resumo."""
+    header_row: int
+    end_row: int          # 1 abaixo da última linha de dados (insert_table)
+    last_row: int         # última linha com conteúdo (table_last_row)
+    rows: list
+    hmap: dict
+    tally: dict
+
+def _write_listing(ws, row: int, title: str, pairs) -> None:
+    ws.cell(row=row, column=1, value=title).font = _FONT_BOLD
+    for rr, (a, b) in enumerate(pairs, start=row + 1):
+        ws.cell(row=rr, column=1, value=a)
+        ws.cell(row=rr, column=2, value=b)
+
+def _render_ifstatus(ws, t: _SheetTable, ether) -> None:
+    apply_cf_interfaces(ws, header_row=t.header_row, last_row=t.last_row)
+    try:
+        mark_portchannels_and_link(ws, header_row=t.header_row, target_sheet_title="show etherchannel summary",
+                                   last_row=t.last_row)
+    except Exception:
+        pass
+
+    total, up = t.tally["total"], t.tally["up"]
+    last_r, _ = write_resumo_block(
+        ws, "Resumo – Interfaces",
+        [("TOTAL", total), ("UP", up), ("DOWN", total - up)],
+        start_row=t.end_row + 2, autosize=False
+    )
+
+    # Port-Channels e membros (se existir EtherChannel)
+    ether_headers, ether_rows = ether
+    if ether_headers and ether_rows:
+        _map, listing = _po_members_from_ether_rows(ether_headers, ether_rows)
+        if listing:
+            _write_listing(ws, last_r + 2, "Port-Channels e Membros", listing)
+
+    # Gráfico “Portas por Estado” (pequeno)
+    kv_row = t.end_row + 2
+    chart_bar(
+        ws, "Portas por Estado",
+        f"A{kv_row+1}", f"A{kv_row+2}",
+        f"B{kv_row+1}", f"B{kv_row+2}",
+        "H5"
+    )
+
+def _render_vlan(ws, t: _SheetTable, ether) -> None:
+    apply_cf_vlans(ws, header_row=t.header_row, last_row=t.last_row)
+    write_resumo_block(
+        ws, "Resumo – VLANs",
+        [("TOTAL", t.tally["total"]), ("ATIVAS", t.tally["active"])],
+        start_row=t.end_row + 2, autosize=False
+    )
+
+def _render_trunk(ws, t: _SheetTable, ether) -> None:
+    natives_list = t.tally["natives"]
+    last_r, _ = write_resumo_block(
+        ws, "Resumo – Trunks",
+        [("TOTAL", t.tally["total"]), ("UP", t.tally["up"]), ("NATIVE ≠ 1", len(natives_list))],
+        start_row=t.end_row + 2, autosize=False
+    )
+    # Lista rápida das natives != 1, se existir
+    if natives_list:
+        _write_listing(ws, last_r + 2, "Portas com Native VLAN ≠ 1", natives_list)
+
+def _render_inventory(ws, t: _SheetTable, ether) -> None:
+    write_resumo_block(ws, "Resumo – Inventory", [("Itens", len(t.rows))], start_row=t.end_row + 2, autosize=False)
+
+def _render_cdp(ws, t: _SheetTable, ether) -> None:
+    write_resumo_block(ws, "Resumo – CDP", [("Vizinhos", len(t.rows))], start_row=t.end_row + 2, autosize=False)
+
+def _render_version(ws, t: _SheetTable, ether) -> None:
+    hmap, rows = t.hmap, t.rows
+    v = rows[0][hmap["version"]] if ("version" in hmap and rows) else ""
+    u = rows[0][hmap["uptime"]]  if ("uptime" in hmap and rows)  else ""
+    write_resumo_block(ws, "Resumo – Version", [("Version", v), ("Uptime", u)], start_row=t.end_row + 2, autosize=False)
+
+def _render_stp(ws, t: _SheetTable, ether) -> None:
+    # Só aplicar CF se existir a coluna "State"
+    if "state" in t.hmap:
+        apply_cf_spanning_tree(ws, header_row=t.header_row, last_row=t.last_row)
+    write_resumo_block(ws, "Resumo – Spanning-Tree",
+                       [("ROOT ports", t.tally["root"]), ("FORWARDING", t.tally["forwarding"]), ("BLOCKING", t.tally["blocking"])],
+                       start_row=t.end_row + 2, autosize=False)
+
+_SHEET_HANDLERS = {
+    "ifstatus": _render_ifstatus,
+    "vlan": _render_vlan,
+    "trunk": _render_trunk,
+    "inventory": _render_inventory,
+    "cdp": _render_cdp,
+    "version": _render_version,
+    "stp": _render_stp,
+}
+
+def _next_free(base: str, taken: set, next_sfx: dict, make) -> str:
+    """
+    Primeiro nome livre entre base, make(base, 2), make(base, 3), ... e regista-o em taken.
+    next_sfx guarda, por base, o sufixo onde retomar — os anteriores já estão ocupados.
+    """
+    name = base
+    sfx = next_sfx.get(base, 2)
+    while name in taken:
+        name = make(base, sfx)
+        sfx += 1
+    next_sfx[base] = sfx
+    taken.add(name)
+    return name
+
+def _suffixed_sheetname(base: str, sfx: int) -> str:
+    # cortar a base (não o sufixo) para caber nos 31 caracteres do Excel
+    tail = f"_{sfx}"
+    return safe_sheetname(base[:31 - len(tail)] + tail)
+
+def _unique_sheet_title(cmd: str, taken: set, next_sfx: dict) -> str:
+    return _next_free(safe_sheetname(cmd), taken, next_sfx, _suffixed_sheetname)
+
+def _fallback_table(cmd_lc: str, raw):
+    """Parsers internos para quando o TextFSM não devolveu tabela; ([], []) se não houver."""
+    if "show spanning-tree" in cmd_lc:
+        return parser_show_spanning_tree_from_text(raw or "")
+    if ("show etherchannel" in cmd_lc) and ("summary" in cmd_lc):
+        return parse_etherchannel_summary_from_text(raw or "")
+    if "show interfaces trunk" in cmd_lc:
+        return parse_show_interfaces_trunk(raw or "")
+    return [], []
+
 def create_excel(hostname: str, ts: str, collected, xlsx_path: str) -> None:
     wb = Workbook()
 
@@ -123,62 +380,44 @@ def create_excel(hostname: str, ts: str, collected, xlsx_path: str) -> None:
     ws_resume["A3"] = "Comandos";  ws_resume["B3"] = ", ".join([c[0] for c in collected])
     autosize_columns(ws_resume)
 
-    mono = Font(name="Consolas")
-    wrap = Alignment(wrap_text=True, vertical="top")
-
     ether_headers, ether_rows = [], []
+    # Nomes já usados (folhas e tabelas — o displayName tem de ser único no workbook inteiro)
+    sheet_titles, sheet_sfx = {ws_resume.title}, {}
+    table_names, table_sfx = set(), {}
 
     for (cmd, raw, headers, rows) in collected:
-        base = safe_sheetname(cmd)
-        title = base
-        sfx = 2
-        while title in wb.sheetnames:
-            title = safe_sheetname(f"{base}_{sfx}")
-            sfx += 1
-
-        ws = wb.create_sheet(title=title)
+        ws = wb.create_sheet(title=_unique_sheet_title(cmd, sheet_titles, sheet_sfx))
         ws["A1"] = "Comando:";   ws["B1"] = cmd
         ws["A2"] = "Hostname:";  ws["B2"] = hostname
         ws["A3"] = "Timestamp:"; ws["B3"] = ts
-        ws["A1"].font = ws["A2"].font = ws["A3"].font = Font(bold=True)
+        ws["A1"].font = ws["A2"].font = ws["A3"].font = _FONT_BOLD
 
         start_row = 5
         cmd_lc = cmd.strip().lower()
 
         # Se headers/rows vierem vazios, tentar parsers internos (fallback)
         if (not headers) or (not rows):
-            h, r = ([], [])
-            if "show spanning-tree" in cmd_lc:
-                from .parsers import parser_show_spanning_tree_from_text
-                h, r = parser_show_spanning_tree_from_text(raw or "")
-            elif ("show etherchannel" in cmd_lc) and ("summary" in cmd_lc):
-                from .parsers import parse_etherchannel_summary_from_text
-                h, r = parse_etherchannel_summary_from_text(raw or "")
-            elif "show interfaces trunk" in cmd_lc:
-                from .parsers import parse_show_interfaces_trunk
-                h, r = parse_show_interfaces_trunk(raw or "")
+            h, r = _fallback_table(cmd_lc, raw)
             if h and r:
                 headers, rows = h, r
 
         if headers and rows:
             # Normalização de cabeçalhos (NOTA: show version não renomear)
             headers = _normalize_headers(cmd_lc, list(headers))
+            hmap = _hmap(headers)
 
             data_start_row = start_row
-            end_row, end_col = insert_table(ws, data_start_row, headers, rows)
-            autosize_columns(ws)
+            kind = _sheet_kind(cmd_lc)
+            tally, on_row = _summary_tally(kind, hmap)
+            # folha nova com só o bloco A1:B3 por cima: o cabeçalho é a última linha usada
+            end_row, end_col = insert_table(ws, data_start_row, headers, rows, on_row=on_row, at_bottom=True)
+            last_row = table_last_row(data_start_row, rows)  # evita re-varrer a folha nas CF
 
             # Converter em Excel Table (filtros/ordenar)
             ref = f"A{data_start_row}:{get_column_letter(end_col)}{end_row}"
             # Nome único e “safe” para a tabela
-            import re
-            base_tbl = re.sub(r'[^A-Za-z0-9_]', '_', ws.title) or "Table"
-            existing = {t.displayName for t in getattr(ws, "_tables", [])}
-            name = base_tbl if base_tbl not in existing else f"{base_tbl}_2"
-            i = 2
-            while name in existing:
-                i += 1
-                name = f"{base_tbl}_{i}"
+            base_tbl = _TBL_SAFE.sub('_', ws.title) or "Table"
+            name = _next_free(base_tbl, table_names, table_sfx, lambda b, n: f"{b}_{n}")
 
             tbl = Table(displayName=name, ref=ref)
             tbl.tableStyleInfo = TableStyleInfo(name="TableStyleMedium9", showRowStripes=True, showColumnStripes=False)
@@ -191,161 +430,42 @@ def create_excel(hostname: str, ts: str, collected, xlsx_path: str) -> None:
             if "show etherchannel summary" in cmd_lc:
                 ether_headers, ether_rows = headers, rows
 
-            # CF por folha
-            if "show interfaces status" in cmd_lc:
-                apply_cf_interfaces(ws, header_row=data_start_row)
-                try:
-                    mark_portchannels_and_link(ws, header_row=data_start_row, target_sheet_title="show etherchannel summary")
-                except Exception:
-                    pass
-            elif "show vlan brief" in cmd_lc:
-                apply_cf_vlans(ws, header_row=data_start_row)
-            elif "show spanning-tree" in cmd_lc:
-                # Só aplicar CF se existir a coluna "State"
-                if any(str(h).strip().lower() == "state" for h in headers):
-                    apply_cf_spanning_tree(ws, header_row=data_start_row)
-
-            # --------- Resumos (Ideia 5) + gráfico rápido por comando ----------
-            low = [str(h).lower() for h in headers]
-
-            if "show interfaces status" in cmd_lc:
-                sidx = low.index("status") if "status" in low else None
-                pidx = low.index("port") if "port" in low else None
-                up = down = total = 0
-                for r in rows:
-                    # ignorar interfaces lógicas (Po/VLAN/Loopback/etc.)
-                    if pidx is not None and pidx < len(r):
-                        port = str(r[pidx] or "").strip().lower()
-                        if port.startswith(("po", "port-channel", "vlan", "lo", "loopback", "tunnel", "nve", "virtual")):
-                            continue
-                    total += 1
-                    st = (str(r[sidx]).strip().lower() if (sidx is not None and sidx < len(r) and r[sidx]) else "")
-                    if st in ("connected", "up"):
-                        up += 1
-                    else:
-                        down += 1
-
-                last_r, _ = write_resumo_block(
-                    ws, "Resumo – Interfaces",
-                    [("TOTAL", total), ("UP", up), ("DOWN", down)],
-                    start_row=end_row + 2
-                )
-
-                # Port-Channels e membros (se existir EtherChannel)
-                if ether_headers and ether_rows:
-                    _map, listing = _po_members_from_ether_rows(ether_headers, ether_rows)
-                    if listing:
-                        ws.cell(row=last_r + 2, column=1, value="Port-Channels e Membros").font = Font(bold=True)
-                        rr = last_r + 3
-                        for po, members in listing:
-                            ws.cell(row=rr, column=1, value=po)
-                            ws.cell(row=rr, column=2, value=members)
-                            rr += 1
-                        autosize_columns(ws)
-
-                # Gráfico “Portas por Estado” (pequeno)
-                kv_row = end_row + 2
-                chart_bar(
-                    ws, "Portas por Estado",
-                    f"A{kv_row+1}", f"A{kv_row+2}",
-                    f"B{kv_row+1}", f"B{kv_row+2}",
-                    "H5"
-                )
-
-            elif "show vlan brief" in cmd_lc:
-                vidx = low.index("vlan") if "vlan" in low else None
-                sidx = low.index("status") if "status" in low else None
-                total_vlans = 0
-                active = 0
-                for r in rows:
-                    vid = str(r[vidx]).strip() if (vidx is not None and vidx < len(r)) else ""
-                    st  = str(r[sidx]).strip().lower() if (sidx is not None and sidx < len(r) and r[sidx]) else ""
-                    if vid.isdigit():
-                        total_vlans += 1
-                        if st == "active":
-                            active += 1
-                write_resumo_block(
-                    ws, "Resumo – VLANs",
-                    [("TOTAL", total_vlans), ("ATIVAS", active)],
-                    start_row=end_row + 2
-                )
-            
-            elif "show interfaces trunk" in cmd_lc:
-                low = [str(h).strip().lower() for h in headers]
-                pidx = low.index("port")            if "port" in low else None
-                midx = low.index("mode")            if "mode" in low else None
-                sidx = low.index("status")          if "status" in low else None
-                nidx = low.index("native_vlan")     if "native_vlan" in low else None
-
-                total_trunks = 0
-                trunks_up = 0
-                native_not_1 = 0
-                natives_list = []  # [(port,native)]
-
-                for r in rows:
-                    total_trunks += 1
-                    st = str(r[sidx]).strip().lower() if (sidx is not None and sidx < len(r) and r[sidx]) else ""
-                    if st in ("up", "connected", "trunking"):
-                        trunks_up += 1
-                    native = str(r[nidx]).strip() if (nidx is not None and nidx < len(r)) else ""
-                    prt = str(r[pidx]).strip() if (pidx is not None and pidx < len(r)) else ""
-                    if native and native.isdigit() and native != "1":
-                        native_not_1 += 1
-                        natives_list.append((prt, native))
-
-                last_r, _ = write_resumo_block(
-                    ws, "Resumo – Trunks",
-                    [("TOTAL", total_trunks), ("UP", trunks_up), ("NATIVE ≠ 1", native_not_1)],
-                    start_row=end_row + 2
-                )
-
-                # Lista rápida das natives != 1, se existir
-                if natives_list:
-                    ws.cell(row=last_r + 2, column=1, value="Portas com Native VLAN ≠ 1").font = Font(bold=True)
-                    rr = last_r + 3
-                    for prt, nv in natives_list:
-                        ws.cell(row=rr, column=1, value=prt)
-                        ws.cell(row=rr, column=2, value=nv)
-                        rr += 1
-                    autosize_columns(ws)
-
-
-            elif "show inventory" in cmd_lc:
-                write_resumo_block(ws, "Resumo – Inventory", [("Itens", len(rows))], start_row=end_row + 2)
-
-            elif "cdp neighbors" in cmd_lc:
-                write_resumo_block(ws, "Resumo – CDP", [("Vizinhos", len(rows))], start_row=end_row + 2)
-
-            elif "show version" in cmd_lc:
-                v = rows[0][low.index("version")] if ("version" in low and rows) else ""
-                u = rows[0][low.index("uptime")]  if ("uptime" in low and rows)  else ""
-                write_resumo_block(ws, "Resumo – Version", [("Version", v), ("Uptime", u)], start_row=end_row + 2)
-
-            elif "show spanning-tree" in cmd_lc:
-                ridx = low.index("role")  if "role"  in low else None
-                sidx = low.index("state") if "state" in low else None
-                root = blocking = forwarding = 0
-                for r in rows:
-                    role = str(r[ridx]).strip().lower()  if (ridx is not None and ridx < len(r) and r[ridx]) else ""
-                    st   = str(r[sidx]).strip().lower()   if (sidx is not None and sidx < len(r) and r[sidx]) else ""
-                    if role == "root":        root += 1
-                    if st == "blocking":      blocking += 1
-                    if st == "forwarding":    forwarding += 1
-                write_resumo_block(ws, "Resumo – Spanning-Tree",
-                                   [("ROOT ports", root), ("FORWARDING", forwarding), ("BLOCKING", blocking)],
-                                   start_row=end_row + 2)
+            # CF + resumo (Ideia 5) + gráfico rápido, conforme o tipo de folha
+            handler = _SHEET_HANDLERS.get(kind)
+            if handler is not None:
+                handler(ws, _SheetTable(data_start_row, end_row, last_row, rows, hmap, tally), (ether_headers, ether_rows))
+
+            # Larguras uma única vez, já com a tabela e todos os blocos escritos
+            autosize_columns(ws)
 
         else:
             # Sem grid → despejo do texto bruto (com formatação de monospace)
-            ws.cell(row=start_row - 1, column=1, value="Output (texto bruto):").font = Font(bold=True)
+            ws.cell(row=start_row - 1, column=1, value="Output (texto bruto):").font = _FONT_BOLD
             lines = (raw.splitlines() if isinstance(raw, str) else [])
-            for i, line in enumerate(lines, start=start_row):
-                c = ws.cell(row=i, column=1, value=line)
-                c.alignment = wrap
-                c.font = mono
+            # uma linha por row (os parsers do dashboard/ideia6 relêem a folha linha a linha);
+            # estilo mono+wrap registado uma vez em vez de 2 setters por célula
+            append_styled_rows(ws, ((line,) for line in lines), font=_FONT_MONO, alignment=_WRAP_TOP)
             ws.column_dimensions["A"].width = max(ws.column_dimensions["A"].width or 0, 100)
 
     # Dashboard sempre no fim (todas as folhas já existem)
     build_dashboard(wb)
-    wb.save(xlsx_path)
+    save_workbook(wb, xlsx_path)
+
+
+def build_excel(hostname: str, ts: str, collected, xlsx_path: str, digest: str, host_ip: str = None) -> bool:
+    """
+    create_excel + Ideia6, com o sidecar <xlsx>.hash apagado antes e só regravado se ambos
+    correrem até ao fim. Devolve False se o Ideia6 falhou (o xlsx base fica gravado).
+    """
+    from ideia6_features import ideia6_run_pipeline  # tardio: ideia6 importa clean_switch.*
+
+    write_excel_hash(xlsx_path, None)
+    create_excel(hostname, ts, collected, xlsx_path)
+    try:
+        ideia6_run_pipeline(hostname, ts, collected, xlsx_path, host_ip=host_ip)
+    except Exception as e:
+        log.error("Ideia6 pipeline falhou para %s: %s", hostname, e)
+        return False
+    write_excel_hash(xlsx_path, digest)
+    return True
 
@@ -1,44 +1,108 @@
 
 from __future__ import annotations
-from typing import Iterable, List, Tuple, Optional, Any, Dict, Set
+from typing import Iterable, List, Tuple, Optional, Any, Dict, Set, Callable
 from openpyxl.worksheet.worksheet import Worksheet
 from openpyxl.utils import get_column_letter, coordinate_to_tuple
 from openpyxl.styles import Alignment, Font, PatternFill
 from openpyxl.chart import BarChart, PieChart, Reference
-import re
+from openpyxl.cell.cell import Cell
+from openpyxl.styles.cell_style import StyleArray
+import io, os, re
+
+# -------- interfaces lógicas --------
+# prefixos (lowercase) das interfaces lógicas: Port-channel/Po, VLAN, Loopback, Tunnel, NVE, Virtual
+LOGICAL_PREFIXES = ("po", "port-channel", "vlan", "lo", "loopback", "tunnel", "nve", "virtual")
+# 2 primeiros caracteres desses prefixos: uma consulta ao set despacha logo as portas físicas
+_LOGICAL_2CHAR = frozenset(p[:2] for p in LOGICAL_PREFIXES)
+
+def is_logical_port(port: str) -> bool:
+    """True se 'port' (já em minúsculas e sem espaços) for uma interface lógica."""
+    return port[:2] in _LOGICAL_2CHAR and port.startswith(LOGICAL_PREFIXES)
 
 # -------- naming & sizing --------
+_SAFE_SHEET_RE = re.compile(r'[:\\/\?*\[\]]')
+
 def safe_sheetname(name: str, max_len: int = 31) -> str:
-    name = re.sub(r'[:\\/\?*\[\]]', '_', name or 'Sheet')
+    name = _SAFE_SHEET_RE.sub('_', name or 'Sheet')
     return name[:max_len]
 
 def autosize_columns(ws: Worksheet, extra_pad: int = 2, maxw: int = 80) -> None:
-    for col in ws.columns:
-        col_letter = get_column_letter(col[0].column)
-        max_len = 0
-        for cell in col:
+    # uma passagem por linhas (só valores) a acumular o comprimento máximo por coluna
+    widths = [0] * ws.max_column
+    for row in ws.iter_rows(values_only=True):
+        for j, v in enumerate(row):
+            if v is None:
+                continue
             try:
-                val = str(cell.value) if cell.value is not None else ''
+                n = len(str(v))
             except Exception:
-                val = ''
-            max_len = max(max_len, len(val))
-        ws.column_dimensions[col_letter].width = min(max_len + extra_pad, maxw)
+                n = 0
+            if n > widths[j]:
+                widths[j] = n
+    for j, max_len in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(j)].width = min(max_len + extra_pad, maxw)
+
+# -------- estilos partilhados --------
+# Instâncias únicas: o openpyxl regista cada estilo uma vez e as células/regras só guardam o id
+_WRAP_TOP = Alignment(wrap_text=True, vertical="top")
+_FONT_BOLD = Font(bold=True)
+_FONT_MONO = Font(name="Consolas")
+_FONT_LINK = Font(color="0563C1", underline="single")
+_FILL_GREEN = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
+_FILL_GREY = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
+_FILL_YELLOW = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
+_FILL_RED = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+_FILL_BLUE = PatternFill(start_color="CFE2F3", end_color="CFE2F3", fill_type="solid")
+_FILL_PURPLE = PatternFill(start_color="E6E6FA", end_color="E6E6FA", fill_type="solid")
 
 # -------- low-level writers --------
-def insert_table(ws: Worksheet, start_row: int, headers: List[str], rows: List[List[Any]]) -> tuple[int, int]:
+
+def _tap(rows: Iterable[Any], fn: Callable[[Any], None]):
+    for row in rows:
+        fn(row)
+        yield row
+
+def insert_table(ws: Worksheet, start_row: int, headers: List[str], rows: List[List[Any]],
+                 on_row: Callable[[Any], None] | None = None, at_bottom: bool = False) -> tuple[int, int]:
+    """
+    Cabeçalho a negrito em start_row e as linhas por baixo (wrap). Se on_row for dado, é chamado
+    com cada linha à medida que é escrita (ex.: contadores do resumo sem segunda passagem).
+    at_bottom=True: o chamador garante que nada foi escrito abaixo de start_row, e as linhas
+    entram em bloco com ws.append (que escreve a seguir à última linha usada).
+    """
+    n_rows = len(rows)
+    if on_row is not None:
+        rows = _tap(rows, on_row)
     for j, h in enumerate(headers, start=1):
         c = ws.cell(row=start_row, column=j, value=h)
-        c.font = Font(bold=True)
-    for i, row in enumerate(rows, start=start_row + 1):
-        for j, val in enumerate(row, start=1):
-            c = ws.cell(row=i, column=j, value=val)
-            c.alignment = Alignment(wrap_text=True, vertical="top")
-    end_row = start_row + 1 + len(rows)
+        c.font = _FONT_BOLD
+    if at_bottom:
+        append_styled_rows(ws, rows, alignment=_WRAP_TOP)
+    else:
+        for i, row in enumerate(rows, start=start_row + 1):
+            for j, val in enumerate(row, start=1):
+                c = ws.cell(row=i, column=j, value=val)
+                c.alignment = _WRAP_TOP
+    end_row = start_row + 1 + n_rows
     end_col = len(headers)
     return end_row, end_col
 
+def append_styled_rows(ws: Worksheet, rows: Iterable[Iterable[Any]], font: Font | None = None,
+                       alignment: Alignment | None = None) -> None:
+    """
+    ws.append de cada linha com um estilo comum: font/alignment são registados uma só vez
+    no workbook e cada Cell recebe uma cópia do StyleArray (sem ws.cell nem setters por célula).
+    """
+    style = StyleArray()
+    if font is not None:
+        style.fontId = ws.parent._fonts.add(font)
+    if alignment is not None:
+        style.alignmentId = ws.parent._alignments.add(alignment)
+    for row in rows:
+        ws.append([Cell(ws, value=val, style_array=style) for val in row])
+
 def write_kv_table(ws: Worksheet, anchor_row: int, anchor_col: int, title: str, data_pairs: List[tuple]) -> tuple[int, int]:
-    ws.cell(row=anchor_row, column=anchor_col, value=title).font = Font(bold=True)
+    ws.cell(row=anchor_row, column=anchor_col, value=title).font = _FONT_BOLD
     r = anchor_row + 1
     for k, v in data_pairs:
         ws.cell(row=r, column=anchor_col, value=k)
@@ -80,6 +144,17 @@ def chart_pie(ws: Worksheet, title: str, cats_first: str, cats_last: str, vals_f
 from openpyxl.formatting.rule import FormulaRule
 from openpyxl.utils import column_index_from_string
 
+def table_last_row(header_row: int, rows) -> int:
+    """
+    Última linha com conteúdo da tabela que insert_table escreveu com cabeçalho em
+    header_row — o mesmo que _last_row(ws, header_row + 1) devolveria logo a seguir,
+    mas calculado a partir das linhas em memória, sem varrer a folha.
+    """
+    for k in range(len(rows), 0, -1):
+        if any(v not in (None, '') for v in rows[k - 1]):
+            return header_row + k
+    return header_row + 1
+
 def _last_row(ws: Worksheet, start: int) -> int:
     max_r = ws.max_row or start
     for r in range(max_r, start - 1, -1):
@@ -89,132 +164,126 @@ def _last_row(ws: Worksheet, start: int) -> int:
     return start
 
 def _col_letter_by_header(ws: Worksheet, header_row: int, names: set[str]) -> str | None:
-    low = {str(ws.cell(header_row, c).value or '').strip().lower(): c for c in range(1, ws.max_column + 1)}
+    header = next(ws.iter_rows(min_row=header_row, max_row=header_row, values_only=True), ())
+    low = {str(v or '').strip().lower(): c for c, v in enumerate(header, start=1)}
     for want in names:
-        for k, c in low.items():
-            if k == want.lower():
-                from openpyxl.utils import get_column_letter
-                return get_column_letter(c)
+        c = low.get(want.lower())
+        if c:
+            return get_column_letter(c)
     return None
 
-def apply_cf_interfaces(ws: Worksheet, header_row: int = 1) -> None:
+def apply_cf_interfaces(ws: Worksheet, header_row: int = 1, last_row: int | None = None) -> None:
     vlan_col = _col_letter_by_header(ws, header_row, {"vlan"})
     status_col = _col_letter_by_header(ws, header_row, {"status"})
     if not vlan_col or not status_col:
         return
     first = header_row + 1
-    last = _last_row(ws, first)
+    last = last_row if last_row is not None else _last_row(ws, first)
     if last < first:
         return
 
     # Verde na coluna VLAN quando a porta está up/connected e tem VLAN válida (já existia)
-    green_fill_vlan = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
     formula_up_with_vlan = (
         f'AND(OR(ISNUMBER(SEARCH("connected",${status_col}{first})), ISNUMBER(SEARCH("up",${status_col}{first}))),'
         f'AND(NOT(ISBLANK(${vlan_col}{first})), ${vlan_col}{first}<>"-", ${vlan_col}{first}<>"trunk"))'
     )
     ws.conditional_formatting.add(
         f"${vlan_col}{first}:${vlan_col}{last}",
-        FormulaRule(formula=[formula_up_with_vlan], fill=green_fill_vlan)
+        FormulaRule(formula=[formula_up_with_vlan], fill=_FILL_GREEN)
     )
 
     # CINZENTO na coluna Status quando "notconnect"
-    grey_fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
     formula_notconnect = f'ISNUMBER(SEARCH("notconnect",${status_col}{first}))'
     ws.conditional_formatting.add(
         f"${status_col}{first}:${status_col}{last}",
-        FormulaRule(formula=[formula_notconnect], fill=grey_fill)
+        FormulaRule(formula=[formula_notconnect], fill=_FILL_GREY)
     )
 
     # NOVO: VERDE na coluna Status quando "connected"
-    green_fill_status = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
     formula_connected = f'ISNUMBER(SEARCH("connected",${status_col}{first}))'
     ws.conditional_formatting.add(
         f"${status_col}{first}:${status_col}{last}",
-        FormulaRule(formula=[formula_connected], fill=green_fill_status)
+        FormulaRule(formula=[formula_connected], fill=_FILL_GREEN)
     )
 
 
-def apply_cf_vlans(ws: Worksheet, header_row: int = 1) -> None:
+def apply_cf_vlans(ws: Worksheet, header_row: int = 1, last_row: int | None = None) -> None:
     state_col = _col_letter_by_header(ws, header_row, {"status", "state"})
     if not state_col:
         return
     first = header_row + 1
-    last = _last_row(ws, first)
+    last = last_row if last_row is not None else _last_row(ws, first)
     if last < first:
         return
-    green = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-    yellow = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
-    ws.conditional_formatting.add(f"${state_col}{first}:${state_col}{last}", FormulaRule(formula=[f'EXACT(${state_col}{first},"active")'], fill=green))
-    ws.conditional_formatting.add(f"${state_col}{first}:${state_col}{last}", FormulaRule(formula=[f'EXACT(${state_col}{first},"suspend")'], fill=yellow))
+    ws.conditional_formatting.add(f"${state_col}{first}:${state_col}{last}", FormulaRule(formula=[f'EXACT(${state_col}{first},"active")'], fill=_FILL_GREEN))
+    ws.conditional_formatting.add(f"${state_col}{first}:${state_col}{last}", FormulaRule(formula=[f'EXACT(${state_col}{first},"suspend")'], fill=_FILL_YELLOW))
 
-def apply_cf_spanning_tree(ws: Worksheet, header_row: int = 1) -> None:
+def apply_cf_spanning_tree(ws: Worksheet, header_row: int = 1, last_row: int | None = None) -> None:
     state_col = _col_letter_by_header(ws, header_row, {"state", "estado"})
     role_col  = _col_letter_by_header(ws, header_row, {"role", "papel"})
     first = header_row + 1
-    last  = _last_row(ws, first)
+    last  = last_row if last_row is not None else _last_row(ws, first)
 
     # Sem coluna 'state' ou sem linhas -> sair silenciosamente
     if not state_col or last < first:
         return
 
-    green  = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-    yellow = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
-    red    = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-    blue   = PatternFill(start_color="CFE2F3", end_color="CFE2F3", fill_type="solid")
-
     try:
         ws.conditional_formatting.add(
             f"${state_col}{first}:${state_col}{last}",
-            FormulaRule(formula=[f'EXACT(${state_col}{first},"forwarding")'], fill=green)
+            FormulaRule(formula=[f'EXACT(${state_col}{first},"forwarding")'], fill=_FILL_GREEN)
         )
         ws.conditional_formatting.add(
             f"${state_col}{first}:${state_col}{last}",
-            FormulaRule(formula=[f'OR(EXACT(${state_col}{first},"learning"),EXACT(${state_col}{first},"listening"))'], fill=yellow)
+            FormulaRule(formula=[f'OR(EXACT(${state_col}{first},"learning"),EXACT(${state_col}{first},"listening"))'], fill=_FILL_YELLOW)
         )
         ws.conditional_formatting.add(
             f"${state_col}{first}:${state_col}{last}",
-            FormulaRule(formula=[f'EXACT(${state_col}{first},"blocking")'], fill=red)
+            FormulaRule(formula=[f'EXACT(${state_col}{first},"blocking")'], fill=_FILL_RED)
         )
         if role_col:
             ws.conditional_formatting.add(
                 f"${role_col}{first}:${role_col}{last}",
-                FormulaRule(formula=[f'EXACT(${role_col}{first},"root")'], fill=blue)
+                FormulaRule(formula=[f'EXACT(${role_col}{first},"root")'], fill=_FILL_BLUE)
             )
     except Exception:
         # Falha suave para qualquer edge-case de intervalos
         return
 
 
-def mark_portchannels_and_link(ws: Worksheet, header_row: int = 5, target_sheet_title: str = "show etherchannel summary") -> None:
+def mark_portchannels_and_link(ws: Worksheet, header_row: int = 5, target_sheet_title: str = "show etherchannel summary",
+                               last_row: int | None = None) -> None:
     from openpyxl.utils import column_index_from_string
     port_col_letter = _col_letter_by_header(ws, header_row, {"port"})
     if not port_col_letter:
         return
     port_col = column_index_from_string(port_col_letter)
     last_col = ws.max_column
-    purple_fill = PatternFill(start_color="E6E6FA", end_color="E6E6FA", fill_type="solid")
     first = header_row + 1
-    last  = _last_row(ws, first)
+    last  = last_row if last_row is not None else _last_row(ws, first)
     if last < first:
         return
+    # Linha inteira a roxo numa só regra CF (em vez de fill célula a célula);
+    # "port-channel" também começa por "po"
+    ws.conditional_formatting.add(
+        f"$A${first}:${get_column_letter(last_col)}${last}",
+        FormulaRule(formula=[f'LEFT(LOWER(TRIM(${port_col_letter}{first})),2)="po"'], fill=_FILL_PURPLE)
+    )
     ether_sheet = safe_sheetname(target_sheet_title)
-    for r in range(first, last + 1):
-        v = (str(ws.cell(row=r, column=port_col).value).strip().lower()
-             if ws.cell(row=r, column=port_col).value is not None else "")
+    # só a coluna Port, uma célula por linha
+    for (cell,) in ws.iter_rows(min_row=first, max_row=last, min_col=port_col, max_col=port_col):
+        v = str(cell.value).strip().lower() if cell.value is not None else ""
         if v.startswith(("po", "port-channel")):
-            for c in range(1, last_col + 1):
-                ws.cell(row=r, column=c).fill = purple_fill
-            cell = ws.cell(row=r, column=port_col)
             cell.hyperlink = f"#'{ether_sheet}'!A1"
             try:
-                cell.font = Font(color="0563C1", underline="single")
+                cell.font = _FONT_LINK
             except Exception:
                 pass
 
 
 # -------- Resumo (Ideia 5) --------
-def write_resumo_block(ws: Worksheet, title: str, pairs: list[tuple], start_row: int | None = None, start_col: int = 1) -> tuple[int, int]:
+def write_resumo_block(ws: Worksheet, title: str, pairs: list[tuple], start_row: int | None = None, start_col: int = 1,
+                       autosize: bool = True) -> tuple[int, int]:
     """Escreve um bloco 'Resumo' padronizado (Ideia 5).
 
     Args:
@@ -223,6 +292,7 @@ def write_resumo_block(ws: Worksheet, title: str, pairs: list[tuple], start_row:
         pairs: Lista [(chave, valor), ...].
         start_row: Linha inicial; se None, escreve após último conteúdo.
         start_col: Coluna inicial (1=A).
+        autosize: Reajustar larguras no fim; False quando quem chama faz um único autosize da folha.
     Returns:
         (last_row, last_col) posicionamento final do bloco.
     """
@@ -234,40 +304,87 @@ def write_resumo_block(ws: Worksheet, title: str, pairs: list[tuple], start_row:
     else:
         r = start_row
 
-    ws.cell(row=r, column=start_col, value=title).font = Font(bold=True)
+    ws.cell(row=r, column=start_col, value=title).font = _FONT_BOLD
     r += 1
     for k, v in pairs:
         ws.cell(row=r, column=start_col,     value=str(k))
         ws.cell(row=r, column=start_col + 1, value=v)
         r += 1
-    autosize_columns(ws)
+    if autosize:
+        autosize_columns(ws)
     return (r - 1, start_col + 1)
 
 
+# -------- gravação --------
+def save_workbook(wb: Workbook, path: str) -> None:
+    """
+    wb.save para memória e um único write (buffer grande) para um temporário na mesma
+    pasta, depois os.replace: o .xlsx nunca fica meio escrito se a gravação falhar.
+    """
+    buf = io.BytesIO()
+    wb.save(buf)
+    tmp_path = f"{path}.{os.getpid()}.tmp"   # open() normal: respeita a umask (mkstemp criaria 0600)
+    try:
+        with open(tmp_path, "wb", buffering=1 << 20) as f:
+            f.write(buf.getbuffer())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
 #-------------------------------------------------------------------------------
 # -------- Execucao sheet helpers --------
 from datetime import datetime
+from functools import lru_cache
 from openpyxl.workbook import Workbook
 
-_EXEC_PAT = re.compile(r"^(execu[cç][aã]o)_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})$", re.IGNORECASE)
+# Compilado uma vez; grupos numéricos para montar o datetime sem strptime
+_EXEC_PAT = re.compile(r"^(execu[cç][aã]o)_(\d{4})-(\d{2})-(\d{2})_(\d{2})-(\d{2})-(\d{2})$", re.IGNORECASE)
+
+@lru_cache(maxsize=512)
+def _execucao_title_info(title: str) -> Tuple[bool, Optional[datetime]]:
+    """(é sheet de Execução?, datetime ou None) para um título — cache por título."""
+    name = title.strip()
+    m = _EXEC_PAT.match(name)
+    if m:
+        try:
+            return True, datetime(*map(int, m.group(2, 3, 4, 5, 6, 7)))
+        except ValueError:
+            return True, None
+    return name.lower() in ("execução", "execucao"), None
 
 def _list_execucao_sheets(wb: Workbook):
     """Devolve lista de (ws, name, index, dt or None) para sheets Execução_*."""
     out = []
     for idx, ws in enumerate(wb.worksheets):
-        name = ws.title
-        m = _EXEC_PAT.match(name.strip())
-        dt = None
-        if m:
-            try:
-                dt = datetime.strptime(m.group(2), "%Y-%m-%d_%H-%M-%S")
-            except Exception:
-                dt = None
-            out.append((ws, name, idx, dt))
-        elif name.strip().lower() in ("execução", "execucao"):
-            out.append((ws, name, idx, None))
+        is_exec, dt = _execucao_title_info(ws.title)
+        if is_exec:
+            out.append((ws, ws.title, idx, dt))
     return out
 
+def keep_newest_execucao(wb: Workbook) -> int:
+    """
+    Mantém apenas a sheet Execução mais recente, em memória (antes do wb.save),
+    evitando reabrir/regravar o ficheiro só para limpar. Devolve nº de sheets removidas.
+    """
+    execs = _list_execucao_sheets(wb)
+    if len(execs) <= 1:
+        return 0
+    # Mesma ordem de sempre (sem data > com data; depois data; depois posição), mas O(n)
+    newest = max(execs, key=lambda t: (t[3] is None, t[3] or datetime.min, t[2]))[0]
+    removed = 0
+    for ws, _name, _idx, _dt in execs:
+        if ws is not newest:
+            wb.remove(ws)
+            removed += 1
+    if wb.active is None:  # o índice ativo apontava para além das sheets que sobraram
+        wb.active = 0
+    return removed
+
 def _move_sheet_to_index(wb: Workbook, ws, target_index: int):
     """Move a sheet para um índice exato (mantém ordem das restantes)."""
     sheets = wb._sheets  # API interna do openpyxl, estável o suficiente para reordenar
@@ -281,6 +398,20 @@ def _move_sheet_to_index(wb: Workbook, ws, target_index: int):
 # === VLAN helpers (fonte única, reutilizável) ===
 import re as _re
 
+# Separadores de linha do str.splitlines(): o padrão nunca atravessa nenhum, por isso um
+# único finditer ao texto todo dá os mesmos matches que o re.match linha a linha
+_LINE_BREAKS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+_VLAN_ACTIVE_RE = _re.compile(
+    rf"(?:^|(?<=[{_LINE_BREAKS}]))[^\S{_LINE_BREAKS}]*(\d{{1,4}})[^\S{_LINE_BREAKS}]+[^{_LINE_BREAKS}]*?\bactive\b",
+    _re.IGNORECASE,
+)
+
+def _norm_column(rows, idx) -> list[str]:
+    """Coluna idx de rows já normalizada (strip + lower), numa só passagem; '' se faltar a célula."""
+    if idx is None:
+        return [""] * len(rows)
+    return ["" if (idx >= len(r) or r[idx] is None) else str(r[idx]).strip().lower() for r in rows]
+
 def _idx_contains(headers, candidates):
     if not headers:
         return None
@@ -297,25 +428,17 @@ def extract_active_vlans_from_table(headers, rows):
     - tolera cabeçalhos: 'vlan', 'vlan id', 'status'/'state'
     - se não houver coluna de estado, assume ativa (templates minimalistas)
     """
-    active = set()
     if not headers or not rows:
-        return active
+        return set()
     vidx = _idx_contains(headers, ["vlan", "vlan id", "vlan-id"])
     sidx = _idx_contains(headers, ["status", "state"])
-    for r in rows:
-        vid = (str(r[vidx]).strip() if (vidx is not None and vidx < len(r)) else "")
-        st  = (str(r[sidx]).strip().lower() if (sidx is not None and sidx < len(r) and r[sidx]) else "")
-        if vid.isdigit() and (("active" in st) or (sidx is None)):
-            active.add(vid)
-    return active
+    vids = _norm_column(rows, vidx)
+    if sidx is None:
+        return {vid for vid in vids if vid.isdigit()}
+    return {vid for vid, st in zip(vids, _norm_column(rows, sidx)) if vid.isdigit() and "active" in st}
 
 def extract_active_vlans_from_raw(raw_text):
     """Fallback: procura linhas com 'active' no texto bruto do 'show vlan brief'."""
-    active = set()
     if not raw_text:
-        return active
-    for ln in str(raw_text).splitlines():
-        m = _re.match(r"\s*(\d{1,4})\s+.*?\bactive\b", ln, flags=_re.IGNORECASE)
-        if m:
-            active.add(m.group(1))
-    return active
+        return set()
+    return {m.group(1) for m in _VLAN_ACTIVE_RE.finditer(str(raw_text))}
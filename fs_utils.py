@@ -0,0 +1,20 @@
+# clean_switch/fs_utils.py
+from __future__ import annotations
+import os
+from typing import Set
+
+# Diretórios já garantidos neste processo (não voltar sequer a fazer stat)
+_ENSURED_DIRS: Set[str] = set()
+
+def ensure_dir(path: str) -> str:
+    """
+    Equivalente a os.makedirs(path, exist_ok=True), mas no caminho comum (pasta já
+    existe) custa um único stat — e zero, se já foi garantida neste processo.
+    Devolve o próprio 'path'.
+    """
+    if path in _ENSURED_DIRS:
+        return path
+    if not os.path.isdir(path):
+        os.makedirs(path, exist_ok=True)
+    _ENSURED_DIRS.add(path)
+    return path
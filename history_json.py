@@ -4,89 +4,337 @@
 # Utilitários para guardar/ler "snapshots" (as tuplas (cmd, raw, headers, rows))
 # em JSON, com retenção e APIs simples para obter as duas últimas execuções.
 
-import os, json, tempfile, shutil
+import os, json, tempfile, shutil, hashlib, re
 from typing import List, Tuple, Dict, Any, Optional
 import logging
 
+from clean_switch.fs_utils import ensure_dir
+
+try:
+    import orjson as _orjson  # opcional: serialização JSON bem mais rápida
+except ImportError:
+    _orjson = None
+try:
+    import msgpack as _msgpack  # opcional: snapshots binários (fmt="msgpack")
+    import zstandard as _zstd
+except ImportError:
+    _msgpack = _zstd = None
+
+log = logging.getLogger("clean_switch.history_json")
+
+# Extensões de snapshot reconhecidas (o nome antes da extensão é o timestamp)
+SNAPSHOT_EXTS = (".json", ".msgpack.zst")
+
 CollectedType = List[Tuple[str, str, List[str], List[List[str]]]]
 
 def _host_hist_dir(base_dir: str, hostname: str) -> str:
-    """Pasta de histórico por host: <base_dir>/_history/<hostname>"""
-    p = os.path.join(base_dir, "_history", hostname)
-    os.makedirs(p, exist_ok=True)
-    return p
+    """Pasta de histórico por host: <base_dir>/_history/<hostname> (criada 1x por processo)"""
+    return ensure_dir(os.path.join(base_dir, "_history", hostname))
 
 def snapshot_path(base_dir: str, hostname: str, ts: str) -> str:
     """Caminho do ficheiro JSON para um timestamp (YYYY-mm-dd_HH-MM-SS)."""
     return os.path.join(_host_hist_dir(base_dir, hostname), f"{ts}.json")
 
+def _snapshot_ts(name: str) -> Optional[str]:
+    """Timestamp de um nome de snapshot ('<ts>.json' / '<ts>.msgpack.zst'), ou None se não for snapshot."""
+    if name.startswith("snap_"):
+        return None  # temporário de uma gravação em curso
+    for ext in SNAPSHOT_EXTS:
+        if name.endswith(ext):
+            return name[:-len(ext)]
+    return None
+
+# Listagens por pasta: {pasta: (st_mtime_ns, [(ts, nome)])}. Criar/apagar ficheiros muda o mtime
+# da pasta, por isso uma entrada com o mesmo mtime continua válida; as nossas gravações invalidam-na já.
+_SCAN_CACHE: Dict[str, Tuple[int, List[Tuple[str, str]]]] = {}
+
+def _scan_snapshots(d: str) -> List[Tuple[str, str]]:
+    """[(ts, nome)] ordenado por ts; com o mesmo ts em dois formatos fica o binário. Não alterar a lista devolvida."""
+    mtime = os.stat(d).st_mtime_ns
+    hit = _SCAN_CACHE.get(d)
+    if hit is not None and hit[0] == mtime:
+        return hit[1]
+    by_ts: Dict[str, str] = {}
+    with os.scandir(d) as it:
+        for e in it:
+            ts = _snapshot_ts(e.name)
+            if ts is not None and e.is_file() and (ts not in by_ts or not e.name.endswith(".json")):
+                by_ts[ts] = e.name
+    snaps = sorted(by_ts.items())
+    _SCAN_CACHE[d] = (mtime, snaps)
+    return snaps
+
 def list_snapshots(base_dir: str, hostname: str) -> List[str]:
-    """Lista de caminhos (ordenados por ts) dos snapshots existentes do host."""
+    """Lista de caminhos (ordenados por ts) dos snapshots existentes do host (JSON e msgpack+zstd)."""
     d = _host_hist_dir(base_dir, hostname)
-    files = [os.path.join(d, f) for f in os.listdir(d) if f.endswith(".json")]
-    files.sort(key=lambda p: os.path.basename(p).split(".json")[0])
-    return files
+    return [os.path.join(d, name) for _ts, name in _scan_snapshots(d)]
+
+def load_json_file(path: str) -> Any:
+    """
+    Lê um ficheiro JSON (bytes -> orjson se estiver instalado; senão json da stdlib).
+    Conteúdo que o orjson recusa mas a stdlib aceita (NaN/Infinity) volta a passar pela stdlib.
+    """
+    with open(path, "rb") as f:
+        buf = f.read()
+    if _orjson is not None:
+        try:
+            return _orjson.loads(buf)
+        except _orjson.JSONDecodeError:
+            pass
+    return json.loads(buf.decode("utf-8"))
 
 def load_snapshot(path: str) -> Dict[str, Any]:
-    """Lê um snapshot JSON do disco."""
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """Lê um snapshot do disco (formato pela extensão: .json ou .msgpack.zst)."""
+    if path.endswith(".msgpack.zst"):
+        if _msgpack is None:
+            raise ImportError("Snapshot .msgpack.zst requer msgpack e zstandard (pip install msgpack zstandard)")
+        with open(path, "rb") as f:
+            # decompressobj: frames gravados em stream não trazem o tamanho no cabeçalho
+            return _msgpack.unpackb(_zstd.ZstdDecompressor().decompressobj().decompress(f.read()),
+                                   raw=False, strict_map_key=False)
+    return load_json_file(path)
 
-def _to_jsonable(collected: CollectedType) -> List[Dict[str, Any]]:
-    """Converte a lista de tuplos para uma estrutura serializável."""
-    out: List[Dict[str, Any]] = []
+def _snapshot_items(collected: CollectedType):
+    """Itens serializáveis do snapshot, um de cada vez (sem montar a lista toda em memória)."""
     for cmd, raw, headers, rows in collected:
-        out.append({
+        yield {
             "cmd": cmd,
             "raw": raw,
             "headers": headers or [],
             "rows": rows or []
-        })
-    return out
+        }
+
+def _encode_json(data: Any) -> bytes:
+    payload = None
+    if _orjson is not None:
+        try:
+            payload = _orjson.dumps(data, option=_orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            payload = None  # tipo que o orjson não suporta -> json da stdlib
+    if payload is None:
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return payload
+
+def _pack_snapshot(data: Dict[str, Any]) -> bytes:
+    return _zstd.ZstdCompressor(level=3).compress(_msgpack.packb(data, use_bin_type=True))
+
+def _stream_json(f, hostname: str, ts: str, collected: CollectedType, meta: Dict[str, Any]) -> None:
+    """Mesmo JSON compacto que dumps() do dicionário inteiro, escrito item a item."""
+    f.write(b'{"hostname":' + _encode_json(hostname) + b',"timestamp":' + _encode_json(ts) + b',"items":[')
+    for i, item in enumerate(_snapshot_items(collected)):
+        if i:
+            f.write(b",")
+        f.write(_encode_json(item))
+    f.write(b'],"meta":' + _encode_json(meta) + b"}")
+
+def _stream_msgpack(f, hostname: str, ts: str, collected: CollectedType, meta: Dict[str, Any]) -> None:
+    """Mesmo mapa que packb() do dicionário inteiro, empacotado item a item para dentro do zstd."""
+    packer = _msgpack.Packer(use_bin_type=True)
+    with _zstd.ZstdCompressor(level=3).stream_writer(f, closefd=False) as z:
+        z.write(packer.pack_map_header(4))
+        z.write(packer.pack("hostname") + packer.pack(hostname) + packer.pack("timestamp") + packer.pack(ts))
+        z.write(packer.pack("items") + packer.pack_array_header(len(collected)))
+        for item in _snapshot_items(collected):
+            z.write(packer.pack(item))
+        z.write(packer.pack("meta") + packer.pack(meta))
+
+def _write_atomic(d: str, dst: str, write) -> None:
+    """Grava via write(f) num temporário da mesma pasta e renomeia para 'dst'."""
+    tmp_fd, tmp_path = tempfile.mkstemp(prefix="snap_", suffix=".tmp", dir=d)
+    try:
+        with os.fdopen(tmp_fd, "wb") as f:
+            write(f)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    # gravação atómica
+    shutil.move(tmp_path, dst)
+    _SCAN_CACHE.pop(d, None)
+
+def _migrate_json_snapshots(d: str, names: List[str]) -> None:
+    """Regrava como .msgpack.zst os snapshots .json que ficam na retenção (uma vez por ficheiro)."""
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        src = os.path.join(d, name)
+        try:
+            payload = _pack_snapshot(load_json_file(src))
+            _write_atomic(d, src[:-len(".json")] + ".msgpack.zst", lambda f: f.write(payload))
+            os.remove(src)
+            _SCAN_CACHE.pop(d, None)
+        except Exception as e:
+            log.debug("history: não foi possível migrar %s: %s", src, e)
 
 def save_snapshot(base_dir: str, hostname: str, ts: str,
                   collected: CollectedType, meta: Optional[Dict[str, Any]] = None,
-                  max_keep: int = 10) -> str:
+                  max_keep: int = 10, fmt: str = "json") -> str:
     """
-    Guarda o snapshot atual como JSON (write-then-rename para segurança).
+    Guarda o snapshot atual (write-then-rename para segurança).
+    fmt="json": JSON compacto (orjson se estiver instalado; senão json da stdlib).
+    fmt="msgpack": MessagePack comprimido com zstd (.msgpack.zst), bem mais pequeno; requer
+    msgpack + zstandard (sem eles grava JSON). Os .json antigos que ficam na retenção são
+    convertidos nessa gravação.
+    meta["derived"] guarda as VLANs e a contagem 'connected' usadas por simple_diff.
     Retém apenas os 'max_keep' mais recentes.
-    Devolve o caminho final do ficheiro JSON criado.
+    Devolve o caminho final do ficheiro criado.
     """
-    dst = snapshot_path(base_dir, hostname, ts)
-    tmp_fd, tmp_path = tempfile.mkstemp(prefix="snap_", suffix=".json",
-                                        dir=_host_hist_dir(base_dir, hostname))
-    os.close(tmp_fd)
-    data = {
-        "hostname": hostname,
-        "timestamp": ts,
-        "items": _to_jsonable(collected),
-        "meta": meta or {}
-    }
-    with open(tmp_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    # gravação atómica
-    shutil.move(tmp_path, dst)
+    d = _host_hist_dir(base_dir, hostname)
+    meta = meta or {}
+    try:
+        # VLANs/'connected' já calculados: simple_diff deixa de varrer as linhas deste snapshot
+        meta = {**meta, "derived": _derived_stats(_snapshot_items(collected))}
+    except Exception as e:
+        log.debug("history: sem meta.derived para %s: %s", hostname, e)
+    if fmt == "msgpack" and _msgpack is None:
+        log.warning("Snapshots msgpack requerem msgpack e zstandard (pip install msgpack zstandard); a gravar JSON.")
+        fmt = "json"
+    if fmt == "msgpack":
+        dst = os.path.join(d, f"{ts}.msgpack.zst")
+        _write_atomic(d, dst, lambda f: _stream_msgpack(f, hostname, ts, collected, meta))
+    else:
+        dst = os.path.join(d, f"{ts}.json")
+        _write_atomic(d, dst, lambda f: _stream_json(f, hostname, ts, collected, meta))
 
-    # retenção
-    files = list_snapshots(base_dir, hostname)
-    if len(files) > max_keep:
-        for old in files[0:len(files)-max_keep]:
+    # retenção (nomes = timestamps, ordenáveis como texto)
+    snaps = _scan_snapshots(d)
+    keep_from = max(0, len(snaps) - max_keep)
+    for old_ts, _name in snaps[:keep_from]:
+        for ext in SNAPSHOT_EXTS:
             try:
-                os.remove(old)
+                os.remove(os.path.join(d, old_ts + ext))
             except OSError:
                 pass
+    _SCAN_CACHE.pop(d, None)
+    if fmt == "msgpack":
+        _migrate_json_snapshots(d, [name for _ts, name in snaps[keep_from:]])
     return dst
 
+# Linhas que mudam a cada recolha sem haver alteração real no switch
+_VOLATILE_RE = re.compile(r"(?im)^.*\b(?:uptime is|holdtime|hold time|time remaining|system restarted at)\b.*$")
+
+def collected_digest(collected: CollectedType) -> str:
+    """
+    Impressão digital (blake2b, 16 bytes) do texto bruto recolhido, ignorando linhas
+    voláteis (uptime, holdtime CDP/LLDP...). Igual ao da corrida anterior = nada mudou.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for cmd, raw, _headers, _rows in collected:
+        if isinstance(raw, (bytes, bytearray)):
+            raw = raw.decode("utf-8", "replace")
+        text = "" if raw is None else str(raw)
+        h.update((cmd or "").encode("utf-8"))
+        h.update(b"\0")
+        h.update(_VOLATILE_RE.sub("", text).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _latest_hash_path(base_dir: str, hostname: str) -> str:
+    return os.path.join(_host_hist_dir(base_dir, hostname), "latest.hash")
+
+def _read_hash(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="ascii") as f:
+            return f.read().strip() or None
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def _write_hash(path: str, digest: str) -> None:
+    """Grava um sidecar de digest (write-then-rename)."""
+    tmp_fd, tmp_path = tempfile.mkstemp(prefix="hash_", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    with os.fdopen(tmp_fd, "w", encoding="ascii") as f:
+        f.write(digest)
+    os.replace(tmp_path, path)
+
+def read_latest_hash(base_dir: str, hostname: str) -> Optional[str]:
+    """Digest do último snapshot gravado (sidecar latest.hash) ou None."""
+    return _read_hash(_latest_hash_path(base_dir, hostname))
+
+def write_latest_hash(base_dir: str, hostname: str, digest: str) -> None:
+    """Grava o sidecar latest.hash (write-then-rename)."""
+    _write_hash(_latest_hash_path(base_dir, hostname), digest)
+
+# O Excel tem o seu próprio sidecar (<xlsx>.hash): o snapshot pode ter sido gravado
+# sem Excel (--no-excel) ou o Excel pode ter falhado depois do snapshot.
+def read_excel_hash(xlsx_path: str) -> Optional[str]:
+    """Digest dos dados a partir dos quais o xlsx foi gerado, ou None (sem sidecar / xlsx em falta)."""
+    if not os.path.exists(xlsx_path):
+        return None
+    return _read_hash(xlsx_path + ".hash")
+
+def write_excel_hash(xlsx_path: str, digest: Optional[str]) -> None:
+    """Grava o sidecar do xlsx; digest None apaga-o (xlsx a regenerar / estado desconhecido)."""
+    if digest is None:
+        try:
+            os.remove(xlsx_path + ".hash")
+        except FileNotFoundError:
+            pass
+        return
+    _write_hash(xlsx_path + ".hash", digest)
+
+def outputs_unchanged(base_dir: str, hostname: str, xlsx_path: str, digest: str,
+                      force: bool = False) -> Tuple[bool, bool]:
+    """(snapshot, xlsx) já gerados a partir deste digest? force=True trata ambos como desatualizados."""
+    if force:
+        return False, False
+    return digest == read_latest_hash(base_dir, hostname), digest == read_excel_hash(xlsx_path)
+
 def get_last_two(base_dir: str, hostname: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
     """
     Devolve (prev, curr) snapshots como dicionários, ou (None, None) se não houver.
     """
-    files = list_snapshots(base_dir, hostname)
-    if not files:
+    d = _host_hist_dir(base_dir, hostname)
+    last = [os.path.join(d, name) for _ts, name in _scan_snapshots(d)[-2:]]  # já ordenado (cache)
+    if not last:
         return None, None
-    if len(files) == 1:
-        return None, load_snapshot(files[-1])
-    return load_snapshot(files[-2]), load_snapshot(files[-1])
+    if len(last) == 1:
+        return None, load_snapshot(last[-1])
+    return load_snapshot(last[-2]), load_snapshot(last[-1])
+
+_CONNECTED = frozenset(("connected", "up"))
+
+def _item_vlans(item: Dict[str, Any]) -> set:
+    """VLANs observadas num item ('show vlan brief' e/ou coluna VLAN em 'interfaces status')."""
+    headers = [h.lower() for h in item.get("headers", [])]
+    if "vlan" not in headers:
+        return set()
+    cmd = item.get("cmd", "").lower()
+    if "show vlan brief" not in cmd and "show interfaces status" not in cmd:
+        return set()
+    idx = headers.index("vlan")
+    # isdigit() já exclui '' (o 'v and' do ramo 'interfaces status' não muda nada)
+    vals = [str(r[idx]).strip() for r in item.get("rows", [])]
+    return {v for v in vals if v.isdigit()}
+
+def _item_connected(item: Dict[str, Any]) -> int:
+    """Nº de linhas com Status 'connected'/'up' (aproximação)."""
+    headers = [h.lower() for h in item.get("headers", [])]
+    rows = item.get("rows", [])
+    if "status" not in headers:
+        return 0
+    sidx = headers.index("status")
+    return sum(1 for r in rows if sidx < len(r) and str(r[sidx]).lower().strip() in _CONNECTED)
+
+def _derived_stats(items) -> Dict[str, Any]:
+    """O que simple_diff precisa de um snapshot: {"vlans": [...], "connected": n}."""
+    vlans: set = set()
+    iface: Dict[str, Any] = {}
+    for it in items:
+        vlans |= _item_vlans(it)
+        if it["cmd"].lower() == "show interfaces status":
+            iface = it  # como no mapa por comando de simple_diff: o último ganha
+    return {"vlans": sorted(vlans), "connected": _item_connected(iface)}
+
+def _snapshot_stats(snap: Dict[str, Any]) -> Tuple[set, int]:
+    """(VLANs, connected) do snapshot: de meta.derived (gravado por save_snapshot) ou recalculado dos items."""
+    meta = snap.get("meta")
+    derived = meta.get("derived") if isinstance(meta, dict) else None
+    if not (isinstance(derived, dict) and isinstance(derived.get("vlans"), list)
+            and isinstance(derived.get("connected"), int)):
+        derived = _derived_stats(snap.get("items", []))
+    return set(derived["vlans"]), derived["connected"]
 
 def simple_diff(prev: Dict[str, Any], curr: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -94,6 +342,7 @@ def simple_diff(prev: Dict[str, Any], curr: Dict[str, Any]) -> Dict[str, Any]:
       - nº linhas por comando,
       - conjunto de VLANs observadas,
       - contagem de interfaces 'connected' (aprox).
+    VLANs e 'connected' vêm de meta.derived quando o snapshot o tem (sem voltar a varrer as linhas).
     Isto serve apenas como apoio rápido; a tua Ideia 6 continua a liderar a comparação Excel↔Excel.
     """
     def by_cmd_map(snap):
@@ -112,54 +361,11 @@ def simple_diff(prev: Dict[str, Any], curr: Dict[str, Any]) -> Dict[str, Any]:
         c = len(cmap.get(cmd, {}).get("rows", []))
         dif["rows_delta"][cmd] = {"prev": p, "curr": c, "delta": c - p}
 
-    # VLANs observadas (por 'show vlan brief' e/ou colunas VLAN em 'interfaces status')
-    def extract_vlans(item: Dict[str, Any]) -> set:
-        vlans = set()
-        headers = [h.lower() for h in item.get("headers", [])]
-        rows = item.get("rows", [])
-        if "show vlan brief" in item.get("cmd", "").lower():
-            idx = headers.index("vlan") if "vlan" in headers else None
-            if idx is not None:
-                for r in rows:
-                    v = str(r[idx]).strip()
-                    if v.isdigit():
-                        vlans.add(v)
-        if "show interfaces status" in item.get("cmd", "").lower():
-            if "vlan" in headers:
-                idx = headers.index("vlan")
-                for r in rows:
-                    v = str(r[idx]).strip()
-                    if v and v.isdigit():
-                        vlans.add(v)
-        return vlans
-
-    def vlanset(snap):
-        all_v = set()
-        for it in snap.get("items", []):
-            all_v |= extract_vlans(it)
-        return all_v
-
-    prev_v, curr_v = vlanset(prev), vlanset(curr)
+    # VLANs observadas + 'connected' em interfaces (aproximação)
+    prev_v, p_conn = _snapshot_stats(prev)
+    curr_v, c_conn = _snapshot_stats(curr)
     dif["vlans_added"] = sorted(curr_v - prev_v, key=int)
     dif["vlans_removed"] = sorted(prev_v - curr_v, key=int)
-
-    # 'connected' em interfaces (aproximação)
-    def count_connected(item: Dict[str, Any]) -> int:
-        headers = [h.lower() for h in item.get("headers", [])]
-        rows = item.get("rows", [])
-        if "status" not in headers:
-            return 0
-        sidx = headers.index("status")
-        n = 0
-        for r in rows:
-            st = str(r[sidx]).lower().strip() if sidx < len(r) else ""
-            if st in ("connected", "up"):
-                n += 1
-        return n
-
-    p_conn = count_connected(pmap.get("show interfaces status", {}))
-    c_conn = count_connected(cmap.get("show interfaces status", {}))
     dif["interfaces_connected_delta"] = {"prev": p_conn, "curr": c_conn, "delta": c_conn - p_conn}
 
     return dif
-
@@ -0,0 +1,71 @@
+# clean_switch/hostmap.py
+from __future__ import annotations
+import hashlib, json, logging, os
+from typing import Any, Dict
+
+try:
+    import orjson as _orjson  # opcional: (de)serialização JSON mais rápida
+except ImportError:
+    _orjson = None
+
+log = logging.getLogger("clean_switch.hostmap")
+
+def _cache_path(path: str) -> str:
+    """~/.cache/clean_switch/hostmap-<sha1(caminho absoluto)>.json (respeita XDG_CACHE_HOME)."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(base, "clean_switch", f"hostmap-{digest}.json")
+
+def _dumps(obj: Any) -> bytes:
+    if _orjson is not None:
+        return _orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+def _loads(buf: bytes) -> Any:
+    return _orjson.loads(buf) if _orjson is not None else json.loads(buf)
+
+def load_hostmap(path: str) -> Dict[str, str]:
+    """
+    Lê o YAML DeviceID→IP do --hostmap.
+
+    O resultado fica em cache (JSON {"stamp": [st_mtime_ns, st_size], "map": {...}}) chaveado
+    pelo stat do YAML: enquanto o ficheiro não mudar, as corridas seguintes não voltam a fazer parse.
+    Só se guarda em cache um mapa str→str (o que o JSON devolve igual ao YAML).
+    Lança ImportError se for preciso fazer parse e o PyYAML não estiver instalado.
+    """
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cache = _cache_path(path)
+
+    try:
+        with open(cache, "rb") as f:
+            cached = _loads(f.read())
+        if cached.get("stamp") == list(stamp) and isinstance(cached.get("map"), dict):
+            log.debug("hostmap: cache hit (%s)", cache)
+            return cached["map"]
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.debug("hostmap: cache ignorada (%s): %s", cache, e)
+
+    import yaml  # type: ignore
+    try:
+        from yaml import CSafeLoader as _Loader  # libyaml (C), bem mais rápido
+    except ImportError:
+        from yaml import SafeLoader as _Loader  # type: ignore
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.load(f, Loader=_Loader) or {}
+
+    if not (isinstance(data, dict) and all(isinstance(k, str) and isinstance(v, str) for k, v in data.items())):
+        return data  # o JSON não devolveria o mesmo (chaves/valores não-string): sem cache
+
+    # Gravar cache (atómico); falhar aqui nunca impede o crawl
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        tmp = f"{cache}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_dumps({"stamp": list(stamp), "map": data}))
+        os.replace(tmp, cache)
+    except Exception as e:
+        log.debug("hostmap: não foi possível gravar cache %s: %s", cache, e)
+    return data
@@ -13,20 +13,22 @@ Módulo: ideia6_features.py (rev C)
 from __future__ import annotations
 
 import datetime as _dt
-import json
 import os
 import re as _re
+import weakref
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
 import logging
 
 
-from history_json import get_last_two, simple_diff  # reaproveitado
+from history_json import get_last_two, simple_diff, load_json_file  # reaproveitado
 from openpyxl import load_workbook, Workbook
 from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.utils import get_column_letter
 from openpyxl.styles import Font, Alignment
 from openpyxl.formatting.rule import CellIsRule
-from clean_switch.excel_utils import extract_active_vlans_from_table, extract_active_vlans_from_raw
+from clean_switch.excel_utils import extract_active_vlans_from_table, extract_active_vlans_from_raw, keep_newest_execucao, _list_execucao_sheets, save_workbook, append_styled_rows, _FONT_BOLD
 
 
 
@@ -50,26 +52,45 @@ class ExecMetrics:
 
 IDEA6_EXECUTED: List[str] = []
 
+# 'show version': versão e uptime aparecem nas primeiras linhas
+_RE_VERSION = _re.compile(r"Version\s+([\w.\(\)]+)")
+_RE_UPTIME = _re.compile(r"[Uu]ptime is ([^\n]+)")
+_VERSION_HEAD = 4096
+
+
+def _search_head(rx: _re.Pattern, text: str):
+    """
+    rx.search(text), procurando primeiro só nos primeiros _VERSION_HEAD caracteres.
+    Um match que termina antes do limite é o mesmo que no texto todo; se não houver
+    match ou ele tocar no limite (podia ser mais comprido), procura no texto todo.
+    """
+    m = rx.search(text, 0, _VERSION_HEAD)
+    if m is not None and m.end() < _VERSION_HEAD:
+        return m
+    return rx.search(text)
+
 
 def _mark_executed(func_name: str) -> None:
     IDEA6_EXECUTED.append(func_name)
 
 
+# Caracteres proibidos em nomes de folha -> '-' e acentos PT -> letra base; tudo 1:1,
+# por isso um único str.translate (em C) faz o trabalho do re.sub + ~40 replace()
+_SHEET_NAME_TABLE = str.maketrans({
+    **dict.fromkeys(':\\/?*[]', "-"),
+    "ç": "c", "Ç": "C",
+    "ã": "a", "Ã": "A",
+    "õ": "o", "Õ": "O",
+    "á": "a", "à": "a", "â": "a", "ä": "a", "Á": "A", "À": "A", "Â": "A", "Ä": "A",
+    "é": "e", "è": "e", "ê": "e", "ë": "e", "É": "E", "È": "E", "Ê": "E", "Ë": "E",
+    "í": "i", "ì": "i", "î": "i", "ï": "i", "Í": "I", "Ì": "I", "Î": "I", "Ï": "I",
+    "ó": "o", "ò": "o", "ô": "o", "ö": "o", "Ó": "O", "Ò": "O", "Ô": "O", "Ö": "O",
+    "ú": "u", "ù": "u", "û": "u", "ü": "u", "Ú": "U", "Ù": "U", "Û": "U", "Ü": "U",
+})
+
+
 def ideia6_safe_sheet_name(name: str, max_len: int = 31) -> str:
-    invalid = r'[:\\/?*\[\]]'
-    safe = _re.sub(invalid, "-", name)
-    replacements = {
-        "ç": "c", "Ç": "C",
-        "ã": "a", "Ã": "A",
-        "õ": "o", "Õ": "O",
-        "á": "a", "à": "a", "â": "a", "ä": "a", "Á": "A", "À": "A", "Â": "A", "Ä": "A",
-        "é": "e", "è": "e", "ê": "e", "ë": "e", "É": "E", "È": "E", "Ê": "E", "Ë": "E",
-        "í": "i", "ì": "i", "î": "i", "ï": "i", "Í": "I", "Ì": "I", "Î": "I", "Ï": "I",
-        "ó": "o", "ò": "o", "ô": "o", "ö": "o", "Ó": "O", "Ò": "O", "Ô": "O", "Ö": "O",
-        "ú": "u", "ù": "u", "û": "u", "ü": "u", "Ú": "U", "Ù": "U", "Û": "U", "Ü": "U",
-    }
-    for a, b in replacements.items():
-        safe = safe.replace(a, b)
+    safe = name.translate(_SHEET_NAME_TABLE)
     if len(safe) > max_len:
         safe = safe[:max_len]
     _mark_executed("ideia6_safe_sheet_name")
@@ -77,26 +98,47 @@ def ideia6_safe_sheet_name(name: str, max_len: int = 31) -> str:
 
 
 def ideia6_autosize_columns(ws: Worksheet, min_width: int = 10, max_width: int = 60) -> None:
-    for col_cells in ws.columns:
-        max_len = 0
-        col_letter = col_cells[0].column_letter
-        for c in col_cells:
+    # uma passagem por linhas (só valores); ws.columns lia célula a célula (e criava as vazias)
+    widths: List[int] = []  # folha vazia: iter_rows não devolve nada e não se mexe em larguras
+    for row in ws.iter_rows(values_only=True):
+        if not widths:
+            widths = [0] * len(row)
+        for j, v in enumerate(row):
+            if v is None:
+                continue
             try:
-                val = str(c.value) if c.value is not None else ""
+                n = len(str(v))
             except Exception:
-                val = ""
-            max_len = max(max_len, len(val))
-        ws.column_dimensions[col_letter].width = max(min_width, min(max_width, max_len + 2))
+                n = 0
+            if n > widths[j]:
+                widths[j] = n
+    for j, max_len in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(j)].width = max(min_width, min(max_width, max_len + 2))
     _mark_executed("ideia6_autosize_columns")
 
 
-def _find_entry(collected: Sequence[Tuple[str, Optional[Sequence[str]], Optional[Sequence[Sequence[str]]], Union[str, Sequence[str]]]], key: str):
-    key_low = key.lower()
+def _vlan_sort_key(x: str) -> Tuple[int, Any]:
+    """Numéricas primeiro, por valor; o resto depois, por texto (listas mistas não rebentam no sort)."""
+    return (0, int(x)) if x.isdigit() else (1, x)
+
+
+def _find_entries(collected: Sequence[Tuple[str, Optional[Sequence[str]], Optional[Sequence[Sequence[str]]], Union[str, Sequence[str]]]],
+                  *keys: str) -> Dict[str, Any]:
+    """
+    {key: 1º item cujo comando contém key (sem distinguir maiúsculas), ou None}, numa
+    única passagem por 'collected' (cada comando é passado a minúsculas uma só vez).
+    """
+    found: Dict[str, Any] = dict.fromkeys(keys)
+    pending = [(k, k.lower()) for k in keys]
     for item in collected:
+        if not pending:
+            break
         cmd = item[0].lower()
-        if key_low in cmd:
-            return item
-    return None
+        for key, key_low in pending[:]:
+            if key_low in cmd:
+                found[key] = item
+                pending.remove((key, key_low))
+    return found
 
 
 def _as_text(raw: Union[str, Sequence[str], None]) -> str:
@@ -107,8 +149,8 @@ def _as_text(raw: Union[str, Sequence[str], None]) -> str:
         return raw
     if isinstance(raw, (list, tuple)):
         try:
-            return "\n".join(str(x) for x in raw)
-        except Exception:
+            return "\n".join(raw)  # caso normal: só strings (join em C, sem str() por elemento)
+        except TypeError:
             return "\n".join(map(str, raw))
     return str(raw)
 
@@ -129,7 +171,8 @@ def ideia6_extract_metrics(collected: Sequence[Tuple[str, Optional[Sequence[str]
     ios_version = ""
     uptime = ""
 
-    ent_int = _find_entry(collected, "show interfaces status")
+    entries = _find_entries(collected, "show interfaces status", "show vlan brief", "show version")
+    ent_int = entries["show interfaces status"]
     if ent_int:
         _, headers, rows, raw = ent_int
         raw_text = _as_text(raw)
@@ -153,7 +196,7 @@ def ideia6_extract_metrics(collected: Sequence[Tuple[str, Optional[Sequence[str]
             up_if = sum(1 for ln in data_lines if "connected" in ln.lower() or " up " in ln.lower())
             down_if = max(0, total_if - up_if)
 
-    ent_vlan = _find_entry(collected, "show vlan brief")
+    ent_vlan = entries["show vlan brief"]
     if ent_vlan:
         _, headers, rows, raw = ent_vlan
         raw_text = _as_text(raw)
@@ -163,14 +206,14 @@ def ideia6_extract_metrics(collected: Sequence[Tuple[str, Optional[Sequence[str]
         vlans = set(vset)   # agora são apenas as VLANs ATIVAS (e consistentes com o Excel)
 
 
-    ent_ver = _find_entry(collected, "show version")
+    ent_ver = entries["show version"]
     if ent_ver:
         _, _headers, _rows, raw = ent_ver
         raw_text = _as_text(raw)
-        m = _re.search(r"Version\s+([\w.\(\)]+)", raw_text)
+        m = _search_head(_RE_VERSION, raw_text)
         if m:
             ios_version = m.group(1)
-        m2 = _re.search(r"[Uu]ptime is ([^\n]+)", raw_text)
+        m2 = _search_head(_RE_UPTIME, raw_text)
         if m2:
             uptime = m2.group(1).strip()
 
@@ -190,11 +233,14 @@ def ideia6_extract_metrics(collected: Sequence[Tuple[str, Optional[Sequence[str]
     return metrics
 
 
-def _write_kv(ws: Worksheet, row: int, key: str, value: str, key_w: int = 18) -> int:
+def _write_kv(ws: Worksheet, row: int, key: str, value: str, key_w: int = 18,
+              written: Optional[Dict[str, str]] = None) -> int:
     ws.cell(row=row, column=1, value=key).font = Font(bold=True)
     ws.cell(row=row, column=1).alignment = Alignment(horizontal="left")
     ws.cell(row=row, column=2, value=value)
     ws.column_dimensions["A"].width = key_w
+    if written is not None:
+        written.setdefault(key.strip().lower(), _kv_value(value))
     return row + 1
 
 
@@ -206,80 +252,102 @@ def ideia6_write_execution_sheet(wb: Workbook, m: ExecMetrics) -> Worksheet:
     else:
         ws = wb.create_sheet(title=sheet_name)
 
+    kv: Dict[str, str] = {}  # o que _collect_all_metrics_from_wb leria desta folha
     r = 1
-    r = _write_kv(ws, r, "Hostname", m.host or "")
-    r = _write_kv(ws, r, "IP", m.ip or "")
-    r = _write_kv(ws, r, "Data/Hora", m.timestamp)
-    r = _write_kv(ws, r, "Versão IOS", m.ios_version or "N/D")
-    r = _write_kv(ws, r, "Uptime", m.uptime or "N/D")
+    r = _write_kv(ws, r, "Hostname", m.host or "", written=kv)
+    r = _write_kv(ws, r, "IP", m.ip or "", written=kv)
+    r = _write_kv(ws, r, "Data/Hora", m.timestamp, written=kv)
+    r = _write_kv(ws, r, "Versão IOS", m.ios_version or "N/D", written=kv)
+    r = _write_kv(ws, r, "Uptime", m.uptime or "N/D", written=kv)
 
     r += 1
     ws.cell(row=r, column=1, value="MÉTRICAS DE INTERFACES").font = Font(bold=True)
     r += 1
-    r = _write_kv(ws, r, "Total de interfaces", str(m.total_ifaces))
-    r = _write_kv(ws, r, "Interfaces ativas", str(m.up_ifaces))
-    r = _write_kv(ws, r, "Interfaces inativas", str(m.down_ifaces))
+    r = _write_kv(ws, r, "Total de interfaces", str(m.total_ifaces), written=kv)
+    r = _write_kv(ws, r, "Interfaces ativas", str(m.up_ifaces), written=kv)
+    r = _write_kv(ws, r, "Interfaces inativas", str(m.down_ifaces), written=kv)
 
     r += 1
     ws.cell(row=r, column=1, value="VLANs DETECTADAS").font = Font(bold=True)
     r += 1
-    vlan_list = ", ".join(sorted(m.vlans, key=lambda x: int(x) if x.isdigit() else x)) if m.vlans else "Nenhuma"
-    r = _write_kv(ws, r, "Total de VLANs", str(len(m.vlans)))
-    _ = _write_kv(ws, r, "Lista de VLANs", vlan_list)
+    vlan_list = ", ".join(sorted(m.vlans, key=_vlan_sort_key)) if m.vlans else "Nenhuma"
+    r = _write_kv(ws, r, "Total de VLANs", str(len(m.vlans)), written=kv)
+    _ = _write_kv(ws, r, "Lista de VLANs", vlan_list, written=kv)
 
+    # Comparacao reaproveita estas métricas sem voltar a ler as células desta folha
+    _EXEC_METRICS.setdefault(wb, {})[ws.title] = (weakref.ref(ws), _metrics_from_kv(ws.title, kv))
     ideia6_autosize_columns(ws)
     _mark_executed("ideia6_write_execution_sheet")
     return ws
 
 
+# Métricas já conhecidas das Execuções escritas por ideia6_write_execution_sheet, por workbook:
+# {wb: {título: (weakref(ws), ExecMetrics)}}. Só valem enquanto wb[título] for a MESMA folha; um
+# workbook (re)aberto do disco não tem entradas e é lido célula a célula como sempre.
+# (weakref para a folha: ws.parent é o próprio wb e uma referência forte nunca o deixaria sair)
+_EXEC_METRICS: weakref.WeakKeyDictionary[Workbook, Dict[str, Tuple[weakref.ref, ExecMetrics]]] = weakref.WeakKeyDictionary()
+
+
+def _kv_value(v: Any) -> str:
+    return str(v) if v is not None else ""
+
+
+def _metrics_from_kv(name: str, kv: Dict[str, str]) -> ExecMetrics:
+    """ExecMetrics de uma folha Execução a partir de {rótulo em minúsculas: valor em texto}."""
+    def getv(lbl: str) -> str:
+        return kv.get(lbl.lower(), "")
+
+    try:
+        total_if = int(getv("Total de interfaces") or "0")
+    except ValueError:
+        total_if = 0
+    try:
+        up_if = int(getv("Interfaces ativas") or "0")
+    except ValueError:
+        up_if = 0
+    try:
+        down_if = int(getv("Interfaces inativas") or "0")
+    except ValueError:
+        down_if = max(0, total_if - up_if)
+
+    host = getv("Hostname")
+    ip = getv("IP")
+    ts = getv("Data/Hora") or name.replace("Execucao_", "").replace("_", " ")
+    ios = getv("Versão IOS")
+    up = getv("Uptime")
+
+    vlan_list = getv("Lista de VLANs")
+    vlans: Set[str] = set()
+    if vlan_list:
+        for tok in vlan_list.split(","):
+            t = tok.strip()
+            if t:
+                vlans.add(t)
+
+    return ExecMetrics(
+        timestamp=ts, label=name, total_ifaces=total_if, up_ifaces=up_if,
+        down_ifaces=down_if, vlans=vlans, ios_version=ios, uptime=up, host=host, ip=ip
+    )
+
+
 def _collect_all_metrics_from_wb(wb: Workbook) -> List[ExecMetrics]:
     out: List[ExecMetrics] = []
+    known = _EXEC_METRICS.get(wb, {})
     for name in wb.sheetnames:
         if not name.lower().startswith("execucao_"):
             continue
         ws = wb[name]
+        hit = known.get(name)
+        if hit is not None and hit[0]() is ws:
+            out.append(hit[1])
+            continue
 
-        def getv(lbl: str) -> str:
-            for r in range(1, ws.max_row + 1):
-                k = ws.cell(row=r, column=1).value
-                v = ws.cell(row=r, column=2).value
-                if isinstance(k, str) and k.strip().lower() == lbl.lower():
-                    return str(v) if v is not None else ""
-            return ""
-
-        try:
-            total_if = int(getv("Total de interfaces") or "0")
-        except ValueError:
-            total_if = 0
-        try:
-            up_if = int(getv("Interfaces ativas") or "0")
-        except ValueError:
-            up_if = 0
-        try:
-            down_if = int(getv("Interfaces inativas") or "0")
-        except ValueError:
-            down_if = max(0, total_if - up_if)
-
-        host = getv("Hostname")
-        ip = getv("IP")
-        ts = getv("Data/Hora") or name.replace("Execucao_", "").replace("_", " ")
-        ios = getv("Versão IOS")
-        up = getv("Uptime")
-
-        vlan_list = getv("Lista de VLANs")
-        vlans: Set[str] = set()
-        if vlan_list:
-            for tok in vlan_list.split(","):
-                t = tok.strip()
-                if t:
-                    vlans.add(t)
-
-        out.append(
-            ExecMetrics(
-                timestamp=ts, label=name, total_ifaces=total_if, up_ifaces=up_if,
-                down_ifaces=down_if, vlans=vlans, ios_version=ios, uptime=up, host=host, ip=ip
-            )
-        )
+        # rótulo (col. A) -> valor (col. B) numa só passagem; rótulo repetido: vale o 1º
+        kv: Dict[str, str] = {}
+        for k, v in ws.iter_rows(min_col=1, max_col=2, values_only=True):
+            if isinstance(k, str):
+                kv.setdefault(k.strip().lower(), _kv_value(v))
+        out.append(_metrics_from_kv(name, kv))
     out.sort(key=lambda m: m.label)
     return out
 
@@ -294,19 +362,11 @@ def ideia6_update_comparison_sheet(wb: Workbook) -> Worksheet:
     headers = [
         "Execução", "Data/Hora", "Total_IF", "Ativas", "Inativas", "#VLANs", "Versão IOS", "Uptime"
     ]
-    for j, h in enumerate(headers, start=1):
-        c = ws.cell(row=1, column=j, value=h)
-        c.font = Font(bold=True)
-
-    for i, m in enumerate(all_m, start=2):
-        ws.cell(row=i, column=1, value=m.label)
-        ws.cell(row=i, column=2, value=m.timestamp)
-        ws.cell(row=i, column=3, value=m.total_ifaces)
-        ws.cell(row=i, column=4, value=m.up_ifaces)
-        ws.cell(row=i, column=5, value=m.down_ifaces)
-        ws.cell(row=i, column=6, value=len(m.vlans))
-        ws.cell(row=i, column=7, value=m.ios_version)
-        ws.cell(row=i, column=8, value=m.uptime)
+    # Folha vazia após o delete_rows: ws.append começa na linha 1 (cabeçalho) e segue pelas execuções
+    append_styled_rows(ws, [headers], font=_FONT_BOLD)
+    for m in all_m:
+        ws.append([m.label, m.timestamp, m.total_ifaces, m.up_ifaces, m.down_ifaces,
+                   len(m.vlans), m.ios_version, m.uptime])
 
     r0 = len(all_m) + 3
     ws.cell(row=r0, column=1, value="DIFERENÇAS (últimas duas execuções)").font = Font(bold=True)
@@ -316,8 +376,8 @@ def ideia6_update_comparison_sheet(wb: Workbook) -> Worksheet:
         dif_up = b.up_ifaces - a.up_ifaces
         dif_down = b.down_ifaces - a.down_ifaces
         dif_vlans = len(b.vlans) - len(a.vlans)
-        novas_vlans = sorted(list(b.vlans - a.vlans), key=lambda x: int(x) if x.isdigit() else x)
-        vlans_removidas = sorted(list(a.vlans - b.vlans), key=lambda x: int(x) if x.isdigit() else x)
+        novas_vlans = sorted(b.vlans - a.vlans, key=_vlan_sort_key)
+        vlans_removidas = sorted(a.vlans - b.vlans, key=_vlan_sort_key)
 
         def fmt_delta(v: int) -> str:
             seta = "↑" if v > 0 else ("↓" if v < 0 else "→")
@@ -340,15 +400,16 @@ def ideia6_update_comparison_sheet(wb: Workbook) -> Worksheet:
 
         start_delta = r0 + 3
         end_delta = start_delta + 3
-        for rr in range(start_delta, end_delta + 1):
-            ws.conditional_formatting.add(
-                f"B{rr}",
-                CellIsRule(operator='containsText', formula=['"+"'], stopIfTrue=False, font=Font(bold=True))
-            )
-            ws.conditional_formatting.add(
-                f"B{rr}",
-                CellIsRule(operator='containsText', formula=['"-"'], stopIfTrue=False, font=Font(bold=True))
-            )
+        # Uma regra por operador sobre o intervalo todo (fórmula constante: igual a uma por célula)
+        delta_range = f"B{start_delta}:B{end_delta}"
+        ws.conditional_formatting.add(
+            delta_range,
+            CellIsRule(operator='containsText', formula=['"+"'], stopIfTrue=False, font=Font(bold=True))
+        )
+        ws.conditional_formatting.add(
+            delta_range,
+            CellIsRule(operator='containsText', formula=['"-"'], stopIfTrue=False, font=Font(bold=True))
+        )
 
     ideia6_autosize_columns(ws)
     _mark_executed("ideia6_update_comparison_sheet")
@@ -374,8 +435,7 @@ def _load_last_two_any(base_dir: str, hostname: str):
     agg = os.path.join(base_dir, f"{hostname}_history.json")
     if os.path.exists(agg):
         try:
-            with open(agg, "r", encoding="utf-8") as f:
-                arr = json.load(f)
+            arr = load_json_file(agg)
             if isinstance(arr, list) and arr:
                 arr_sorted = sorted(arr, key=lambda x: x.get("ts") or x.get("timestamp") or "")
                 if len(arr_sorted) >= 2:
@@ -417,6 +477,8 @@ def _snapshot_to_cmdmap(snap: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
     Converte snapshot guardado (items: cmd/raw/headers/rows) num dicionário:
         { "<cmd lower>": { "parsed": List[Dict[str,str]] } }
     para alimentar os diffs de migração.
+    As linhas só passam a dicts quando _get_parsed consulta o comando (entrada {"item": ...}
+    até lá): os diffs leem meia dúzia de comandos e o snapshot traz todos.
     """
     out: Dict[str, Dict[str, Any]] = {}
     if not snap:
@@ -424,37 +486,63 @@ def _snapshot_to_cmdmap(snap: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
     items = snap.get("items") or []
     for it in items:
         cmd = str(it.get("cmd") or "").strip().lower()
-        headers = [str(h).strip() for h in (it.get("headers") or [])]
-        rows = it.get("rows") or []
-        if headers and rows:
-            low = [h.lower() for h in headers]
-            parsed: List[Dict[str, str]] = []
-            for r in rows:
-                d: Dict[str, str] = {}
-                for i, h in enumerate(low):
-                    if i < len(r):
-                        d[h] = "" if r[i] is None else str(r[i])
-                parsed.append(d)
-            out[cmd] = {"parsed": parsed}
-        else:
-            out[cmd] = {"parsed": []}
+        out[cmd] = {"item": it}
     return out
 
 
+def _item_rows_as_dicts(it: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Linhas de um item do snapshot como dicts {header em minúsculas: valor em texto}."""
+    headers = [str(h).strip() for h in (it.get("headers") or [])]
+    rows = it.get("rows") or []
+    if not (headers and rows):
+        return []
+    low = [h.lower() for h in headers]
+    parsed: List[Dict[str, str]] = []
+    for r in rows:
+        d: Dict[str, str] = {}
+        for i, h in enumerate(low):
+            if i < len(r):
+                d[h] = "" if r[i] is None else str(r[i])
+        parsed.append(d)
+    return parsed
+
+
 def _get_parsed(cmdmap: Dict[str, Dict[str, Any]], key: str) -> List[Dict[str, str]]:
     key = key.lower()
     for k, v in cmdmap.items():
         if key in k:
+            if "parsed" not in v and "item" in v:
+                v["parsed"] = _item_rows_as_dicts(v.pop("item"))  # 1ª consulta: converte e guarda
             return v.get("parsed") or []
     return []
 
 
+# Normaliza abreviações comuns (GigabitEthernet -> Gi, TenGigabitEthernet -> Te, Port-channel -> Po)
+_IFNAME_RE = _re.compile(r"TenGigabitEthernet|GigabitEthernet|FastEthernet|Port-[Cc]hannel|Ethernet")
+_IFNAME_MAP = {
+    "TenGigabitEthernet": "Te", "GigabitEthernet": "Gi", "FastEthernet": "Fa",
+    "Port-channel": "Po", "Port-Channel": "Po", "Ethernet": "Eth",
+}
+
+
+@lru_cache(maxsize=4096)
 def _norm_ifname(s: str) -> str:
-    s = (s or "").strip()
-    # Normaliza abreviações comuns (Gi -> Gi, GigabitEthernet -> Gi, Po -> Po)
-    s = s.replace("GigabitEthernet", "Gi").replace("TenGigabitEthernet", "Te").replace("FastEthernet", "Fa")
-    s = s.replace("Port-channel", "Po").replace("Port-Channel", "Po").replace("Ethernet", "Eth")
-    return s
+    # uma só passagem (os nomes repetem-se muito entre diffs, daí a cache)
+    return _IFNAME_RE.sub(lambda m: _IFNAME_MAP[m.group(0)], (s or "").strip())
+
+
+_IFACE_PREFIX_RE = _re.compile(r"\D*")
+_DIGITS_RE = _re.compile(r"\d+")
+_MEMBERS_SPLIT_RE = _re.compile(r"[;,]")
+
+
+def _iface_sort_key(tok: str) -> Tuple[str, Tuple[int, ...], str]:
+    """Gi1/0/2 antes de Gi1/0/10: prefixo, depois os números por valor; o texto desempata."""
+    return (_IFACE_PREFIX_RE.match(tok).group(), tuple(int(n) for n in _DIGITS_RE.findall(tok)), tok)
+
+
+# Lista só com números/intervalos ASCII sem zeros à esquerda (o normal em 'show interfaces trunk')
+_ALLOWED_SIMPLE_RE = _re.compile(r"(?:0|[1-9][0-9]*)(?:-[0-9]+)?(?:,(?:0|[1-9][0-9]*)(?:-[0-9]+)?)*")
 
 
 def _split_allowed(s: str) -> List[str]:
@@ -465,6 +553,16 @@ def _split_allowed(s: str) -> List[str]:
     s = (s or "").replace(" ", "")
     if not s or s == "none":
         return out
+    if _ALLOWED_SIMPLE_RE.fullmatch(s):
+        # caminho rápido: inteiros num set (p.ex. '1-4094') e texto só no fim, já ordenado
+        nums: Set[int] = set()
+        for p in s.split(","):
+            a, _, b = p.partition("-")
+            if b:
+                nums.update(range(int(a), int(b) + 1))
+            else:
+                nums.add(int(a))
+        return [str(x) for x in sorted(nums)]
     parts = s.split(",")
     for p in parts:
         if "-" in p:
@@ -477,7 +575,7 @@ def _split_allowed(s: str) -> List[str]:
     # remove vazios/duplicados e ordena numericamente quando possível
     out = [x for x in out if x]
     try:
-        out = sorted(set(out), key=lambda x: (0, int(x)) if x.isdigit() else (1, x))
+        out = sorted(set(out), key=_vlan_sort_key)
     except Exception:
         out = sorted(set(out))
     return out
@@ -487,27 +585,51 @@ def diff_vlans(prev_map: Dict[str, Any], curr_map: Dict[str, Any]) -> Dict[str,
     pv = _get_parsed(prev_map, "show vlan brief")
     cv = _get_parsed(curr_map, "show vlan brief")
 
-    def _vlans(lst: List[Dict[str, str]]) -> Set[str]:
-        out: Set[str] = set()
+    def _vlans(lst: List[Dict[str, str]]) -> Set[int]:
+        # IDs como int durante o diff; só passam a texto no resultado
+        out: Set[int] = set()
         for d in lst:
             # tenta 'vlan' ou primeira coluna numérica
             v = d.get("vlan") or d.get("vlan id") or d.get("vlan-id") or d.get("vlanid") or d.get("vlan_id")
-            if not v:
-                # tenta heurística: procurar chave cujo valor é dígito curto
-                for k, val in d.items():
-                    if str(val).strip().isdigit() and int(val) < 4096:
-                        v = str(val).strip()
-                        break
-            if v and str(v).strip().isdigit():
-                out.add(str(v).strip())
+            if v:
+                v = str(v).strip()
+                if v.isdecimal():
+                    out.add(int(v))
+                continue
+            # tenta heurística: primeiro valor que é dígito curto (no TextFSM, VLAN_ID é a 1.ª coluna)
+            for val in d.values():
+                val = str(val).strip()
+                if val.isdecimal() and int(val) < 4096:
+                    out.add(int(val))
+                    break
         return out
 
     a, b = _vlans(pv), _vlans(cv)
-    add = sorted(list(b - a), key=lambda x: int(x) if x.isdigit() else x)
-    rem = sorted(list(a - b), key=lambda x: int(x) if x.isdigit() else x)
+    add = [str(x) for x in sorted(b - a)]
+    rem = [str(x) for x in sorted(a - b)]
     return {"added": add, "removed": rem}
 
 
+def _diff_maps(A: Dict[str, Dict[str, str]], B: Dict[str, Dict[str, str]],
+               key_name: str, fields: Tuple[str, ...]) -> List[Dict[str, str]]:
+    """
+    Linhas {key_name, <campo>_from, <campo>_to} das chaves que mudaram entre A e B
+    (chave em falta = campos vazios), por ordem da chave. Só as alteradas são ordenadas.
+    """
+    default = dict.fromkeys(fields, "")
+    changed = [k for k, a in A.items() if B.get(k, default) != a]
+    changed += [k for k in B.keys() - A.keys() if B[k] != default]
+    out: List[Dict[str, str]] = []
+    for k in sorted(changed):
+        a, b = A.get(k, default), B.get(k, default)
+        row = {key_name: k}
+        for f in fields:
+            row[f + "_from"] = a.get(f, "")
+            row[f + "_to"] = b.get(f, "")
+        out.append(row)
+    return out
+
+
 def diff_interfaces(prev_map: Dict[str, Any], curr_map: Dict[str, Any]) -> List[Dict[str, str]]:
     pa = _get_parsed(prev_map, "show interfaces status")
     pb = _get_parsed(curr_map, "show interfaces status")
@@ -523,21 +645,7 @@ def diff_interfaces(prev_map: Dict[str, Any], curr_map: Dict[str, Any]) -> List[
             m[iface] = {"status": status, "vlan": vlan}
         return m
 
-    A, B = _map(pa), _map(pb)
-    keys = set(A.keys()) | set(B.keys())
-    out: List[Dict[str, str]] = []
-    for k in sorted(keys):
-        a = A.get(k, {"status": "", "vlan": ""})
-        b = B.get(k, {"status": "", "vlan": ""})
-        if a != b:
-            out.append({
-                "interface": k,
-                "status_from": a.get("status", ""),
-                "status_to": b.get("status", ""),
-                "vlan_from": a.get("vlan", ""),
-                "vlan_to": b.get("vlan", ""),
-            })
-    return out
+    return _diff_maps(_map(pa), _map(pb), "interface", ("status", "vlan"))
 
 
 def diff_portchannels(prev_map: Dict[str, Any], curr_map: Dict[str, Any]) -> List[Dict[str, str]]:
@@ -547,8 +655,8 @@ def diff_portchannels(prev_map: Dict[str, Any], curr_map: Dict[str, Any]) -> Lis
     def _norm_members(s: str) -> str:
         # espera algo tipo "[Gi1/0/1, Gi1/0/2]" ou "Gi1/0/1,Gi1/0/2"
         s = (s or "").strip().strip("[]")
-        toks = [_norm_ifname(x) for x in s.replace(";", ",").split(",") if x.strip()]
-        return ", ".join(sorted(set(toks)))
+        toks = [_norm_ifname(x) for x in _MEMBERS_SPLIT_RE.split(s) if x.strip()]
+        return ", ".join(sorted(dict.fromkeys(toks), key=_iface_sort_key))
 
     def _pick(d: dict, *keys) -> str:
         for k in keys:
@@ -578,21 +686,7 @@ def diff_portchannels(prev_map: Dict[str, Any], curr_map: Dict[str, Any]) -> Lis
             m[po] = {"state": state, "members": _norm_members(members_raw)}
         return m
 
-    A, B = _map(pa), _map(pb)
-    keys = set(A.keys()) | set(B.keys())
-    out: List[Dict[str, str]] = []
-    for k in sorted(keys):
-        a = A.get(k, {"state": "", "members": ""})
-        b = B.get(k, {"state": "", "members": ""})
-        if a != b:
-            out.append({
-                "po": k,
-                "state_from": a.get("state", ""),
-                "state_to": b.get("state", ""),
-                "members_from": a.get("members", ""),
-                "members_to": b.get("members", ""),
-            })
-    return out
+    return _diff_maps(_map(pa), _map(pb), "po", ("state", "members"))
 
 
 
@@ -629,31 +723,24 @@ def diff_trunks(prev_map: Dict[str, Any], curr_map: Dict[str, Any]) -> List[Dict
             }
         return m
 
-    A, B = _map(pa), _map(pb)
-    keys = set(A.keys()) | set(B.keys())
-    out: List[Dict[str, str]] = []
-    for k in sorted(keys):
-        a = A.get(k, {"native": "", "allowed": ""})
-        b = B.get(k, {"native": "", "allowed": ""})
-        if a != b:
-            out.append({
-                "interface": k,
-                "native_from": a.get("native", ""),
-                "native_to": b.get("native", ""),
-                "allowed_from": a.get("allowed", ""),
-                "allowed_to": b.get("allowed", ""),
-            })
-    return out
+    return _diff_maps(_map(pa), _map(pb), "interface", ("native", "allowed"))
 
 
 
 from typing import Any, Dict, List, Tuple
 
-def _nk(d: dict) -> dict:
-    """normaliza chaves: lower + troca espaços/hífens por underscore"""
+def _nk(d: dict, rename: Optional[Dict[Any, str]] = None) -> dict:
+    """
+    normaliza chaves: lower + troca espaços/hífens por underscore
+    rename: cache chave->chave normalizada partilhada pelas linhas do mesmo lote
+    """
+    if rename is None:
+        rename = {}
     out = {}
     for k, v in (d or {}).items():
-        nk = str(k).strip().lower().replace(" ", "_").replace("-", "_")
+        nk = rename.get(k)
+        if nk is None:
+            nk = rename[k] = str(k).strip().lower().replace(" ", "_").replace("-", "_")
         out[nk] = v
     return out
 
@@ -667,11 +754,13 @@ def _pick(d: dict, *keys: str) -> str:
 def _neighbor_rows_from_parsed(lst: List[Dict[str, Any]], proto: str) -> List[Dict[str, str]]:
     """
     Converte linhas parsed (CDP/LLDP) num formato uniforme:
-      {neighbor, local_if, neighbor_if, proto}
+      {neighbor, local_if, neighbor_if, proto, _k}
+    _k = (neighbor, neighbor_if) em minúsculas: chave de junção já canónica.
     """
     out: List[Dict[str, str]] = []
+    rename: Dict[Any, str] = {}  # as linhas do mesmo comando partilham as colunas
     for raw in lst or []:
-        d = _nk(raw)
+        d = _nk(raw, rename)
 
         # Nome do vizinho (CDP: device_id; LLDP: system_name)
         neighbor = _pick(
@@ -694,7 +783,8 @@ def _neighbor_rows_from_parsed(lst: List[Dict[str, Any]], proto: str) -> List[Di
             "neighbor": neighbor,
             "local_if": local_if,
             "neighbor_if": neighbor_if,
-            "proto": proto
+            "proto": proto,
+            "_k": (neighbor.lower(), neighbor_if.lower()),
         })
     return out
 
@@ -719,7 +809,7 @@ def _merge_by_neighbor_port(rows: List[Dict[str, str]]) -> Dict[Tuple[str, str],
     """
     merged: Dict[Tuple[str, str], Dict[str, str]] = {}
     for r in rows:
-        k = (r["neighbor"].strip().lower(), r["neighbor_if"].strip().lower())
+        k = r["_k"]
         if k not in merged:
             merged[k] = dict(r)
         else:
@@ -740,28 +830,14 @@ def diff_neighbors(prev_map: Dict[str, Any], curr_map: Dict[str, Any]) -> Dict[s
     prev_rows = _merge_by_neighbor_port(_collect_neighbors(prev_map))
     curr_rows = _merge_by_neighbor_port(_collect_neighbors(curr_map))
 
-    added_keys = sorted(set(curr_rows.keys()) - set(prev_rows.keys()))
-    removed_keys = sorted(set(prev_rows.keys()) - set(curr_rows.keys()))
+    def _rows(src: Dict[Tuple[str, str], Dict[str, str]], keys) -> List[Dict[str, str]]:
+        # ordenado só aqui, para apresentação; keys() - keys() já é um set
+        return [{"neighbor": r.get("neighbor", ""), "local_if": r.get("local_if", ""),
+                 "neighbor_if": r.get("neighbor_if", "")}
+                for r in (src[k] for k in sorted(keys))]
 
-    added = []
-    for k in added_keys:
-        r = curr_rows[k]
-        added.append({
-            "neighbor": r.get("neighbor", ""),
-            "local_if": r.get("local_if", ""),
-            "neighbor_if": r.get("neighbor_if", ""),
-        })
-
-    removed = []
-    for k in removed_keys:
-        r = prev_rows[k]
-        removed.append({
-            "neighbor": r.get("neighbor", ""),
-            "local_if": r.get("local_if", ""),
-            "neighbor_if": r.get("neighbor_if", ""),
-        })
-
-    return {"added": added, "removed": removed}
+    return {"added": _rows(curr_rows, curr_rows.keys() - prev_rows.keys()),
+            "removed": _rows(prev_rows, prev_rows.keys() - curr_rows.keys())}
 
 
 def build_migration_deltas(prev_map: Dict[str, Any], curr_map: Dict[str, Any]) -> Dict[str, Any]:
@@ -779,23 +855,18 @@ def build_migration_deltas(prev_map: Dict[str, Any], curr_map: Dict[str, Any]) -
 # NOVO: Writers de sheets 'Alterações Detalhadas' e 'Checklist Migração'
 # =============================================================================
 
-def _write_table(ws: Worksheet, start_row: int, title: str, headers: List[str], rows: List[List[Any]]) -> int:
-    """Escreve uma pequena tabela (título + cabeçalho + linhas). Devolve a próxima row livre."""
-    ws.cell(row=start_row, column=1, value=title).font = Font(bold=True)
-    r = start_row + 1
-    for j, h in enumerate(headers, start=1):
-        ws.cell(row=r, column=j, value=h).font = Font(bold=True)
+def _write_table(ws: Worksheet, title: str, headers: List[str], rows: List[List[Any]]) -> None:
+    """Acrescenta uma pequena tabela (título + cabeçalho + linhas) no fim da sheet, mais uma linha em branco."""
+    append_styled_rows(ws, [[title], headers], font=_FONT_BOLD)
     for row in rows:
-        r += 1
-        for j, v in enumerate(row, start=1):
-            ws.cell(row=r, column=j, value=v)
-    # largura amigável
-    for col in range(1, len(headers) + 1):
-        try:
-            ws.column_dimensions[ws.cell(row=1, column=col).column_letter].width = 24
-        except Exception:
-            pass
-    return r + 2
+        ws.append(row)
+    ws.append([])
+
+
+def _finalize_widths(ws: Worksheet, max_cols: int, width: float = 24) -> None:
+    """Largura amigável, uma vez por sheet depois de todas as tabelas escritas."""
+    for col in range(1, max_cols + 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
 
 
 def _write_alteracoes_sheet(wb: Workbook, prev_snap: Dict[str, Any], curr_snap: Dict[str, Any]) -> None:
@@ -810,38 +881,38 @@ def _write_alteracoes_sheet(wb: Workbook, prev_snap: Dict[str, Any], curr_snap:
     curr_map = _snapshot_to_cmdmap(curr_snap) if curr_snap else {}
     deltas = build_migration_deltas(prev_map, curr_map)
 
-    r = 1
+    # sheet nova ou esvaziada pelo delete_rows: os ws.append das tabelas começam na linha 1
     # VLANs
     vl = deltas.get("vlans", {})
     rows_vl = [["Adicionada", v] for v in (vl.get("added") or [])] + \
               [["Removida", v] for v in (vl.get("removed") or [])]
     if not rows_vl:
         rows_vl = [["—", "—"]]
-    r = _write_table(ws, r, "VLANs (Δ)", ["Tipo", "VLAN"], rows_vl)
+    _write_table(ws, "VLANs (Δ)", ["Tipo", "VLAN"], rows_vl)
 
     # Interfaces
     ifs = deltas.get("interfaces") or []
     rows_if = [[d.get("interface",""), d.get("status_from",""), d.get("status_to",""), d.get("vlan_from",""), d.get("vlan_to","")] for d in ifs]
     if not rows_if:
         rows_if = [["—","—","—","—","—"]]
-    r = _write_table(ws, r, "Interfaces (estado/VLAN alterados ou desaparecidos/novos)",
-                     ["Interface","Status (de)","Status (para)","VLAN (de)","VLAN (para)"], rows_if)
+    _write_table(ws, "Interfaces (estado/VLAN alterados ou desaparecidos/novos)",
+                 ["Interface","Status (de)","Status (para)","VLAN (de)","VLAN (para)"], rows_if)
 
     # Port-Channels
     pos = deltas.get("portchannels") or []
     rows_po = [[d.get("po",""), d.get("members_from",""), d.get("members_to",""), d.get("state_from",""), d.get("state_to","")] for d in pos]
     if not rows_po:
         rows_po = [["—","—","—","—","—"]]
-    r = _write_table(ws, r, "Port-Channels (membros/estado alterados)",
-                     ["Port-Channel","Membros (de)","Membros (para)","Estado (de)","Estado (para)"], rows_po)
+    _write_table(ws, "Port-Channels (membros/estado alterados)",
+                 ["Port-Channel","Membros (de)","Membros (para)","Estado (de)","Estado (para)"], rows_po)
 
     # Trunks
     trs = deltas.get("trunks") or []
     rows_tr = [[d.get("interface",""), d.get("native_from",""), d.get("native_to",""), d.get("allowed_from",""), d.get("allowed_to","")] for d in trs]
     if not rows_tr:
         rows_tr = [["—","—","—","—","—"]]
-    r = _write_table(ws, r, "Trunks (VLAN nativa/allowed alteradas)",
-                     ["Interface","Native (de)","Native (para)","Allowed (de)","Allowed (para)"], rows_tr)
+    _write_table(ws, "Trunks (VLAN nativa/allowed alteradas)",
+                 ["Interface","Native (de)","Native (para)","Allowed (de)","Allowed (para)"], rows_tr)
 
     # Neighbors
     nbs = deltas.get("neighbors") or {}
@@ -851,10 +922,11 @@ def _write_alteracoes_sheet(wb: Workbook, prev_snap: Dict[str, Any], curr_snap:
         rows_nb_add = [["—","—","—"]]
     if not rows_nb_rem:
         rows_nb_rem = [["—","—","—"]]
-    r = _write_table(ws, r, "Vizinhos ADICIONADOS (CDP/LLDP)",
-                     ["Neighbor","Local If","Neighbor If"], rows_nb_add)
-    _ = _write_table(ws, r, "Vizinhos REMOVIDOS (CDP/LLDP)",
-                     ["Neighbor","Local If","Neighbor If"], rows_nb_rem)
+    _write_table(ws, "Vizinhos ADICIONADOS (CDP/LLDP)",
+                 ["Neighbor","Local If","Neighbor If"], rows_nb_add)
+    _write_table(ws, "Vizinhos REMOVIDOS (CDP/LLDP)",
+                 ["Neighbor","Local If","Neighbor If"], rows_nb_rem)
+    _finalize_widths(ws, ws.max_column)
 
 
 def _write_checklist_sheet(wb: Workbook, prev_metrics: Dict[str, Any], curr_metrics: Dict[str, Any], had_prev: bool) -> None:
@@ -917,15 +989,26 @@ def ideia6_run_pipeline(hostname: str, ts: str, collected, xlsx_path: str, host_
     e agora também 'Alterações Detalhadas' e 'Checklist Migração',
     usando as DUAS últimas execuções guardadas em JSON (multi-ficheiro ou agregado).
     """
-    wb = load_workbook(xlsx_path)
     base_dir = os.path.dirname(xlsx_path)
 
     # Buscar últimos dois snapshots (tolerante a ambos os formatos)
     prev, curr = _load_last_two_any(base_dir, hostname)
     if not curr:
-        wb.save(xlsx_path)
+        # Nada a acrescentar: só lista as sheets (read_only, barato) e apenas reabre
+        # em modo escrita se houver Execuções antigas para limpar.
+        ro = load_workbook(xlsx_path, read_only=True)
+        try:
+            n_exec = len(_list_execucao_sheets(ro))
+        finally:
+            ro.close()
+        if n_exec > 1:
+            wb = load_workbook(xlsx_path)
+            keep_newest_execucao(wb)
+            save_workbook(wb, xlsx_path)
         return
 
+    wb = load_workbook(xlsx_path)
+
     prev_ts = _snap_ts(prev)
     curr_ts = _snap_ts(curr)
     prev_metrics = _snap_metrics(prev)
@@ -999,8 +1082,9 @@ def ideia6_run_pipeline(hostname: str, ts: str, collected, xlsx_path: str, host_
         # Não falhar a execução principal se algo der erro aqui
         pass
 
-    # Guardar
-    wb.save(xlsx_path)
+    # Guardar (só a Execução mais recente, limpa em memória)
+    keep_newest_execucao(wb)
+    save_workbook(wb, xlsx_path)
 
 
 def ideia6_diagnose(run_print: bool = True) -> Dict[str, Union[int, List[str]]]:
@@ -2,9 +2,10 @@ from __future__ import annotations
 import os
 import datetime
 import logging
-from typing import List, Tuple
-from netmiko import ConnectHandler
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
 
+from .fs_utils import ensure_dir
 from .textfsm_utils import detect_ntc_templates_dir, parse_with_textfsm, _dictlist_to_table
 from .parsers import (
     parse_show_interfaces_status,
@@ -31,12 +32,42 @@ COMMANDS_DEFAULT = [
     "show spanning-tree",
 ]
 
+# Fallbacks por comando (a 1ª correspondência ganha): (substrings que têm de estar todas no comando, parser)
+_FALLBACKS = (
+    (("show interfaces status",), parse_show_interfaces_status),
+    (("show vlan brief",), parse_show_vlan_brief),
+    (("show inventory",), parse_show_inventory),
+    (("cdp neighbors detail",), parse_cdp_neighbors_detail),
+    (("show version",), parse_show_version),
+    (("show spanning-tree",), parser_show_spanning_tree_from_text),
+    (("show etherchannel", "summary"), parse_etherchannel_summary_from_text),
+    (("show interfaces trunk",), parse_show_interfaces_trunk),
+)
+
+
+@lru_cache(maxsize=128)
+def _fallback_parser(cmd_lc: str) -> Optional[Callable[[str], Tuple[List[str], List[List[str]]]]]:
+    """Parser de fallback do comando (já em minúsculas), resolvido uma vez por comando; None se não houver."""
+    for needles, fn in _FALLBACKS:
+        if all(n in cmd_lc for n in needles):
+            return fn
+    return None
 
-def collect(host: str, username: str, password: str, port: int = 22, commands: List[str] | None = None):
+
+def collect(host: str, username: str, password: str, port: int = 22, commands: List[str] | None = None,
+            on_command: Optional[Callable[[str, str, str, str], None]] = None, keepalive: int = 0):
     """SSH ao switch e recolha de outputs (raw + parsed) por comando.
 
+    Todos os comandos seguem pela MESMA sessão SSH (1 handshake por switch).
+    'keepalive' (segundos, 0 = desligado) ativa keepalives SSH para que listas
+    longas de comandos não sejam cortadas por idle-timeout.
+
+    Se 'on_command' for dado, é chamado como on_command(hostname, ts, cmd, raw)
+    logo que cada output chega (antes do parsing), p.ex. para gravar o .txt em
+    paralelo com o resto da sessão SSH.
+
     Fluxo de parsing por comando:
-      1) Netmiko `use_textfsm=True`  (mais fiável no teu ambiente)
+      1) TextFSM do Netmiko (`use_textfsm=True`) sobre o output já recebido  (mais fiável no teu ambiente)
       2) CliTable (TextFSM clássico via ntc-templates)
       3) Fallbacks regex (nunca ficas com 'texto bruto')
 
@@ -44,6 +75,8 @@ def collect(host: str, username: str, password: str, port: int = 22, commands: L
         tuple[str, str, list[tuple[str, str, list[str], list[list[str]]]], str]:
             (hostname, timestamp, collected, outdir)
     """
+    from netmiko import ConnectHandler  # import tardio: netmiko/paramiko são pesados
+
     # Garantir NTC templates no ambiente (NET_TEXTFSM definido, etc.)
     detect_ntc_templates_dir()
 
@@ -55,8 +88,51 @@ def collect(host: str, username: str, password: str, port: int = 22, commands: L
         "port": port,
         "fast_cli": True,
     }
+    if keepalive and keepalive > 0:
+        device["keepalive"] = int(keepalive)
     conn = ConnectHandler(**device)
+    try:
+        return _collect_over(conn, host, commands, on_command)
+    finally:
+        conn.disconnect()
+
 
+@lru_cache(maxsize=None)
+def _netmiko_converter() -> Optional[Callable]:
+    """
+    Conversor TextFSM do Netmiko para (out, cmd, platform), resolvido uma vez por processo.
+    None (com um único aviso) se esta versão não expõe nenhum dos helpers: Netmiko 4.0/4.1
+    não tem structured_data_converter e já removeu o get_structured_data.
+    """
+    try:
+        from netmiko.utilities import structured_data_converter  # Netmiko >= 4.2
+    except ImportError:
+        pass
+    else:
+        return lambda out, cmd, platform: structured_data_converter(
+            raw_data=out, command=cmd, platform=platform, use_textfsm=True)
+    try:
+        from netmiko.utilities import get_structured_data  # Netmiko 3.x
+    except ImportError:
+        log.warning("Netmiko sem structured_data_converter/get_structured_data (4.0/4.1?): "
+                    "TextFSM do Netmiko desativado, a usar só CliTable + parsers internos.")
+        return None
+    return lambda out, cmd, platform: get_structured_data(out, platform=platform, command=cmd)
+
+
+def _netmiko_textfsm(conn, cmd: str, out: str):
+    """
+    O mesmo que conn.send_command(cmd, use_textfsm=True) devolveria, mas sobre o 'out'
+    já recebido: sem reenviar o comando pela sessão SSH. None se o Netmiko não o suportar.
+    """
+    convert = _netmiko_converter()
+    if convert is None:
+        return None
+    return convert(out, cmd, getattr(conn, "device_type", "cisco_ios"))
+
+
+def _collect_over(conn, host: str, commands: List[str] | None, on_command):
+    """Corre todos os comandos sobre uma sessão Netmiko já aberta."""
     # "Higiene" de terminal para evitar paginação/wrap que estragam parser
     try:
         conn.send_command("terminal width 511")
@@ -67,21 +143,26 @@ def collect(host: str, username: str, password: str, port: int = 22, commands: L
     hostname = conn.find_prompt().strip("#>") or host
     ts = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     outdir = os.path.abspath(os.path.join(os.getcwd(), "outputs", hostname))
-    os.makedirs(outdir, exist_ok=True)
+    ensure_dir(outdir)
 
     collected: list[tuple[str, str, list[str], list[list[str]]]] = []
 
     for cmd in (commands or COMMANDS_DEFAULT):
         # 0) Executar comando
         out = conn.send_command(cmd, expect_string=r"[#>]", read_timeout=60)
+        if on_command is not None:
+            try:
+                on_command(hostname, ts, cmd, out)
+            except Exception as e:
+                log.warning("on_command falhou para %r: %s", cmd, e)
 
         headers: list[str] = []
         rows: list[list[str]] = []
 
-        # 1) Tentar primeiro Netmiko com use_textfsm=True
+        # 1) Tentar primeiro o TextFSM do Netmiko (use_textfsm), sem 2º envio do comando
         parsed = None
         try:
-            parsed = conn.send_command(cmd, use_textfsm=True)
+            parsed = _netmiko_textfsm(conn, cmd, out)
         except Exception as e:
             log.debug("use_textfsm raised for %r: %s", cmd, e)
 
@@ -108,23 +189,9 @@ def collect(host: str, username: str, password: str, port: int = 22, commands: L
 
         # 3) Fallbacks específicos por comando (garantem tabela)
         if not headers or not rows:
-            cl = cmd.strip().lower()
-            if "show interfaces status" in cl:
-                headers, rows = parse_show_interfaces_status(out)
-            elif "show vlan brief" in cl:
-                headers, rows = parse_show_vlan_brief(out)
-            elif "show inventory" in cl:
-                headers, rows = parse_show_inventory(out)
-            elif "cdp neighbors detail" in cl:
-                headers, rows = parse_cdp_neighbors_detail(out)
-            elif "show version" in cl:
-                headers, rows = parse_show_version(out)
-            elif "show spanning-tree" in cl:
-                headers, rows = parser_show_spanning_tree_from_text(out)
-            elif "show etherchannel" in cl and "summary" in cl:
-                headers, rows = parse_etherchannel_summary_from_text(out)
-            elif "show interfaces trunk" in cl:
-                headers, rows = parse_show_interfaces_trunk(out)
+            fn = _fallback_parser(cmd.strip().lower())
+            if fn is not None:
+                headers, rows = fn(out)
 
             if headers and rows:
                 log.debug("Fallback OK para %r -> %d linhas", cmd, len(rows))
@@ -133,5 +200,4 @@ def collect(host: str, username: str, password: str, port: int = 22, commands: L
 
         collected.append((cmd, out, headers, rows))
 
-    conn.disconnect()
     return hostname, ts, collected, outdir
@@ -2,6 +2,7 @@
 from __future__ import annotations
 import os, re
 from typing import Iterable, Tuple, Any
+from .fs_utils import ensure_dir
 
 CollectedItem = Tuple[str, Any, Any, Any]
 _slug_re = re.compile(r"[^a-z0-9_]+")
@@ -11,17 +12,13 @@ def _slugify(cmd: str) -> str:
     s = _slug_re.sub("_", s)
     return s.strip("_") or "unknown_cmd"
 
-def save_raw_outputs(
+def raw_output_dir(
     hostname: str,
-    collected: Iterable[CollectedItem],
     base_dir: str = "outputs",
     make_timestamp_subdir: bool = False,
     ts: str | None = None,
 ) -> str:
-    """
-    Grava 1 ficheiro .txt por comando, com o *raw* exatamente como veio do switch.
-    Tupla esperada: (cmd, raw, headers, rows) — usa SEMPRE o 2.º elemento ('raw').
-    """
+    """Diretório onde ficam os .txt de um host (criado se não existir)."""
     host = hostname or "unknown"
     # Se base_dir já termina no host, não voltar a juntar
     if os.path.basename(os.path.normpath(base_dir)) == host:
@@ -32,35 +29,69 @@ def save_raw_outputs(
     if make_timestamp_subdir and ts:
         safe_ts = ts.replace(":", "-").replace(" ", "_")
         outdir = os.path.join(outdir, safe_ts)
-    os.makedirs(outdir, exist_ok=True)
+    ensure_dir(outdir)  # chamado por cada comando em streaming: stat só 1x
+    return outdir
 
-    for (cmd, raw, _headers, _rows) in collected:
-        fname = f"{host}_{_slugify(cmd)}.txt"
-        fpath = os.path.join(outdir, fname)
+def _write_raw_file(outdir: str, host: str, cmd: str, raw: Any, ts: str | None) -> None:
+    fname = f"{host}_{_slugify(cmd)}.txt"
+    fpath = os.path.join(outdir, fname)
 
-        header = (
-            f"# Hostname: {host}\n"
-            f"# Comando: {cmd}\n"
-            f"# Timestamp: {ts}\n"
-            f"# ---\n"
-        )   
+    header = (
+        f"# Hostname: {host}\n"
+        f"# Comando: {cmd}\n"
+        f"# Timestamp: {ts}\n"
+        f"# ---\n"
+    )   
 
-        if isinstance(raw, (bytes, bytearray)):
-            # se raw for bytes, prepend também o header em utf-8
-            with open(fpath, "wb") as f:
-                f.write(header.encode("utf-8"))
-                f.write(raw)
-        elif isinstance(raw, str):
-            with open(fpath, "w", encoding="utf-8", newline="") as f:
-                f.write(header)
-                f.write(raw)
-        elif isinstance(raw, (list, tuple)):
-            with open(fpath, "w", encoding="utf-8", newline="") as f:
-                f.write(header)
-                f.write("\n".join(str(x) for x in raw))
-        else:
-            with open(fpath, "w", encoding="utf-8", newline="") as f:
-                f.write(header)
-                f.write("" if raw is None else str(raw))
+    if isinstance(raw, (bytes, bytearray)):
+        # se raw for bytes, prepend também o header em utf-8
+        with open(fpath, "wb") as f:
+            f.write(header.encode("utf-8"))
+            f.write(raw)
+    elif isinstance(raw, str):
+        with open(fpath, "w", encoding="utf-8", newline="") as f:
+            f.write(header)
+            f.write(raw)
+    elif isinstance(raw, (list, tuple)):
+        with open(fpath, "w", encoding="utf-8", newline="") as f:
+            f.write(header)
+            f.write("\n".join(str(x) for x in raw))
+    else:
+        with open(fpath, "w", encoding="utf-8", newline="") as f:
+            f.write(header)
+            f.write("" if raw is None else str(raw))
+
+def save_raw_output(
+    hostname: str,
+    cmd: str,
+    raw: Any,
+    base_dir: str = "outputs",
+    make_timestamp_subdir: bool = False,
+    ts: str | None = None,
+) -> str:
+    """
+    Grava o .txt de UM comando (usado em streaming, à medida que o SSH devolve
+    cada output). Mesmo formato/caminho que save_raw_outputs. Devolve o diretório.
+    """
+    outdir = raw_output_dir(hostname, base_dir, make_timestamp_subdir, ts)
+    _write_raw_file(outdir, hostname or "unknown", cmd, raw, ts)
+    return outdir
+
+def save_raw_outputs(
+    hostname: str,
+    collected: Iterable[CollectedItem],
+    base_dir: str = "outputs",
+    make_timestamp_subdir: bool = False,
+    ts: str | None = None,
+) -> str:
+    """
+    Grava 1 ficheiro .txt por comando, com o *raw* exatamente como veio do switch.
+    Tupla esperada: (cmd, raw, headers, rows) — usa SEMPRE o 2.º elemento ('raw').
+    """
+    host = hostname or "unknown"
+    outdir = raw_output_dir(host, base_dir, make_timestamp_subdir, ts)
+
+    for (cmd, raw, _headers, _rows) in collected:
+        _write_raw_file(outdir, host, cmd, raw, ts)
 
     return outdir
@@ -0,0 +1,56 @@
+
+import sys
+
+import clean_switch.cli as cli
+import clean_switch.excel_pipeline as excel_pipeline
+import ideia6_features
+
+
+def _run(monkeypatch, tmp_path, raw, *extra):
+    collected = [("show version", raw, [], [])]
+    monkeypatch.setattr(cli, "collect", lambda *a, **kw: ("SW1", "2026-10-15_10-00-00", collected, str(tmp_path)))
+    monkeypatch.setattr(sys, "argv", ["cli", "--host", "10.0.0.1", "--user", "u", "--password", "p",
+                                      "--out", str(tmp_path / "out"), "--raw-dir", str(tmp_path / "raw"), *extra])
+    cli.main()
+
+
+def test_no_excel_then_normal_rebuilds_stale_workbook(monkeypatch, tmp_path, capsys):
+    built = []
+
+    def fake_create_excel(host, ts, collected, xlsx_path):
+        with open(xlsx_path, "w") as f:
+            f.write(collected[0][1])
+        built.append(collected[0][1])
+
+    monkeypatch.setattr(excel_pipeline, "create_excel", fake_create_excel)
+    monkeypatch.setattr(ideia6_features, "ideia6_run_pipeline", lambda *a, **kw: None)
+
+    _run(monkeypatch, tmp_path, "Version A")
+    _run(monkeypatch, tmp_path, "Version B", "--no-excel")
+    capsys.readouterr()
+    _run(monkeypatch, tmp_path, "Version B")
+    assert built == ["Version A", "Version B"]
+    assert "unchanged" not in capsys.readouterr().out
+
+    _run(monkeypatch, tmp_path, "Version B")
+    assert built == ["Version A", "Version B"]
+    assert "OK (unchanged)" in capsys.readouterr().out
+
+
+def test_failed_ideia6_does_not_mark_workbook_up_to_date(monkeypatch, tmp_path):
+    built = []
+
+    def fake_create_excel(host, ts, collected, xlsx_path):
+        open(xlsx_path, "w").close()
+        built.append(xlsx_path)
+
+    monkeypatch.setattr(excel_pipeline, "create_excel", fake_create_excel)
+
+    def boom(*a, **kw):
+        raise PermissionError("xlsx aberto no Excel")
+
+    monkeypatch.setattr(ideia6_features, "ideia6_run_pipeline", boom)
+    _run(monkeypatch, tmp_path, "Version A")
+    monkeypatch.setattr(ideia6_features, "ideia6_run_pipeline", lambda *a, **kw: None)
+    _run(monkeypatch, tmp_path, "Version A")
+    assert len(built) == 2
@@ -0,0 +1,33 @@
+
+import clean_switch.excel_pipeline as excel_pipeline
+import clean_switch.topology_crawl as topology_crawl
+import ideia6_features
+
+
+def test_emit_host_outputs_skips_unchanged_and_retries_failed_excel(monkeypatch, tmp_path):
+    built = []
+
+    def fake_create_excel(host, ts, collected, xlsx_path):
+        open(xlsx_path, "w").close()
+        built.append(collected[0][1])
+
+    def boom(*a, **kw):
+        raise PermissionError("xlsx aberto no Excel")
+
+    monkeypatch.setattr(excel_pipeline, "create_excel", fake_create_excel)
+    monkeypatch.setattr(ideia6_features, "ideia6_run_pipeline", boom)
+    outdir = str(tmp_path)
+    xlsx_path = str(tmp_path / "SW1_levantamento.xlsx")
+
+    def emit(raw):
+        collected = [("show version", raw, ["Version"], [["15.2"]])]
+        return topology_crawl._emit_host_outputs("10.0.0.1", "SW1", "2026-10-15_10-00-00",
+                                                 collected, outdir, xlsx_path, None)
+
+    assert emit("Version A")
+    monkeypatch.setattr(ideia6_features, "ideia6_run_pipeline", lambda *a, **kw: None)
+    assert emit("Version A")
+    assert emit("Version A")
+    assert built == ["Version A", "Version A"]
+    assert emit("Version B")
+    assert built == ["Version A", "Version A", "Version B"]
@@ -1,15 +1,18 @@
 # clean_switch/topology_crawl.py
 from __future__ import annotations
-import logging, os, socket
+import logging, multiprocessing, os, socket, threading, time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Deque, Dict, List, Optional, Set, Tuple
 from ipaddress import ip_address, ip_network
 
 from .network_connector import collect  # SSH + recolha + parsing + outputs dir
-from .excel_pipeline import create_excel, metrics_from_collected
-from history_json import save_snapshot
-from ideia6_features import ideia6_run_pipeline
+from .excel_pipeline import build_excel, metrics_from_collected
+from history_json import save_snapshot, collected_digest, write_latest_hash, outputs_unchanged
 from .raw_outputs import save_raw_outputs
+from .logging_config import setup_logging
+from .fs_utils import ensure_dir
 
 
 log = logging.getLogger("clean_switch.crawl")
@@ -37,20 +40,33 @@ class Neighbor:
 def _norm(s) -> str:
     return (str(s) if s is not None else "").strip()
 
-def _in_allowed_subnets(ip: str, allowed: Optional[List[str]]) -> bool:
+def _compile_subnets(allowed) -> Optional[List]:
+    """
+    Converte a allowlist (strings CIDR e/ou objetos ip_network) em redes já
+    construídas, uma única vez, ordenadas da mais larga para a mais estreita
+    (sai mais cedo no teste de pertença). CIDRs inválidos são ignorados.
+    None/[] = sem restrição.
+    """
     if not allowed:
+        return None
+    nets = []
+    for cidr in allowed:
+        try:
+            nets.append(cidr if hasattr(cidr, "prefixlen") else ip_network(str(cidr).strip(), strict=False))
+        except Exception:
+            log.warning("CIDR inválido em allowed_subnets ignorado: %r", cidr)
+    nets.sort(key=lambda n: n.prefixlen)
+    return nets
+
+def _in_allowed_subnets(ip: str, nets: Optional[List]) -> bool:
+    """'nets' vem de _compile_subnets (None = tudo permitido)."""
+    if nets is None:
         return True
     try:
         ipx = ip_address(ip)
     except Exception:
         return False
-    for cidr in allowed:
-        try:
-            if ipx in ip_network(cidr, strict=False):
-                return True
-        except Exception:
-            continue
-    return False
+    return any(ipx in n for n in nets)
 
 def _resolve_dns(name: str) -> Optional[str]:
     try:
@@ -169,24 +185,145 @@ def _extract_neighbors_from_collected(collected) -> List[Neighbor]:
     # 2) LLDP fallback
     return collect_from("lldp neighbors detail")
 
-def _cleanup_execucao_keep_newest(xlsx_path: str) -> None:
+def _resolve_neighbor_ips(
+    host: str,
+    collected,
+    depth: int,
+    allowed_subnets: Optional[List],
+    dns_fallback: bool,
+    hostmap: Dict[str, str],
+) -> List[str]:
     """
-    Mantém apenas a sheet Execução mais recente (mesma lógica do CLI).
+    Descobre os IPs de gestão dos vizinhos (CDP/LLDP → DNS → hostmap) já filtrados
+    pelas sub-redes permitidas. Corre dentro do worker (o DNS também bloqueia).
     """
-    try:
-        from openpyxl import load_workbook
-        from .excel_utils import _list_execucao_sheets
-        wb = load_workbook(xlsx_path)
-        execs = _list_execucao_sheets(wb)
-        if execs:
-            execs_sorted = sorted(execs, key=lambda t: (t[3] is None, t[3], t[2]))
-            newest = execs_sorted[-1][0]
-            for ws, _name, _idx, _dt in execs:
-                if ws is not newest:
-                    wb.remove(ws)
-            wb.save(xlsx_path)
-    except Exception as e:
-        log.error("Falhou limpeza de sheets Execução (%s): %s", xlsx_path, e)
+    out: List[str] = []
+    neighs = _extract_neighbors_from_collected(collected)
+    log.info("[Crawl] %s: encontrados %d vizinhos", host, len(neighs))
+    for n in neighs:
+        nip = (n.mgmt_ip or "").strip()
+        source = "CDP/LLDP"
+        if not nip and dns_fallback and n.device_id:
+            resolved = _resolve_dns(n.device_id)
+            if resolved:
+                nip, source = resolved, f"DNS({n.device_id})"
+        if n.device_id in hostmap:
+            nip, source = hostmap[n.device_id], "HOSTMAP"
+        if not nip:
+            log.info("[Crawl]   - %s: sem IP de gestão -> ignorado", (n.device_id or "(sem nome)"))
+            continue
+        if not _in_allowed_subnets(nip, allowed_subnets):
+            log.info("[Crawl]   - %s: IP %s fora das sub-redes permitidas -> ignorado", n.device_id, nip)
+            continue
+        log.info("[Crawl]   - %s: IP %s via %s -> enfileirado (depth %d)", n.device_id or "(sem nome)", nip, source, depth+1)
+        out.append(nip)
+    return out
+
+class _TokenBucket:
+    """
+    Limitador de logins SSH (token bucket): 'rate' tokens/s, até 'burst' acumulados.
+    Sem thread de reabastecimento: os tokens são calculados pelo relógio monotónico
+    em cada acquire(). Thread-safe.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited = 0.0
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    self.acquired += 1
+                    return
+                delay = (1.0 - self._tokens) / self.rate
+                self.waited += delay
+            time.sleep(delay)
+
+def _process_host(
+    ip: str,
+    depth: int,
+    username: str,
+    password: str,
+    port: int,
+    max_depth: int,
+    allowed_subnets: Optional[List],
+    dns_fallback: bool,
+    hostmap: Dict[str, str],
+    bucket: Optional[_TokenBucket] = None,
+    keepalive: int = 0,
+):
+    """
+    Trabalho de um worker do pool: SSH + recolha/parsing + vizinhos.
+    Não toca em Excel/JSON — isso fica no thread coordenador.
+
+    Returns:
+        (host, ts, collected, outdir, neighbor_ips)
+    """
+    if bucket is not None:
+        bucket.acquire()  # 1 token por login SSH
+    host, ts, collected, outdir = collect(ip, username, password, port=port, commands=None, keepalive=keepalive)
+    neighbor_ips: List[str] = []
+    if depth < max_depth:
+        neighbor_ips = _resolve_neighbor_ips(host, collected, depth, allowed_subnets, dns_fallback, hostmap)
+    return host, ts, collected, outdir, neighbor_ips
+
+def _emit_host_outputs(ip: str, host: str, ts: str, collected, outdir: str, xlsx_path: str,
+                       out_dir_override: Optional[str], snapshot_fmt: str = "json") -> bool:
+    """
+    Snapshot JSON (com métricas) + .txt + Excel + Ideia6 para um host já recolhido; snapshot e
+    Excel só são regravados se o digest mudou (ver history_json.outputs_unchanged). Devolve False (só .txt gravados) se nenhum comando devolveu output útil.
+    """
+    metrics = metrics_from_collected(collected)
+    base_dir_txt = out_dir_override if out_dir_override else outdir
+    if not collected or metrics.get("commands_ok", 0) == 0:
+        save_raw_outputs(hostname=host, collected=collected, base_dir=base_dir_txt,
+                         make_timestamp_subdir=False, ts=ts)
+        log.warning("[Crawl] %s (%s): nenhum comando devolveu output útil — só .txt, sem snapshot/Excel.", host, ip)
+        return False
+
+    # mesmo gate de digest que o cli: snapshot e xlsx só são regravados se estiverem desatualizados
+    digest = collected_digest(collected)
+    snapshot_unchanged, excel_unchanged = outputs_unchanged(outdir, host, xlsx_path, digest)
+    if not snapshot_unchanged:
+        save_snapshot(
+            base_dir=outdir,
+            hostname=host,
+            ts=ts,
+            collected=collected,
+            meta={"host_ip": ip, "metrics": metrics},
+            max_keep=10,
+            fmt=snapshot_fmt,
+        )
+        write_latest_hash(outdir, host, digest)
+
+    # gravar .txt com texto bruto e cabeçalho para ESTE host ---
+    save_raw_outputs(
+        hostname=host,
+        collected=collected,
+        base_dir=base_dir_txt,
+        make_timestamp_subdir=False,
+        ts=ts,
+    )
+
+    if excel_unchanged:
+        log.info("[Crawl] %s (%s): sem alterações desde a última recolha — Excel mantido.", host, ip)
+    else:
+        build_excel(host, ts, collected, xlsx_path, digest, host_ip=ip)
+    return True
+
+def _init_emit_worker(level: int) -> None:
+    """Logging nos processos de emissão (com 'spawn' não é herdado do pai)."""
+    setup_logging(level)
 
 # --------------------------------------------------------------------------------------
 # API principal
@@ -199,105 +336,148 @@ def crawl_topology(
     enable: Optional[str] = None,
     port: int = 22,
     max_depth: int = 1,
-    allowed_subnets: Optional[List[str]] = None,
+    allowed_subnets: Optional[List] = None,
     dns_fallback: bool = True,
     hostmap: Optional[Dict[str, str]] = None,
     out_dir_override: Optional[str] = None,
+    workers: int = 16,
+    rate_pps: float = 5.0,
+    keepalive: int = 0,
+    snapshot_fmt: str = "json",
 ) -> List[Tuple[str, str]]:
     """
     Explora a topologia por camadas (BFS) a partir de 'seed_ip', gerando 1 Excel por switch.
+    'allowed_subnets' aceita strings CIDR ou objetos ipaddress.ip_network.
+
+    As sessões SSH (recolha + descoberta de vizinhos) correm em paralelo num
+    ThreadPoolExecutor com 'workers' threads; o thread que chama esta função é o
+    único que mexe no estado do BFS, por isso não há locks.
+    A emissão (JSON/.txt/Excel/Ideia6, CPU-bound por causa do openpyxl) vai para um
+    ProcessPoolExecutor (1 processo por core) — só o 'collected' (strings) é enviado.
+    Com workers=1 tudo corre em série, no próprio processo.
+    'rate_pps' limita os logins SSH por segundo (token bucket; <=0 = sem limite),
+    para não esgotar VTYs nem disparar limites de AAA/TACACS.
+    Cada switch usa uma única sessão SSH (com 'keepalive' opcional) para todos os
+    comandos, incluindo o CDP/LLDP usado na descoberta de vizinhos.
+    'snapshot_fmt' ("json"/"msgpack") é passado a save_snapshot(fmt=...).
 
     Returns:
         Lista [(hostname, xlsx_path)] para todos os switches processados.
     """
     hostmap = hostmap or {}
+    workers = max(1, int(workers or 1))
+    allowed_subnets = _compile_subnets(allowed_subnets)
     results: List[Tuple[str, str]] = []
     visited_keys: Set[str] = set()   # anti-loop por Serial/DeviceKey
     seen_ips: Set[str] = set()       # evita re-enfileirar o mesmo IP
-    queue: List[Tuple[str, int]] = [(seed_ip, 0)]
+    queue: Deque[Tuple[str, int]] = deque([(seed_ip, 0)])  # FIFO (BFS)
+    ips_dup = 0                      # IPs re-descobertos (já vistos) — para o resumo final
+    running: Dict[Future, Tuple[str, int]] = {}
+    bucket = _TokenBucket(rate_pps) if rate_pps and rate_pps > 0 else None
+    if out_dir_override:
+        ensure_dir(out_dir_override)
+
+    # Emissão em processos separados; 'spawn' porque há threads SSH vivas (fork + threads = deadlocks)
+    emit_pool: Optional[ProcessPoolExecutor] = None
+    if workers > 1:
+        emit_pool = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_emit_worker,
+            initargs=(logging.getLogger().getEffectiveLevel(),),
+        )
+    emissions: List[Tuple[Future, str, str]] = []   # (future, host, xlsx_path) por ordem de submissão
+    emitting: Dict[str, Future] = {}                # xlsx_path -> última emissão (mesmo ficheiro = em série)
 
-    while queue:
-        ip, depth = queue.pop(0)
-        if ip in seen_ips:
-            continue
-        seen_ips.add(ip)
-
-        if not _in_allowed_subnets(ip, allowed_subnets):
-            log.info("Ignorar %s (fora das sub-redes permitidas)", ip)
-            continue
-
-        log.info("[Crawl] A ligar a %s (depth=%d)...", ip, depth)
-        try:
-            # 1) Recolha “normal” (gera também pasta de outputs)
-            host, ts, collected, outdir = collect(ip, username, password, port=port, commands=None)
-            if out_dir_override:
-                outdir = out_dir_override
-                os.makedirs(outdir, exist_ok=True)
-            xlsx_path = os.path.join(outdir, f"{host}_levantamento.xlsx")
-
-            # 2) Anti-loop (serial/inventory)
-            key = _extract_device_key_from_collected(collected)
-            key_id = key.best()
-            if key_id in visited_keys:
-                log.info("Já visitado (serial=%s) em %s — a saltar geração de Excel.", key_id, ip)
-            else:
-                visited_keys.add(key_id)
-
-                # 3) Snapshot JSON (com métricas) + Excel + Ideia6
-                metrics = metrics_from_collected(collected)
-                save_snapshot(
-                    base_dir=outdir,
-                    hostname=host,
-                    ts=ts,
-                    collected=collected,
-                    meta={"host_ip": ip, "metrics": metrics},
-                    max_keep=10
-                )
-
-                # gravar .txt com texto bruto e cabeçalho para ESTE host ---
-                base_dir_txt = out_dir_override if out_dir_override else outdir
-                save_raw_outputs(
-                    hostname=host,
-                    collected=collected,
-                    base_dir=base_dir_txt,
-                    make_timestamp_subdir=False,
-                    ts=ts,
-                )
-
-                create_excel(host, ts, collected, xlsx_path)
-                try:
-                    ideia6_run_pipeline(host, ts, collected, xlsx_path, host_ip=ip)
-                except Exception as e:
-                    log.error("Ideia6 pipeline falhou para %s: %s", host, e)
-                _cleanup_execucao_keep_newest(xlsx_path)
-
-                results.append((host, xlsx_path))
-                log.info("✓ Excel gerado: %s", xlsx_path)
-
-            # 4) Descobrir vizinhos e enfileirar (se ainda dentro da profundidade)
-            if depth < max_depth:
-                neighs = _extract_neighbors_from_collected(collected)
-                log.info("[Crawl] %s: encontrados %d vizinhos", host, len(neighs))
-                for n in neighs:
-                    nip = (n.mgmt_ip or "").strip()
-                    source = "CDP/LLDP"
-                    if not nip and dns_fallback and n.device_id:
-                        resolved = _resolve_dns(n.device_id)
-                        if resolved:
-                            nip, source = resolved, f"DNS({n.device_id})"
-                    if n.device_id in hostmap:
-                        nip, source = hostmap[n.device_id], "HOSTMAP"
-                    if not nip:
-                        log.info("[Crawl]   - %s: sem IP de gestão -> ignorado", (n.device_id or "(sem nome)"))
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crawl") as pool:
+            while queue or running:
+                # 1) Despachar enquanto houver workers livres
+                while queue and len(running) < workers:
+                    ip, depth = queue.popleft()
+                    if ip in seen_ips:
+                        ips_dup += 1
                         continue
-                    if not _in_allowed_subnets(nip, allowed_subnets):
-                        log.info("[Crawl]   - %s: IP %s fora das sub-redes permitidas -> ignorado", n.device_id, nip)
+                    seen_ips.add(ip)
+
+                    if not _in_allowed_subnets(ip, allowed_subnets):
+                        log.info("Ignorar %s (fora das sub-redes permitidas)", ip)
                         continue
-                    log.info("[Crawl]   - %s: IP %s via %s -> enfileirado (depth %d)", n.device_id or "(sem nome)", nip, source, depth+1)
-                    if nip not in seen_ips:
-                        queue.append((nip, depth + 1))
 
-        except Exception as e:
-            log.error("[Crawl] Falha em %s: %s", ip, e)
+                    log.info("[Crawl] A ligar a %s (depth=%d)...", ip, depth)
+                    fut = pool.submit(
+                        _process_host, ip, depth, username, password, port,
+                        max_depth, allowed_subnets, dns_fallback, hostmap, bucket, keepalive,
+                    )
+                    running[fut] = (ip, depth)
+
+                if not running:
+                    continue
+
+                # 2) Drenar o que terminar
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    ip, depth = running.pop(fut)
+                    try:
+                        host, ts, collected, outdir, neighbor_ips = fut.result()
+                    except Exception as e:
+                        log.error("[Crawl] Falha em %s: %s", ip, e)
+                        continue
 
+                    # Enfileirar vizinhos já, para o pool não ficar parado durante o Excel
+                    for nip in neighbor_ips:
+                        if nip in seen_ips:
+                            ips_dup += 1
+                        else:
+                            queue.append((nip, depth + 1))
+
+                    try:
+                        if out_dir_override:
+                            outdir = out_dir_override  # já criado uma vez, antes do loop
+                        xlsx_path = os.path.join(outdir, f"{host}_levantamento.xlsx")
+
+                        # Anti-loop (serial/inventory)
+                        key = _extract_device_key_from_collected(collected)
+                        key_id = key.best()
+                        if key_id in visited_keys:
+                            log.info("Já visitado (serial=%s) em %s — a saltar geração de Excel.", key_id, ip)
+                            continue
+                        visited_keys.add(key_id)
+
+                        if emit_pool is None:
+                            if _emit_host_outputs(ip, host, ts, collected, outdir, xlsx_path, out_dir_override, snapshot_fmt):
+                                results.append((host, xlsx_path))
+                                log.info("✓ Excel gerado: %s", xlsx_path)
+                        else:
+                            prev = emitting.get(xlsx_path)
+                            if prev is not None:
+                                wait([prev])  # raro (hostname repetido): não escrever o mesmo xlsx em paralelo
+                            efut = emit_pool.submit(
+                                _emit_host_outputs, ip, host, ts, collected, outdir, xlsx_path, out_dir_override, snapshot_fmt,
+                            )
+                            emitting[xlsx_path] = efut
+                            emissions.append((efut, host, xlsx_path))
+                    except Exception as e:
+                        log.error("[Crawl] Falha em %s: %s", ip, e)
+
+        # 3) Esperar pelas emissões em curso
+        for efut, host, xlsx_path in emissions:
+            try:
+                if not efut.result():
+                    continue
+            except Exception as e:
+                log.error("[Crawl] Falha a gerar Excel de %s: %s", host, e)
+                continue
+            results.append((host, xlsx_path))
+            log.info("✓ Excel gerado: %s", xlsx_path)
+    finally:
+        if emit_pool is not None:
+            emit_pool.shutdown(wait=True)
+
+    ips_found = len(seen_ips) + ips_dup
+    log.info("[Crawl] dedup: %d de %d IPs descobertos já tinham sido vistos (%.0f%%)",
+             ips_dup, ips_found, 100.0 * ips_dup / ips_found if ips_found else 0.0)
+    if bucket is not None:
+        log.info("[Crawl] %d logins SSH (limite %.1f/s; espera total no limitador %.1fs)",
+                 bucket.acquired, bucket.rate, bucket.waited)
     return results